@@ -0,0 +1,109 @@
+"""
+Cache SQLite des générations de test_model.py
+
+Clé = modèle base + backend et précision (ex. "cpu-int8", "cuda-nf4-bfloat16")
++ hash du LoRA + prompt complet (chat template appliqué) + paramètres de génération + seed + mode (séquentiel ou taille de lot : le padding
+d'un lot change les logits, donc la réponse). Une question déjà générée dans les
+mêmes conditions n'est pas régénérée. Une génération échantillonnée sans seed n'est
+pas reproductible : elle n'est jamais mise en cache (voir is_cacheable). Taille
+bornée : au-delà de `max_bytes`, les entrées les moins récemment utilisées sont
+supprimées.
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+DEFAULT_CACHE_PATH = "./models/generation_cache.sqlite"
+DEFAULT_MAX_BYTES = 64 * 1024**2
+KEY_VERSION = 2  # à incrémenter si le contenu de la clé change : les anciennes entrées sont ignorées
+
+
+def is_cacheable(generation_kwargs: Dict, seed: Optional[int]) -> bool:
+    """Greedy, ou échantillonnage avec seed fixée : la même clé redonne la même réponse"""
+    return not generation_kwargs.get("do_sample") or seed is not None
+
+
+class GenerationCache:
+    def __init__(self, path: str, model_id: str, adapter: str, backend: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.model_id = model_id
+        self.adapter = adapter
+        self.backend = backend
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS generations ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON generations(last_access)")
+        self._conn.commit()
+
+    def key(self, prompt: str, generation_kwargs: Dict, seed: Optional[int], batch_size: Optional[int] = None) -> str:
+        """batch_size: taille des lots de test_schema_batch, None en mode séquentiel"""
+        payload = json.dumps(
+            {
+                "version": KEY_VERSION,
+                "model": self.model_id,
+                "backend": self.backend,
+                "adapter": self.adapter,
+                "prompt": prompt,
+                "generation": generation_kwargs,
+                "seed": seed,
+                "batch": batch_size or "sequential",
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        row = self._conn.execute("SELECT value FROM generations WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._conn.execute("UPDATE generations SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Dict):
+        data = json.dumps(value, ensure_ascii=False)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO generations (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+            (key, data, len(data.encode("utf-8")), time.time()),
+        )
+        self._evict()
+        self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM generations").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM generations ORDER BY last_access ASC").fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM generations WHERE key = ?", stale)
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else None
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,23 @@
+"""
+Statistiques de latence partagées par test_model.py et load_test.py
+
+Module sans dépendance : le client de charge n'a pas à importer torch/transformers.
+"""
+
+from typing import List, Optional
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Percentile par interpolation linéaire (comme numpy.percentile)"""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    rank = (len(values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def mean(values: List[float]) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else None
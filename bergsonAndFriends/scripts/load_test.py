@@ -0,0 +1,173 @@
+"""
+Benchmark de charge pour serve_model.py
+
+Envoie des requêtes /chat en streaming à niveau de concurrence croissant et mesure,
+pour chaque niveau : débit (requêtes/s, chunks SSE/s), latence totale et TTFT
+(p50/p95/p99), sur les seules requêtes réussies, et le taux d'erreur. Une requête
+échoue si le serveur répond une erreur HTTP (500 d'un lot en échec), si la connexion
+tombe, ou si le flux contient un événement `error`. Les prompts sont tirés d'un dataset JSONL (messages jusqu'au dernier
+tour utilisateur). Un chunk SSE est un delta de texte du serveur : en général un
+token, parfois plusieurs (caractère UTF-8 incomplet retenu).
+
+Chaque niveau a son pool de `concurrency` threads : le pool par défaut d'asyncio
+(min(32, cœurs + 4) threads) plafonnerait les niveaux plus élevés.
+
+Usage :
+    python scripts/serve_model.py --port 8000 &
+    python scripts/load_test.py --url http://127.0.0.1:8000 --concurrency 1 2 4 8 16
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import random
+import time
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from latency_stats import percentile
+
+DEFAULT_DATASET = "data/FT/correction_dataset.jsonl"
+
+
+def load_prompts(path: Path, limit: int = 200) -> List[List[Dict[str, str]]]:
+    """Conversations du dataset tronquées au dernier message utilisateur"""
+    prompts = []
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            messages = json.loads(line)["messages"]
+            last_user = max((i for i, m in enumerate(messages) if m["role"] == "user"), default=None)
+            if last_user is None:
+                continue
+            prompts.append(messages[: last_user + 1])
+            if len(prompts) >= limit:
+                break
+    return prompts
+
+
+def chat_request(url: str, messages: List[Dict[str, str]], max_new_tokens: int) -> Dict:
+    """
+    Une requête SSE bloquante ; renvoie latence, TTFT, nombre de chunks SSE reçus et
+    l'erreur éventuelle (None si la requête a réussi)
+    """
+    body = json.dumps({"messages": messages, "max_new_tokens": max_new_tokens, "stream": True}).encode("utf-8")
+    request = urllib.request.Request(f"{url}/chat", data=body, headers={"Content-Type": "application/json"})
+
+    start = time.perf_counter()
+    ttft = None
+    chunks = 0
+    error = None
+    try:
+        with urllib.request.urlopen(request) as response:
+            for raw in response:
+                line = raw.decode("utf-8").strip()
+                if not line.startswith("data: "):
+                    continue
+                if line == "data: [DONE]":
+                    break
+                event = json.loads(line[len("data: "):])
+                if "error" in event:
+                    error = event["error"]
+                    break
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                chunks += 1
+            else:
+                error = "flux interrompu avant [DONE]"
+    except (OSError, http.client.HTTPException) as exc:
+        # HTTPError (500 avant le premier chunk) et URLError sont des OSError
+        error = f"{type(exc).__name__}: {exc}"
+    latency = time.perf_counter() - start
+    return {"latency": latency, "ttft": ttft if ttft is not None else latency, "chunks": chunks, "error": error}
+
+
+async def run_level(url: str, prompts: List, concurrency: int, requests: int, max_new_tokens: int) -> Dict:
+    """Lance `requests` requêtes avec au plus `concurrency` en vol"""
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        async def one(messages):
+            async with semaphore:
+                return await loop.run_in_executor(executor, chat_request, url, messages, max_new_tokens)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(random.choice(prompts)) for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    succeeded = [r for r in results if r["error"] is None]
+    errors = Counter(r["error"] for r in results if r["error"] is not None)
+    for error, count in errors.most_common(3):
+        print(f"   ❌ {count} x {error}")
+    latencies = [r["latency"] for r in succeeded]
+    ttfts = [r["ttft"] for r in succeeded]
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": requests - len(succeeded),
+        "error_rate": (requests - len(succeeded)) / requests,
+        "elapsed_s": elapsed,
+        "req_per_s": len(succeeded) / elapsed,
+        "chunks_per_s": sum(r["chunks"] for r in succeeded) / elapsed,
+        **{f"latency_p{q}": percentile(latencies, q) for q in (50, 95, 99)},
+        **{f"ttft_p{q}": percentile(ttfts, q) for q in (50, 95, 99)},
+    }
+
+
+def print_table(rows: List[Dict]):
+    def seconds(value: Optional[float]) -> str:
+        return f"{value:>8.2f}s" if value is not None else f"{'-':>9}"
+
+    print(f"\n{'=' * 97}")
+    print("📊 CHARGE (latences et TTFT des requêtes réussies)")
+    print(f"{'=' * 97}")
+    print(
+        f"{'conc':>5} {'err':>6} {'req/s':>8} {'chunk/s':>9} {'lat p50':>9} {'lat p95':>9} {'lat p99':>9} "
+        f"{'ttft p50':>9} {'ttft p95':>9} {'ttft p99':>9}"
+    )
+    for row in rows:
+        print(
+            f"{row['concurrency']:>5} {row['error_rate']:>6.0%} {row['req_per_s']:>8.2f} {row['chunks_per_s']:>9.1f} "
+            + " ".join(seconds(row[f"{metric}_p{q}"]) for metric in ("latency", "ttft") for q in (50, 95, 99))
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de charge du serveur d'inférence")
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:8000", help="URL du serveur")
+    parser.add_argument("--dataset", type=Path, default=Path(DEFAULT_DATASET), help="JSONL des prompts")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="Niveaux de concurrence")
+    parser.add_argument("--requests", type=int, default=32, help="Requêtes par niveau")
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, default=None, help="Sauvegarder les résultats (JSON)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    prompts = load_prompts(args.dataset)
+    if not prompts:
+        raise SystemExit(f"❌ Aucun prompt dans {args.dataset}")
+    print(f"📥 {len(prompts)} prompts chargés depuis {args.dataset}")
+
+    rows = []
+    for concurrency in args.concurrency:
+        print(f"🚀 Concurrence {concurrency} ({args.requests} requêtes)...")
+        rows.append(asyncio.run(run_level(args.url, prompts, concurrency, args.requests, args.max_new_tokens)))
+
+    print_table(rows)
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        print(f"\n✅ Résultats sauvegardés : {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Serveur d'inférence local (FastAPI) avec micro-batching dynamique
+
+Les requêtes de chat arrivent dans une file asyncio. Un worker unique les regroupe
+en micro-lots (jusqu'à --max-batch-size requêtes, en attendant au plus --max-wait-ms
+après la première) et lance un seul `generate` par lot dans un thread. Les tokens de
+chaque ligne du lot sont renvoyés au fil de l'eau (Server-Sent Events). Si un lot
+échoue (OOM, prompt invalide), ses requêtes reçoivent l'erreur (500, ou un événement
+`error` si le flux a déjà commencé) et le worker passe au lot suivant. Un lot génère
+jusqu'au plus grand `max_new_tokens` de ses requêtes : ce champ est borné par
+MAX_NEW_TOKENS (422 au-delà) pour qu'un client ne retienne pas tout un lot.
+
+Usage :
+    python scripts/serve_model.py --lora ./models/mistral-7b-philosophes-lora-final --port 8000
+
+    curl -N localhost:8000/chat -H 'Content-Type: application/json' \\
+        -d '{"messages": [{"role": "user", "content": "La liberté, c est faire ce qu on veut ?"}]}'
+"""
+
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import torch
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from transformers.generation.streamers import BaseStreamer
+
+from test_model import GENERATION_KWARGS, LORA_PATH, load_model
+
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_MAX_WAIT_MS = 20
+MAX_NEW_TOKENS = 1024
+
+
+class ChatRequest(BaseModel):
+    messages: List[Dict[str, str]]
+    max_new_tokens: Optional[int] = Field(None, ge=1, le=MAX_NEW_TOKENS)
+    stream: bool = True
+
+
+@dataclass
+class PendingRequest:
+    input_ids: List[int]
+    max_new_tokens: int
+    queue: asyncio.Queue
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class BatchTokenStreamer(BaseStreamer):
+    """
+    Répartit les tokens d'un `generate` en lot vers la file de chaque requête
+
+    Appelé depuis le thread de génération : les envois passent par
+    `loop.call_soon_threadsafe`. Le texte est redécodé par ligne et seul le delta
+    est envoyé (en retenant un caractère UTF-8 incomplet). Une ligne est close à son
+    EOS ou à son propre `max_new_tokens`, même si le lot continue pour les autres.
+    File de chaque requête : morceaux de texte, puis éventuellement l'exception du
+    lot, puis `None` (fin).
+    """
+
+    def __init__(self, tokenizer, requests: List[PendingRequest], loop: asyncio.AbstractEventLoop):
+        self.tokenizer = tokenizer
+        self.requests = requests
+        self.loop = loop
+        self._prompt_seen = False
+        self._tokens: List[List[int]] = [[] for _ in requests]
+        self._sent: List[int] = [0] * len(requests)
+        self._done: List[bool] = [False] * len(requests)
+
+    def _send(self, row: int, item):
+        self.loop.call_soon_threadsafe(self.requests[row].queue.put_nowait, item)
+
+    def _finish(self, row: int):
+        if not self._done[row]:
+            self._done[row] = True
+            self._send(row, None)
+
+    def put(self, value):
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        for row, token_id in enumerate(value.reshape(len(self.requests), -1)[:, -1].tolist()):
+            if self._done[row]:
+                continue
+            if token_id == self.tokenizer.eos_token_id:
+                self._finish(row)
+                continue
+            self._tokens[row].append(token_id)
+            text = self.tokenizer.decode(self._tokens[row], skip_special_tokens=True)
+            if not text.endswith("�") and len(text) > self._sent[row]:
+                self._send(row, text[self._sent[row]:])
+                self._sent[row] = len(text)
+            if len(self._tokens[row]) >= self.requests[row].max_new_tokens:
+                self._finish(row)
+
+    def end(self):
+        for row in range(len(self.requests)):
+            self._finish(row)
+
+    def fail(self, exc: BaseException):
+        """Envoie l'erreur du lot aux lignes encore ouvertes, puis les clôt"""
+        for row in range(len(self.requests)):
+            if not self._done[row]:
+                self._send(row, exc)
+                self._finish(row)
+
+
+class MicroBatcher:
+    def __init__(self, model, tokenizer, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE, max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.batches = 0
+        self.batched_requests = 0
+
+    async def submit(self, messages: List[Dict[str, str]], max_new_tokens: Optional[int]) -> asyncio.Queue:
+        input_ids = self.tokenizer.apply_chat_template(messages, tokenize=True, add_generation_prompt=True)
+        request = PendingRequest(
+            input_ids=input_ids,
+            max_new_tokens=max_new_tokens or GENERATION_KWARGS["max_new_tokens"],
+            queue=asyncio.Queue(),
+        )
+        await self.queue.put(request)
+        return request.queue
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.batches += 1
+            self.batched_requests += len(batch)
+            # Un seul generate à la fois : le worker attend la fin du lot avant d'en former un autre
+            try:
+                await loop.run_in_executor(None, self._generate, batch, loop)
+            except Exception as exc:
+                # Déjà transmise aux requêtes du lot : le worker doit survivre pour les suivantes
+                print(f"❌ Lot de {len(batch)} requête(s) en échec : {exc!r}")
+
+    def _generate(self, batch: List[PendingRequest], loop: asyncio.AbstractEventLoop):
+        streamer = BatchTokenStreamer(self.tokenizer, batch, loop)
+        padding_side = self.tokenizer.padding_side
+        self.tokenizer.padding_side = "left"
+        try:
+            inputs = self.tokenizer.pad(
+                {"input_ids": [request.input_ids for request in batch]},
+                return_tensors="pt",
+            ).to(self.model.device)
+            with torch.no_grad():
+                self.model.generate(
+                    **inputs,
+                    **{**GENERATION_KWARGS, "max_new_tokens": max(r.max_new_tokens for r in batch)},
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    streamer=streamer,
+                )
+        except Exception as exc:
+            streamer.fail(exc)
+            raise
+        else:
+            streamer.end()
+        finally:
+            self.tokenizer.padding_side = padding_side
+
+
+def create_app(model, tokenizer, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE, max_wait_ms: float = DEFAULT_MAX_WAIT_MS) -> FastAPI:
+    batcher = MicroBatcher(model, tokenizer, max_batch_size, max_wait_ms)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        worker = asyncio.create_task(batcher.run())
+        yield
+        worker.cancel()
+
+    app = FastAPI(title="Bergson and Friends - Inference", lifespan=lifespan)
+
+    @app.get("/health")
+    async def health():
+        return {
+            "status": "ok",
+            "batches": batcher.batches,
+            "avg_batch_size": batcher.batched_requests / batcher.batches if batcher.batches else 0.0,
+            "queued": batcher.queue.qsize(),
+        }
+
+    def error_message(exc: BaseException) -> str:
+        return f"{type(exc).__name__}: {exc}"
+
+    @app.post("/chat")
+    async def chat(request: ChatRequest):
+        queue = await batcher.submit(request.messages, request.max_new_tokens)
+
+        if not request.stream:
+            chunks = []
+            while (chunk := await queue.get()) is not None:
+                if isinstance(chunk, BaseException):
+                    return JSONResponse({"error": error_message(chunk)}, status_code=500)
+                chunks.append(chunk)
+            return JSONResponse({"response": "".join(chunks).strip()})
+
+        # Premier morceau attendu avant d'ouvrir le flux : un lot qui échoue dès le
+        # prefill (cas typique de l'OOM) renvoie encore un vrai 500
+        first = await queue.get()
+        if isinstance(first, BaseException):
+            return JSONResponse({"error": error_message(first)}, status_code=500)
+
+        async def events():
+            chunk = first
+            while chunk is not None:
+                if isinstance(chunk, BaseException):
+                    yield f"data: {json.dumps({'error': error_message(chunk)}, ensure_ascii=False)}\n\n"
+                    return
+                yield f"data: {json.dumps({'token': chunk}, ensure_ascii=False)}\n\n"
+                chunk = await queue.get()
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    """Point d'entrée principal"""
+    import argparse
+
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serveur d'inférence Mistral 7B LoRA (micro-batching)")
+    parser.add_argument("--lora", type=str, default=LORA_PATH, help="Chemin vers LoRA (None = base model)")
+    parser.add_argument("--device", type=str, default="auto", choices=["auto", "cpu", "cuda"], help="Device")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE, help="Requêtes max par generate")
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS, help="Attente max pour compléter un lot")
+    args = parser.parse_args()
+
+    model, tokenizer = load_model(args.lora, args.device)
+    app = create_app(model, tokenizer, args.max_batch_size, args.max_wait_ms)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
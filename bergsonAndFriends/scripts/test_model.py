@@ -4,15 +4,83 @@ Teste l'application des schèmes logiques sur 10 questions par philosophe
 """
 
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
+from transformers import (
+    AutoModelForCausalLM,
+    AutoTokenizer,
+    BitsAndBytesConfig,
+    DynamicCache,
+    LogitsProcessor,
+    LogitsProcessorList,
+    StoppingCriteria,
+    StoppingCriteriaList,
+)
+from transformers.generation.streamers import BaseStreamer
 from peft import PeftModel
+import contextlib
+import copy
+import hashlib
 import json
+import os
+import re
+import resource
+import shutil
+import sys
+import threading
 import time
-from typing import List, Dict
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+
+from generation_cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_BYTES, GenerationCache, is_cacheable
+from latency_stats import mean, percentile
 
 # Configuration
 MODEL_BASE = "mistralai/Mistral-7B-Instruct-v0.3"
 LORA_PATH = "./models/mistral-7b-philosophes-lora-final"  # Chemin vers LoRA
+MERGED_CACHE_DIR = "./models/merged-cache"  # Modèles base + LoRA déjà mergés (safetensors)
+
+# Backend CPU : dtype de chargement (et du cache mergé) pour chaque mode
+CPU_DTYPES = {
+    "int8": torch.bfloat16,  # quantization dynamique int8 appliquée après le merge
+    "bf16": torch.bfloat16,
+    "fp32": torch.float32,
+}
+
+SYSTEM_PROMPT = "Tu es un tuteur philosophique maîtrisant les schèmes logiques. Tu appliques le schème demandé au contexte fourni."
+
+# Mode chat multi-tours (dialogues Spinoza de data/FT/correction_dataset.jsonl)
+CHAT_DATASET = "data/FT/correction_dataset.jsonl"
+CHAT_SYSTEM_PROMPT = (
+    "Tu ES Spinoza incarné. Tu dialogues avec un élève de Terminale en première personne.\n\n"
+    "RÈGLES STRICTES:\n"
+    "- Tutoie toujours l'élève (tu/ton/ta)\n"
+    "- Reste concis (2-3 phrases MAX)\n"
+    "- Questionne au lieu d'affirmer\n"
+    "- Varie tes formulations\n"
+    "- Ne parle JAMAIS de toi à la 3ème personne. Tu ES Spinoza.\n"
+    "- Réponds à la question posée, pas à une question précédente.\n"
+    "- Adapte ta réponse au contexte immédiat de la conversation."
+)
+CHAT_MAX_CONTEXT_TOKENS = 2048  # historique + réponse
+CHAT_TRUNCATE_TARGET = 0.75  # après troncature, l'historique retombe sous 75 % du budget
+
+GENERATION_KWARGS = {
+    "max_new_tokens": 128,
+    "do_sample": True,
+    "temperature": 0.7,
+    "top_p": 0.9,
+}
+
+# Arrêt anticipé (--early-stop) : une règle par type de génération
+CONCLUSION_PREFIX = "Donc"  # forme des conclusions attendues (--force-conclusion)
+STOP_RULES = {
+    # La phrase "Donc ..." vient souvent après les prémisses ("Si ...", "Or ...") et
+    # jusqu'à ~100 tokens dans schemes_levelA_* : ni limite de phrases ni budget réduit,
+    # on coupe seulement une fois la conclusion terminée
+    "schema": {"conclusion_marker": CONCLUSION_PREFIX, "max_new_tokens": GENERATION_KWARGS["max_new_tokens"]},
+    # Dialogues Spinoza : "Reste concis (2-3 phrases MAX)"
+    "dialogue": {"max_sentences": 3, "max_new_tokens": 128},
+}
+SENTENCE_END_RE = re.compile(r"[.!?…]+(?=\s|$)")
 
 # Questions de test par philosophe
 TEST_QUESTIONS = {
@@ -60,24 +128,76 @@ TEST_QUESTIONS = {
 }
 
 
-def load_model(lora_path: str = None, device: str = "auto"):
-    """
-    Charge le modèle Mistral 7B avec ou sans LoRA
+def use_cpu_backend(device: str) -> bool:
+    return device == "cpu" or (device == "auto" and not torch.cuda.is_available())
 
-    Args:
-        lora_path: Chemin vers LoRA (None = base model)
-        device: "auto", "cpu", "cuda"
-    """
-    print(f"📥 Chargement du modèle base: {MODEL_BASE}")
 
-    # Configuration quantization 4-bit
-    bnb_config = BitsAndBytesConfig(
+def quantization_config() -> BitsAndBytesConfig:
+    """Configuration quantization 4-bit du modèle base (GPU)"""
+    return BitsAndBytesConfig(
         load_in_4bit=True,
         bnb_4bit_quant_type="nf4",
         bnb_4bit_compute_dtype=torch.bfloat16 if torch.cuda.is_available() else torch.float32,
         bnb_4bit_use_double_quant=True,
     )
 
+
+def unmerged_cpu_dtype(cpu_dtype: str) -> str:
+    """
+    Précision CPU réelle avec des LoRA non mergés : l'int8 dynamique remplacerait les
+    nn.Linear auxquels les LoRA s'attachent, la base reste alors en bf16
+    """
+    return "bf16" if cpu_dtype == "int8" else cpu_dtype
+
+
+def backend_identity(device: str, cpu_dtype: str, merged: bool = True) -> str:
+    """
+    Backend, précision effective et mode de chargement, ex. "cpu-int8-merged" ou
+    "cuda-nf4-bfloat16-unmerged"
+
+    Fait partie de la clé du cache de génération : une réponse (et sa latence) obtenue
+    en nf4 sur GPU ne vaut pas pour un run CPU int8, et inversement. De même, un LoRA
+    mergé (load_model) et un LoRA attaché sans merge (load_model_with_adapters) ne
+    calculent pas avec les mêmes poids.
+    """
+    if use_cpu_backend(device):
+        numerics = f"cpu-{cpu_dtype if merged else unmerged_cpu_dtype(cpu_dtype)}"
+    else:
+        config = quantization_config()
+        numerics = f"cuda-{config.bnb_4bit_quant_type}-{str(config.bnb_4bit_compute_dtype).replace('torch.', '')}"
+    return f"{numerics}-{'merged' if merged else 'unmerged'}"
+
+
+def load_model(lora_path: str = None, device: str = "auto", merged_cache_dir: str = None, cpu_dtype: str = "int8"):
+    """
+    Charge le modèle Mistral 7B avec ou sans LoRA
+
+    Args:
+        lora_path: Chemin vers LoRA (None = base model)
+        device: "auto", "cpu", "cuda" (sans CUDA, "auto" passe par le backend CPU)
+        merged_cache_dir: si fourni, le modèle mergé est sauvegardé une fois en
+            safetensors (clé = modèle base + hash du LoRA + quantization) puis
+            rechargé directement (memory-map, sans quantization ni merge)
+        cpu_dtype: "int8", "bf16" ou "fp32" pour le backend CPU (voir load_model_cpu)
+    """
+    if use_cpu_backend(device):
+        return load_model_cpu(lora_path, cpu_dtype, merged_cache_dir)
+
+    bnb_config = quantization_config()
+
+    cache_path = None
+    if lora_path and merged_cache_dir:
+        cache_path = merged_model_cache_path(merged_cache_dir, lora_path, bnb_config.to_dict())
+        if (cache_path / "config.json").exists():
+            print(f"⚡ Modèle mergé en cache: {cache_path}")
+            # La config de quantization est sauvegardée avec les poids 4-bit : rien à re-quantizer
+            model = AutoModelForCausalLM.from_pretrained(cache_path, device_map=device)
+            tokenizer = AutoTokenizer.from_pretrained(cache_path)
+            tokenizer.pad_token = tokenizer.eos_token
+            return model, tokenizer
+
+    print(f"📥 Chargement du modèle base: {MODEL_BASE}")
+
     # Charger le modèle base
     model = AutoModelForCausalLM.from_pretrained(
         MODEL_BASE,
@@ -95,28 +215,971 @@ def load_model(lora_path: str = None, device: str = "auto"):
         model = PeftModel.from_pretrained(model, lora_path)
         model = model.merge_and_unload()  # Merge pour inférence
         print("✅ LoRA chargé et mergé")
+        if cache_path is not None:
+            save_merged_model(model, tokenizer, cache_path)
     else:
         print("⚠️ Mode BASE (sans LoRA)")
 
     return model, tokenizer
 
 
-def test_schema(model, tokenizer, philosopher: str, question: Dict, verbose: bool = True):
+def load_model_cpu(lora_path: str = None, cpu_dtype: str = "int8", merged_cache_dir: str = None):
     """
-    Teste l'application d'un schème logique
+    Backend CPU : bitsandbytes (4-bit) ne tourne que sur GPU
 
-    Returns:
-        dict avec résultats (response, latency, correct)
+    Le modèle est chargé en bf16 ou fp32 puis le LoRA est mergé. En "int8", les
+    nn.Linear sont ensuite quantifiés dynamiquement (poids int8, activations
+    quantifiées à la volée) : ~4x moins de mémoire que fp32 et des matmuls int8.
+    Le cache mergé stocke les poids avant quantization (rapide à réappliquer).
+
+    Pic mémoire (RSS) en "int8" pour un 7B : ~15 GB, soit le modèle bf16 (~14,5 GB)
+    plus une couche en fp32 (voir quantize_linears_int8), contre ~29 GB si tout le
+    modèle était passé en fp32 avant quantization. Modèle final : ~7,5 GB.
     """
-    # Construire le prompt
-    prompt = f"Schème : {question['schema']}\nContexte : {question['context']}\nApplique le schème :"
+    load_dtype = CPU_DTYPES[cpu_dtype]
+    model = None
 
-    messages = [
-        {"role": "system", "content": "Tu es un tuteur philosophique maîtrisant les schèmes logiques. Tu appliques le schème demandé au contexte fourni."},
-        {"role": "user", "content": prompt}
+    cache_path = None
+    if lora_path and merged_cache_dir:
+        cache_path = merged_model_cache_path(merged_cache_dir, lora_path, {"backend": "cpu", "dtype": str(load_dtype)})
+        if (cache_path / "config.json").exists():
+            print(f"⚡ Modèle mergé en cache: {cache_path}")
+            model = AutoModelForCausalLM.from_pretrained(cache_path, torch_dtype=load_dtype, low_cpu_mem_usage=True)
+            tokenizer = AutoTokenizer.from_pretrained(cache_path)
+
+    if model is None:
+        print(f"📥 Chargement du modèle base (CPU, {cpu_dtype}): {MODEL_BASE}")
+        model = AutoModelForCausalLM.from_pretrained(
+            MODEL_BASE,
+            torch_dtype=load_dtype,
+            low_cpu_mem_usage=True,
+            trust_remote_code=True,
+        )
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_BASE, trust_remote_code=True)
+
+        if lora_path:
+            print(f"📥 Chargement du LoRA: {lora_path}")
+            model = PeftModel.from_pretrained(model, lora_path)
+            model = model.merge_and_unload()
+            print("✅ LoRA chargé et mergé")
+            if cache_path is not None:
+                save_merged_model(model, tokenizer, cache_path)
+        else:
+            print("⚠️ Mode BASE (sans LoRA)")
+
+    tokenizer.pad_token = tokenizer.eos_token
+
+    if cpu_dtype == "int8":
+        print("⚙️ Quantization dynamique int8 des couches linéaires")
+        quantize_linears_int8(model)
+
+    model.eval()
+    return model, tokenizer
+
+
+def quantize_linears_int8(model: torch.nn.Module):
+    """
+    Quantization dynamique int8 des nn.Linear, une couche à la fois (en place)
+
+    quantize_dynamic attend des poids fp32 : appliqué au modèle entier, il faut
+    d'abord tout convertir (model.float(), 2x la taille bf16). Ici chaque couche
+    est passée en fp32 puis remplacée par sa version int8 avant la suivante : le
+    surcoût est borné par la plus grosse couche (lm_head, ~0,5 GB pour Mistral 7B)
+    et les poids bf16 remplacés sont libérés au fur et à mesure. Le reste
+    (embeddings, normes, ~0,5 GB) est converti en fp32 à la fin, car les couches
+    int8 dynamiques prennent des activations fp32.
+    """
+    linears = [
+        (parent, name)
+        for parent in model.modules()
+        for name, child in parent.named_children()
+        if type(child) is torch.nn.Linear
     ]
+    for parent, name in linears:
+        linear = getattr(parent, name).float()
+        linear.qconfig = torch.ao.quantization.default_dynamic_qconfig
+        setattr(parent, name, torch.ao.nn.quantized.dynamic.Linear.from_float(linear))
+        del linear
+    model.float()
+
+
+def discover_adapters(specs: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Adapters à comparer, dans l'ordre : "base" (sans LoRA) puis chaque `NOM=CHEMIN` ou `CHEMIN`
+
+    Un dossier de run du Trainer (sans adapter_config.json) est développé en ses
+    `checkpoint-N`, triés par step, suivis de `<dossier>-final` s'il existe, nommés
+    `<NOM ou dossier>-checkpoint-N` et `<NOM ou dossier>-final` : deux runs ne se
+    marchent pas dessus.
+
+    Raises:
+        ValueError: nom en double, ou "base" (réservé au modèle sans LoRA)
+
+    Returns:
+        {nom: chemin}, chemin None pour le modèle base
+    """
+    adapters: Dict[str, Optional[str]] = {"base": None}
+    for spec in specs:
+        name, sep, path = spec.partition("=")
+        if not sep:
+            name, path = "", spec
+        path = Path(path)
+
+        if (path / "adapter_config.json").exists():
+            found = [(name or path.name, path)]
+        else:
+            checkpoints = sorted(
+                (p for p in path.glob("checkpoint-*") if (p / "adapter_config.json").exists()),
+                key=lambda p: int(p.name.rsplit("-", 1)[-1]),
+            )
+            final = path.with_name(path.name + "-final")
+            if (final / "adapter_config.json").exists():
+                checkpoints.append(final)
+            if not checkpoints:
+                raise ValueError(f"Aucun LoRA dans {path} (ni adapter_config.json ni checkpoint-*)")
+            prefix = name or path.name
+            found = [(f"{prefix}-final" if p == final else f"{prefix}-{p.name}", p) for p in checkpoints]
+
+        for adapter_name, adapter_path in found:
+            # PEFT range les LoRA dans des ModuleDict : pas de "." dans les noms
+            adapter_name = adapter_name.replace(".", "_")
+            if adapter_name in adapters:
+                reason = "réservé au modèle sans LoRA" if adapter_name == "base" else f"déjà pris par {adapters[adapter_name]}"
+                raise ValueError(f"Nom d'adapter {adapter_name!r} pour {adapter_path} : {reason} (utiliser NOM=CHEMIN)")
+            adapters[adapter_name] = str(adapter_path)
+    return adapters
+
+
+def load_model_with_adapters(adapters: Dict[str, Optional[str]], device: str = "auto", cpu_dtype: str = "bf16"):
+    """
+    Charge le modèle base une seule fois et y attache chaque LoRA sous son nom, sans merge
+
+    Sur GPU, la base est quantifiée en 4-bit comme dans load_model. Sur CPU, l'int8
+    dynamique remplacerait les nn.Linear auxquels les LoRA s'attachent : la base est
+    alors chargée en bf16.
+    """
+    if use_cpu_backend(device):
+        if unmerged_cpu_dtype(cpu_dtype) != cpu_dtype:
+            print(f"⚠️ {cpu_dtype} incompatible avec des LoRA non mergés : base chargée en {unmerged_cpu_dtype(cpu_dtype)}")
+            cpu_dtype = unmerged_cpu_dtype(cpu_dtype)
+        print(f"📥 Chargement du modèle base (CPU, {cpu_dtype}): {MODEL_BASE}")
+        model = AutoModelForCausalLM.from_pretrained(
+            MODEL_BASE,
+            torch_dtype=CPU_DTYPES[cpu_dtype],
+            low_cpu_mem_usage=True,
+            trust_remote_code=True,
+        )
+    else:
+        print(f"📥 Chargement du modèle base: {MODEL_BASE}")
+        model = AutoModelForCausalLM.from_pretrained(
+            MODEL_BASE,
+            quantization_config=quantization_config(),
+            device_map=device,
+            trust_remote_code=True,
+        )
+
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_BASE, trust_remote_code=True)
+    tokenizer.pad_token = tokenizer.eos_token
+
+    for name, path in adapters.items():
+        if path is None:
+            continue
+        print(f"📥 LoRA {name}: {path}")
+        if isinstance(model, PeftModel):
+            model.load_adapter(path, adapter_name=name)
+        else:
+            model = PeftModel.from_pretrained(model, path, adapter_name=name)
+
+    model.eval()
+    return model, tokenizer
+
+
+@contextlib.contextmanager
+def active_adapter(model, name: Optional[str]):
+    """
+    Active le LoRA `name` le temps du bloc ; None = modèle base (tous les LoRA désactivés)
+
+    Les KV-caches de préfixe calculés avec un autre adapter sont invalidés, y compris
+    si le bloc lève une exception.
+    """
+    drop_prefix_caches(model)
+    try:
+        if name is None:
+            with model.disable_adapter() if isinstance(model, PeftModel) else contextlib.nullcontext():
+                yield
+        else:
+            model.set_adapter(name)
+            yield
+    finally:
+        drop_prefix_caches(model)
+
+
+def configure_cpu_threads(num_threads: Optional[int] = None, interop_threads: int = 1, pin: bool = True) -> int:
+    """
+    Règle les threads PyTorch pour l'inférence CPU
+
+    Args:
+        num_threads: threads intra-op (une matmul répartie sur N cœurs), défaut = cœurs disponibles
+        interop_threads: threads inter-op ; `generate` enchaîne des opérations dépendantes, 1 suffit
+        pin: restreint le process aux `num_threads` premiers cœurs (Linux), pour que
+            les threads ne migrent pas d'un cœur à l'autre
+
+    Returns:
+        nombre de threads intra-op retenu
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    num_threads = min(num_threads or len(cores), len(cores))
+
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(interop_threads)
+    except RuntimeError:
+        # Réglable une seule fois, avant le premier travail parallèle
+        print("⚠️ Threads inter-op déjà initialisés, réglage ignoré")
+
+    if pin and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores[:num_threads])
+
+    return num_threads
+
+
+def adapter_hash(lora_path: str) -> str:
+    """Hash du contenu du LoRA (config + poids), indépendant de son emplacement"""
+    digest = hashlib.sha256()
+    for path in sorted(Path(lora_path).iterdir()):
+        if path.name.startswith("adapter_") and path.is_file():
+            digest.update(path.name.encode("utf-8"))
+            with path.open("rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def merged_model_cache_path(cache_dir: str, lora_path: str, quantization: Dict) -> Path:
+    base_slug = MODEL_BASE.replace("/", "--")
+    quant_hash = hashlib.sha256(json.dumps(quantization, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:8]
+    return Path(cache_dir) / f"{base_slug}__{adapter_hash(lora_path)}__{quant_hash}"
+
+
+def save_merged_model(model, tokenizer, cache_path: Path):
+    """Écrit dans un dossier temporaire puis renomme : une entrée visible est complète"""
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    print(f"💾 Sauvegarde du modèle mergé: {cache_path}")
+    model.save_pretrained(tmp_path, safe_serialization=True)
+    tokenizer.save_pretrained(tmp_path)
+    if cache_path.exists():
+        shutil.rmtree(cache_path)
+    tmp_path.rename(cache_path)
+
+
+class TimingStreamer(BaseStreamer):
+    """
+    Streamer passé à `generate` pour horodater la génération (sans décoder)
+
+    `generate` appelle `put` une première fois avec le prompt, puis à chaque pas
+    de décodage : le premier appel suivant le prompt donne le time-to-first-token.
+    Fonctionne aussi en batch (un `put` par pas pour tout le lot). `steps` compte
+    les passes du modèle cible (en décodage assisté, un pas peut valider plusieurs tokens).
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.first_token_time = None
+        self.end_time = None
+        self.steps = 0
+        self._prompt_seen = False
+
+    def put(self, value):
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        self.steps += 1
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+
+    def end(self):
+        self.end_time = time.perf_counter()
+
+    @property
+    def latency(self) -> float:
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+    @property
+    def ttft(self) -> Optional[float]:
+        if self.first_token_time is None:
+            return None
+        return self.first_token_time - self.start_time
+
+
+class ResponseStop(StoppingCriteria):
+    """
+    Arrêt anticipé ligne par ligne, sur la réponse décodée (tokens après `prompt_length`)
+
+    Une ligne s'arrête dès que sa réponse contient `max_sentences` phrases terminées
+    ou que la phrase de conclusion (commençant par `conclusion_marker`) est terminée.
+    `forced_text` est le début de réponse déjà placé dans le prompt (--force-conclusion).
+    En lot, `generate` complète les lignes arrêtées avec du padding.
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        prompt_length: int,
+        max_sentences: Optional[int] = None,
+        conclusion_marker: Optional[str] = None,
+        forced_text: str = "",
+    ):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.max_sentences = max_sentences
+        self.forced_text = forced_text
+        self.conclusion_re = (
+            re.compile(rf"\b{re.escape(conclusion_marker)}[^.!?…]*[.!?…]+(?=\s|$)") if conclusion_marker else None
+        )
+
+    def done(self, response: str) -> bool:
+        response = (self.forced_text + response).rstrip()
+        if self.max_sentences and len(SENTENCE_END_RE.findall(response)) >= self.max_sentences:
+            return True
+        return bool(self.conclusion_re and self.conclusion_re.search(response))
+
+    def __call__(self, input_ids, scores, **kwargs):
+        responses = self.tokenizer.batch_decode(input_ids[:, self.prompt_length:], skip_special_tokens=True)
+        return torch.tensor([self.done(r) for r in responses], dtype=torch.bool, device=input_ids.device)
+
+
+def build_stopping(tokenizer, prompt_length: int, stop_rule: Optional[str], forced_text: str = "") -> Tuple[Optional[StoppingCriteriaList], Dict]:
+    """
+    Critères d'arrêt d'une règle de STOP_RULES et réglages de génération qu'elle impose
+
+    Returns:
+        (critères ou None, surcharges de GENERATION_KWARGS : budget de tokens)
+    """
+    if stop_rule is None:
+        return None, {}
+    rule = STOP_RULES[stop_rule]
+    criteria = ResponseStop(
+        tokenizer,
+        prompt_length,
+        max_sentences=rule.get("max_sentences"),
+        conclusion_marker=rule.get("conclusion_marker"),
+        forced_text=forced_text,
+    )
+    return StoppingCriteriaList([criteria]), {"max_new_tokens": rule["max_new_tokens"]}
+
+
+class WordBoundary(LogitsProcessor):
+    """
+    Au premier token généré après le début imposé (--force-conclusion), interdit les
+    tokens qui prolongeraient son dernier mot ("Donc" -> "Doncue") : seuls restent
+    ceux qui commencent par un espace ou une ponctuation.
+
+    `forced_ids[row]` : tokens imposés de chaque ligne (en fin de prompt, padding à gauche).
+    """
+
+    def __init__(self, tokenizer, prompt_length: int, forced_ids: List[List[int]]):
+        self.prompt_length = prompt_length
+        self.allowed = [boundary_token_mask(tokenizer, ids) if ids else None for ids in forced_ids]
+
+    def __call__(self, input_ids, scores):
+        if input_ids.shape[1] != self.prompt_length:
+            return scores
+        for row, allowed in enumerate(self.allowed):
+            if allowed is not None:
+                mask = torch.zeros(scores.shape[-1], dtype=torch.bool, device=scores.device)
+                mask[: len(allowed)] = allowed.to(scores.device)
+                scores[row] = scores[row].masked_fill(~mask, float("-inf"))
+        return scores
+
+
+_BOUNDARY_MASKS: Dict[Tuple[str, Tuple[int, ...]], torch.Tensor] = {}
+
+
+def boundary_token_mask(tokenizer, forced_ids: List[int]) -> torch.Tensor:
+    """Tokens du vocabulaire qui, décodés après `forced_ids`, commencent par un espace ou une ponctuation"""
+    key = (tokenizer.name_or_path, tuple(forced_ids))
+    if key not in _BOUNDARY_MASKS:
+        prefix = tokenizer.decode(forced_ids, skip_special_tokens=True)
+        texts = tokenizer.batch_decode([forced_ids + [token] for token in range(len(tokenizer))], skip_special_tokens=True)
+        _BOUNDARY_MASKS[key] = torch.tensor(
+            [len(text) > len(prefix) and text.startswith(prefix) and not text[len(prefix)].isalnum() for text in texts]
+        )
+    return _BOUNDARY_MASKS[key]
+
+
+def forced_start_processors(tokenizer, prompt_length: int, forced_ids: List[List[int]]) -> Optional[LogitsProcessorList]:
+    if not any(forced_ids):
+        return None
+    return LogitsProcessorList([WordBoundary(tokenizer, prompt_length, forced_ids)])
+
+
+def decoding_options(stop_rule: Optional[str] = None, force_conclusion: bool = False) -> Dict:
+    """Réglages d'arrêt et de début forcé à inclure dans la clé du cache de génération (vide par défaut)"""
+    options = {}
+    if stop_rule is not None:
+        options["stop_rule"] = {stop_rule: STOP_RULES[stop_rule]}
+    if force_conclusion:
+        options["forced_prefix"] = {"text": CONCLUSION_PREFIX, "word_boundary": True}
+    return options
+
+
+def load_draft_model(draft_name: str, tokenizer, device: str = "auto"):
+    """
+    Charge le petit modèle draft du décodage assisté (sans quantization)
+
+    Le draft doit partager le tokenizer du modèle cible : ses propositions sont des
+    ids de tokens vérifiés tels quels par le modèle cible.
+    """
+    print(f"📥 Chargement du modèle draft: {draft_name}")
+    draft_tokenizer = AutoTokenizer.from_pretrained(draft_name)
+    if draft_tokenizer.get_vocab() != tokenizer.get_vocab():
+        raise ValueError(f"Le modèle draft {draft_name} n'utilise pas le même tokenizer que le modèle cible")
+
+    draft_model = AutoModelForCausalLM.from_pretrained(
+        draft_name,
+        torch_dtype=torch.bfloat16 if torch.cuda.is_available() else torch.float32,
+        device_map=device,
+    )
+    draft_model.eval()
+    return draft_model
+
+
+class DraftCounter:
+    """
+    Compte les tokens proposés par le modèle draft pendant un `generate` assisté
+
+    Chaque forward du draft propose un token : un hook sur son forward suffit,
+    sans dépendre des internes du candidate generator de transformers.
+    """
+
+    def __init__(self, draft_model):
+        self.draft_model = draft_model
+        self.drafted = 0
+        self._handle = None
+
+    def _hook(self, module, args, output):
+        self.drafted += 1
+
+    def __enter__(self):
+        self._handle = self.draft_model.register_forward_hook(self._hook)
+        return self
+
+    def __exit__(self, *exc):
+        self._handle.remove()
+
+
+def speculative_metrics(streamer: TimingStreamer, counter: DraftCounter, output_tokens: int) -> Dict:
+    """Chaque pas du modèle cible valide les tokens acceptés + 1 token qu'il produit lui-même"""
+    accepted = max(output_tokens - streamer.steps, 0)
+    return {
+        "target_steps": streamer.steps,
+        "draft_tokens": counter.drafted,
+        "accepted_tokens": accepted,
+        "acceptance_rate": accepted / counter.drafted if counter.drafted else None,
+    }
+
+
+def current_rss_mb() -> Optional[float]:
+    """RSS actuel du process : /proc sous Linux, psutil ailleurs s'il est installé"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024**2
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / 1024**2
+
+
+class RssPeak:
+    """
+    Pic RSS depuis le dernier `reset`, échantillonné toutes les `interval` s dans un thread
+
+    ru_maxrss est le pic de toute la vie du process : après le chargement du modèle,
+    chaque question rapporterait le même nombre.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def _run(self):
+        while True:
+            self._sample()
+            time.sleep(self.interval)
+
+    def reset(self):
+        self.peak = None
+        self._sample()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="rss-peak", daemon=True)
+            self._thread.start()
+
+    def read(self) -> Optional[float]:
+        self._sample()
+        return self.peak
+
+
+RSS_PEAK = RssPeak()
+
+
+def reset_peak_memory():
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+    else:
+        RSS_PEAK.reset()
+
+
+def peak_memory_mb() -> float:
+    """
+    Pic mémoire depuis le dernier reset_peak_memory : allocations CUDA, sinon RSS échantillonné
+
+    Sans moyen de lire le RSS courant (ni /proc ni psutil), repli sur le pic RSS de toute
+    la vie du process (ru_maxrss), qui n'est pas propre à la question.
+    """
+    if torch.cuda.is_available():
+        return torch.cuda.max_memory_allocated() / 1024**2
+    peak = RSS_PEAK.read()
+    if peak is not None:
+        return peak
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en Ko sous Linux, en octets sous macOS
+    return rss / 1024**2 if sys.platform == "darwin" else rss / 1024
+
+
+def count_generated_tokens(token_ids, eos_token_id: int) -> int:
+    """Nombre de tokens générés jusqu'au premier EOS inclus (le reste est du padding de lot)"""
+    ids = token_ids.tolist()
+    return ids.index(eos_token_id) + 1 if eos_token_id in ids else len(ids)
+
+
+def generation_metrics(streamer: TimingStreamer, prompt_tokens: int, output_tokens: int) -> Dict:
+    decode_time = (streamer.end_time or time.perf_counter()) - (streamer.first_token_time or streamer.start_time)
+    decode_tokens = max(output_tokens - 1, 0)
+    return {
+        "ttft": streamer.ttft,
+        "decode_tokens_per_s": decode_tokens / decode_time if decode_tokens and decode_time > 0 else None,
+        "prompt_tokens": prompt_tokens,
+        "output_tokens": output_tokens,
+        "peak_memory_mb": peak_memory_mb(),
+    }
+
+
+class PrefixKVCache:
+    """
+    KV-cache du préfixe commun à tous les prompts d'un même prompt système
+
+    Le préfixe est déterminé en rendant le chat template avec deux messages user
+    différents : leurs tokens communs couvrent le prompt système et le balisage qui
+    le précède (Mistral v0.3 le place dans le premier [INST], d'autres templates
+    dans un tour dédié). Il est encodé une fois ; chaque génération reçoit une copie
+    du cache et ne prefill que la suite du prompt.
+    """
+
+    def __init__(self, model, tokenizer, system_prompt: str):
+        self.system_prompt = system_prompt
+        probes = [
+            tokenizer.apply_chat_template(
+                [{"role": "system", "content": system_prompt}, {"role": "user", "content": probe}],
+                tokenize=True,
+                add_generation_prompt=True,
+            )
+            for probe in ("A", "Z 0")
+        ]
+        length = 0
+        while length < min(map(len, probes)) and probes[0][length] == probes[1][length]:
+            length += 1
+        self.prefix_ids = probes[0][:length]
+
+        with torch.no_grad():
+            prefix = torch.tensor([self.prefix_ids], device=model.device)
+            self.past_key_values = model(prefix, past_key_values=DynamicCache(), use_cache=True).past_key_values
+
+    def matches(self, input_ids) -> bool:
+        n = len(self.prefix_ids)
+        return n > 0 and input_ids.shape[1] > n and input_ids[0, :n].tolist() == self.prefix_ids
+
+    def copy(self):
+        # generate étend le cache en place : chaque question part d'une copie
+        return copy.deepcopy(self.past_key_values)
+
+
+_PREFIX_CACHES: Dict[Tuple[int, str], PrefixKVCache] = {}
+
+
+def get_prefix_cache(model, tokenizer, system_prompt: str) -> PrefixKVCache:
+    """
+    Cache de préfixe pour (modèle, prompt système, chat template)
+
+    La clé contient le hash du prompt système et du template : si l'un change, le
+    préfixe est recalculé ; les entrées d'un ancien prompt sont abandonnées.
+    """
+    prompt_hash = hashlib.sha256(f"{tokenizer.chat_template}\0{system_prompt}".encode("utf-8")).hexdigest()
+    key = (id(model), prompt_hash)
+    if key not in _PREFIX_CACHES:
+        drop_prefix_caches(model)
+        _PREFIX_CACHES[key] = PrefixKVCache(model, tokenizer, system_prompt)
+    return _PREFIX_CACHES[key]
+
+
+def drop_prefix_caches(model):
+    """Oublie les préfixes encodés par `model` (poids changés, ex : autre adapter actif)"""
+    for stale in [k for k in _PREFIX_CACHES if k[0] == id(model)]:
+        del _PREFIX_CACHES[stale]
+
+
+class PrintingStreamer(TimingStreamer):
+    """TimingStreamer qui affiche la réponse au fil des tokens (delta redécodé, comme serve_model.py)"""
+
+    def __init__(self, tokenizer):
+        super().__init__()
+        self.tokenizer = tokenizer
+        self._tokens: List[int] = []
+        self._printed = 0
+
+    def put(self, value):
+        is_prompt = not self._prompt_seen
+        super().put(value)
+        if is_prompt:
+            return
+        self._tokens.extend(t for t in value.reshape(-1).tolist() if t != self.tokenizer.eos_token_id)
+        text = self.tokenizer.decode(self._tokens, skip_special_tokens=True)
+        # Un caractère UTF-8 incomplet attend le token suivant
+        if not text.endswith("�") and len(text) > self._printed:
+            print(text[self._printed:], end="", flush=True)
+            self._printed = len(text)
+
+    def end(self):
+        super().end()
+        print(flush=True)
+
+
+def common_prefix_length(a: List[int], b: List[int]) -> int:
+    n = min(len(a), len(b))
+    length = 0
+    while length < n and a[length] == b[length]:
+        length += 1
+    return length
+
+
+class ChatSession:
+    """
+    Conversation multi-tours qui garde son KV-cache d'un tour à l'autre
+
+    À chaque tour, la conversation est rendue par le chat template et comparée aux
+    tokens déjà dans le cache : le cache est tronqué au plus long préfixe commun et
+    seul le reste est encodé. Avec un template stable, c'est le nouveau tour
+    utilisateur ; avec Mistral v0.3, qui place le prompt système dans le dernier
+    [INST], c'est l'échange précédent plus le nouveau tour. Le coût d'un tour ne
+    dépend donc pas de la longueur de l'historique.
 
+    Fenêtre bornée : si prompt + max_new_tokens dépasse `max_context_tokens`, les plus
+    anciens échanges (user + assistant) sont retirés, prompt système conservé, jusqu'à
+    retomber sous `truncate_target` du budget. La marge évite de retronquer (et donc
+    de réencoder tout l'historique) au tour suivant.
+
+    `stop_rule` (voir STOP_RULES) coupe chaque réponse à son nombre de phrases.
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        system_prompt: Optional[str] = CHAT_SYSTEM_PROMPT,
+        max_context_tokens: int = CHAT_MAX_CONTEXT_TOKENS,
+        max_new_tokens: int = GENERATION_KWARGS["max_new_tokens"],
+        truncate_target: float = CHAT_TRUNCATE_TARGET,
+        incremental: bool = True,
+        stop_rule: Optional[str] = None,
+    ):
+        if stop_rule is not None:
+            max_new_tokens = min(max_new_tokens, STOP_RULES[stop_rule]["max_new_tokens"])
+        self.model = model
+        self.tokenizer = tokenizer
+        self.system_prompt = system_prompt
+        self.max_context_tokens = max_context_tokens
+        self.max_new_tokens = max_new_tokens
+        self.truncate_target = truncate_target
+        self.incremental = incremental
+        self.stop_rule = stop_rule
+        self.reset()
+
+    def reset(self):
+        self.messages: List[Dict] = [{"role": "system", "content": self.system_prompt}] if self.system_prompt else []
+        self.cache = None
+        self.cached_ids: List[int] = []
+
+    def _prompt_ids(self) -> List[int]:
+        return self.tokenizer.apply_chat_template(self.messages, tokenize=True, add_generation_prompt=True)
+
+    def _fit_window(self) -> Tuple[List[int], int]:
+        """Ids du prompt, après retrait des plus anciens échanges si le budget est dépassé"""
+        ids = self._prompt_ids()
+        if len(ids) + self.max_new_tokens <= self.max_context_tokens:
+            return ids, 0
+
+        first = 1 if self.system_prompt else 0
+        target = int(self.max_context_tokens * self.truncate_target)
+        dropped = 0
+        # Le dernier message (tour utilisateur en cours) est toujours gardé
+        while len(ids) + self.max_new_tokens > target and len(self.messages) - first > 1:
+            del self.messages[first]
+            dropped += 1
+            if len(self.messages) - first > 1 and self.messages[first]["role"] == "assistant":
+                del self.messages[first]
+                dropped += 1
+            ids = self._prompt_ids()
+        if len(ids) + self.max_new_tokens > self.max_context_tokens:
+            print(f"\n⚠️ Le dernier tour seul dépasse le budget ({len(ids)} + {self.max_new_tokens} tokens)")
+        return ids, dropped
+
+    def send(self, user_text: str, streamer: Optional[TimingStreamer] = None, seed: Optional[int] = None) -> Dict:
+        """
+        Ajoute un tour utilisateur, génère la réponse et l'ajoute à l'historique
+
+        Returns:
+            dict avec response, latency + métriques (prompt_tokens = historique complet,
+            prefill_tokens = tokens réellement encodés, reused_tokens, dropped_messages)
+        """
+        self.messages.append({"role": "user", "content": user_text})
+        ids, dropped = self._fit_window()
+
+        reused = 0
+        if self.incremental and self.cache is not None:
+            # Au moins un token à encoder pour obtenir les logits du prochain token
+            reused = min(common_prefix_length(self.cached_ids, ids), len(ids) - 1)
+        if reused:
+            self.cache.crop(reused)
+        else:
+            self.cache = DynamicCache()
+
+        inputs = torch.tensor([ids], device=self.model.device)
+        if seed is not None:
+            torch.manual_seed(seed)
+        reset_peak_memory()
+        streamer = streamer or TimingStreamer()
+        stopping_criteria, _ = build_stopping(self.tokenizer, len(ids), self.stop_rule)
+        with torch.no_grad():
+            outputs = self.model.generate(
+                inputs,
+                attention_mask=torch.ones_like(inputs),
+                **{**GENERATION_KWARGS, "max_new_tokens": self.max_new_tokens},
+                stopping_criteria=stopping_criteria,
+                past_key_values=self.cache,
+                pad_token_id=self.tokenizer.eos_token_id,
+                streamer=streamer,
+            )
+
+        generated = outputs[0][len(ids):]
+        response = self.tokenizer.decode(generated, skip_special_tokens=True).strip()
+        self.messages.append({"role": "assistant", "content": response})
+        # `generate` remplit le cache en place ; le dernier token généré n'y est pas encore
+        self.cached_ids = outputs[0].tolist()[: self.cache.get_seq_length()]
+
+        return {
+            "response": response,
+            "latency": streamer.latency,
+            **generation_metrics(streamer, len(ids), count_generated_tokens(generated, self.tokenizer.eos_token_id)),
+            "prefill_tokens": len(ids) - reused,
+            "reused_tokens": reused,
+            "dropped_messages": dropped,
+        }
+
+
+def load_chat_script(path: str, limit: Optional[int] = None) -> List[Dict]:
+    """Dialogues du JSONL : prompt système + tours utilisateur (les réponses du dataset sont ignorées)"""
+    dialogues = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            messages = json.loads(line)["messages"]
+            system = next((m["content"] for m in messages if m["role"] == "system"), CHAT_SYSTEM_PROMPT)
+            turns = [m["content"] for m in messages if m["role"] == "user"]
+            if turns:
+                dialogues.append({"system": system, "turns": turns})
+            if limit is not None and len(dialogues) >= limit:
+                break
+    return dialogues
+
+
+def run_chat_script(
+    model,
+    tokenizer,
+    path: str = CHAT_DATASET,
+    limit: Optional[int] = None,
+    max_context_tokens: int = CHAT_MAX_CONTEXT_TOKENS,
+    incremental: bool = True,
+    seed: Optional[int] = None,
+    save_results: bool = True,
+    stop_rule: Optional[str] = None,
+):
+    """
+    Rejoue les dialogues d'un JSONL tour par tour et mesure la latence par rang de tour
+
+    Avec le cache incrémental, latence et tokens encodés doivent rester stables quand
+    la conversation s'allonge (comparer avec incremental=False).
+    """
+    dialogues = load_chat_script(path, limit)
+    print("\n" + "="*60)
+    print(f"💬 CHAT MULTI-TOURS - {len(dialogues)} dialogues ({'cache incrémental' if incremental else 'réencodage complet'})")
+    print("="*60)
+
+    all_turns = []
+    for d, dialogue in enumerate(dialogues, 1):
+        session = ChatSession(
+            model, tokenizer, dialogue["system"], max_context_tokens, incremental=incremental, stop_rule=stop_rule
+        )
+        print(f"\n[{d}/{len(dialogues)}] {len(dialogue['turns'])} tours")
+        for t, user_text in enumerate(dialogue["turns"], 1):
+            turn = session.send(user_text, seed=seed)
+            print(
+                f"  tour {t}: {turn['latency']:.2f}s, {turn['prefill_tokens']}/{turn['prompt_tokens']} tokens encodés"
+                + (f", {turn['dropped_messages']} messages retirés" if turn["dropped_messages"] else "")
+            )
+            all_turns.append({"dialogue": d, "turn": t, "user": user_text, **turn})
+
+    print("\n" + "="*60)
+    print("📊 LATENCE PAR RANG DE TOUR")
+    print("="*60)
+    print(f"{'Tour':>5} {'n':>4} {'Latence':>9} {'TTFT':>8} {'Historique':>11} {'Encodés':>9}")
+    by_turn = {}
+    for t in sorted({r["turn"] for r in all_turns}):
+        rows = [r for r in all_turns if r["turn"] == t]
+        by_turn[t] = {
+            "count": len(rows),
+            "avg_latency": mean([r["latency"] for r in rows]),
+            "avg_ttft": mean([r["ttft"] for r in rows]),
+            "avg_prompt_tokens": mean([r["prompt_tokens"] for r in rows]),
+            "avg_prefill_tokens": mean([r["prefill_tokens"] for r in rows]),
+        }
+        stats = by_turn[t]
+        print(
+            f"{t:>5} {stats['count']:>4} {stats['avg_latency']:>8.2f}s {stats['avg_ttft'] or 0:>7.3f}s "
+            f"{stats['avg_prompt_tokens']:>11.0f} {stats['avg_prefill_tokens']:>9.0f}"
+        )
+
+    prompt_tokens = sum(r["prompt_tokens"] for r in all_turns)
+    prefill_tokens = sum(r["prefill_tokens"] for r in all_turns)
+    summary = {
+        "dialogues": len(dialogues),
+        "turns": len(all_turns),
+        "incremental": incremental,
+        "max_context_tokens": max_context_tokens,
+        "stop_rule": stop_rule,
+        "avg_latency": mean([r["latency"] for r in all_turns]),
+        "output_tokens": sum(r["output_tokens"] for r in all_turns),
+        "prompt_tokens": prompt_tokens,
+        "prefill_tokens": prefill_tokens,
+        "reuse_rate": 1 - prefill_tokens / prompt_tokens if prompt_tokens else None,
+        "by_turn": by_turn,
+    }
+    if summary["reuse_rate"] is not None:
+        print(f"\nTokens d'historique réutilisés depuis le cache: {summary['reuse_rate']:.0%}")
+
+    if save_results:
+        output_file = "./chat_results.json"
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump({"summary": summary, "turns": all_turns}, f, indent=2, ensure_ascii=False)
+        print(f"\n✅ Résultats sauvegardés: {output_file}")
+
+    return all_turns
+
+
+def interactive_chat(
+    model,
+    tokenizer,
+    system_prompt: str = CHAT_SYSTEM_PROMPT,
+    max_context_tokens: int = CHAT_MAX_CONTEXT_TOKENS,
+    incremental: bool = True,
+    seed: Optional[int] = None,
+    stop_rule: Optional[str] = None,
+):
+    """Chat en console, réponse affichée token par token ; /reset vide l'historique, /quit sort"""
+    session = ChatSession(model, tokenizer, system_prompt, max_context_tokens, incremental=incremental, stop_rule=stop_rule)
+    print("\n💬 Chat interactif (/reset pour recommencer, /quit pour sortir)")
+    while True:
+        try:
+            user_text = input("\n🧑 ").strip()
+        except EOFError:
+            break
+        if not user_text:
+            continue
+        if user_text == "/quit":
+            break
+        if user_text == "/reset":
+            session.reset()
+            print("🔄 Historique vidé")
+            continue
+
+        print("🤖 ", end="", flush=True)
+        turn = session.send(user_text, streamer=PrintingStreamer(tokenizer), seed=seed)
+        print(
+            f"   ⏱️ {turn['latency']:.2f}s (TTFT {turn['ttft'] or 0:.2f}s), "
+            f"{turn['prefill_tokens']}/{turn['prompt_tokens']} tokens encodés"
+            + (f", {turn['dropped_messages']} messages anciens retirés" if turn["dropped_messages"] else "")
+        )
+
+
+def test_schema(
+    model,
+    tokenizer,
+    philosopher: str,
+    question: Dict,
+    verbose: bool = True,
+    prefix_cache: bool = False,
+    generation_cache: Optional[GenerationCache] = None,
+    seed: Optional[int] = None,
+    draft_model=None,
+    stop_rule: Optional[str] = None,
+    force_conclusion: bool = False,
+):
+    """
+    Teste l'application d'un schème logique
+
+    Args:
+        prefix_cache: réutilise le KV-cache du prompt système (voir PrefixKVCache)
+        generation_cache: renvoie la génération déjà en cache pour ce prompt/ces paramètres
+        seed: fixe le tirage avant la génération (reproductible, fait partie de la clé de cache)
+        draft_model: décodage assisté, le draft propose et le modèle cible vérifie
+        stop_rule: règle de STOP_RULES (arrêt anticipé + budget de tokens)
+        force_conclusion: la réponse commence par CONCLUSION_PREFIX, placé dans le prompt, suivi
+            d'un nouveau mot (voir WordBoundary)
+
+    Returns:
+        dict avec résultats (response, latency, correct) + métriques
+        (ttft, decode_tokens_per_s, prompt_tokens, output_tokens, peak_memory_mb,
+        et en décodage assisté target_steps, draft_tokens, accepted_tokens, acceptance_rate)
+    """
     # Tokeniser
+    messages = build_messages(question)
+
+    cache_key = None
+    if generation_cache is not None:
+        prompt_text = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        cache_kwargs = {**GENERATION_KWARGS, **decoding_options(stop_rule, force_conclusion)}
+        if draft_model is not None:
+            cache_kwargs["assistant_model"] = draft_model.name_or_path
+        cache_key = generation_cache.key(prompt_text, cache_kwargs, seed)
+        cached = generation_cache.get(cache_key)
+        if cached is not None:
+            return build_result(
+                philosopher, question, cached["response"], cached["latency"], verbose, {**cached["metrics"], "cached": True}
+            )
+
     inputs = tokenizer.apply_chat_template(
         messages,
         tokenize=True,
@@ -124,24 +1187,83 @@ def test_schema(model, tokenizer, philosopher: str, question: Dict, verbose: boo
         return_tensors="pt"
     ).to(model.device)
 
+    # Début de réponse imposé : ses tokens sont encodés avec le prompt, pas générés
+    response_start = inputs.shape[1]
+    forced = continuation_ids(tokenizer, question, inputs[0].tolist(), CONCLUSION_PREFIX) if force_conclusion else []
+    if forced:
+        inputs = torch.cat([inputs, torch.tensor([forced], device=inputs.device)], dim=1)
+    stopping_criteria, overrides = build_stopping(
+        tokenizer, inputs.shape[1], stop_rule, CONCLUSION_PREFIX if force_conclusion else ""
+    )
+    logits_processor = forced_start_processors(tokenizer, inputs.shape[1], [forced])
+
+    cache_kwargs = {}
+    cached_tokens = 0
+    if prefix_cache:
+        cache = get_prefix_cache(model, tokenizer, messages[0]["content"])
+        if cache.matches(inputs):
+            cache_kwargs["past_key_values"] = cache.copy()
+            cached_tokens = len(cache.prefix_ids)
+    if draft_model is not None:
+        cache_kwargs["assistant_model"] = draft_model
+
     # Générer
-    start_time = time.time()
+    if seed is not None:
+        torch.manual_seed(seed)
+    reset_peak_memory()
+    streamer = TimingStreamer()
+    counter = DraftCounter(draft_model) if draft_model is not None else contextlib.nullcontext()
 
-    with torch.no_grad():
+    with torch.no_grad(), counter:
         outputs = model.generate(
             inputs,
-            max_new_tokens=128,
-            do_sample=True,
-            temperature=0.7,
-            top_p=0.9,
+            attention_mask=torch.ones_like(inputs),
+            **{**GENERATION_KWARGS, **overrides},
+            **cache_kwargs,
+            stopping_criteria=stopping_criteria,
+            logits_processor=logits_processor,
             pad_token_id=tokenizer.eos_token_id,
+            streamer=streamer,
         )
 
-    latency = time.time() - start_time
+    latency = streamer.latency
+
+    # Décoder (la réponse inclut le début imposé)
+    generated = outputs[0][inputs.shape[1]:]
+    response = tokenizer.decode(outputs[0][response_start:], skip_special_tokens=True).strip()
+    metrics = generation_metrics(
+        streamer,
+        prompt_tokens=response_start,
+        output_tokens=count_generated_tokens(generated, tokenizer.eos_token_id),
+    )
+    if prefix_cache:
+        metrics["cached_prefix_tokens"] = cached_tokens
+    if force_conclusion:
+        metrics["forced_tokens"] = inputs.shape[1] - response_start
+    if draft_model is not None:
+        metrics.update(speculative_metrics(streamer, counter, metrics["output_tokens"]))
+    if generation_cache is not None:
+        generation_cache.put(cache_key, {"response": response, "latency": latency, "metrics": metrics})
+
+    return build_result(philosopher, question, response, latency, verbose, metrics)
 
-    # Décoder
-    response = tokenizer.decode(outputs[0][inputs.shape[1]:], skip_special_tokens=True).strip()
 
+def build_messages(question: Dict) -> List[Dict]:
+    prompt = f"Schème : {question['schema']}\nContexte : {question['context']}\nApplique le schème :"
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def build_result(
+    philosopher: str,
+    question: Dict,
+    response: str,
+    latency: float,
+    verbose: bool = True,
+    metrics: Optional[Dict] = None,
+) -> Dict:
     # Vérifier si correct (simple check si conclusion présente)
     correct = question['expected'].lower() in response.lower()
 
@@ -153,6 +1275,17 @@ def test_schema(model, tokenizer, philosopher: str, question: Dict, verbose: boo
         print(f"\nAttendu: {question['expected']}")
         print(f"Réponse: {response}")
         print(f"Latence: {latency:.2f}s")
+        if metrics and metrics.get("ttft") is not None:
+            tokens_per_s = metrics["decode_tokens_per_s"]
+            print(
+                f"TTFT: {metrics['ttft']:.2f}s | Décodage: {tokens_per_s or 0:.1f} tok/s | "
+                f"Tokens: {metrics['prompt_tokens']} prompt + {metrics['output_tokens']} sortie"
+            )
+        if metrics and metrics.get("acceptance_rate") is not None:
+            print(
+                f"Draft: {metrics['accepted_tokens']}/{metrics['draft_tokens']} tokens acceptés "
+                f"({metrics['acceptance_rate']:.0%}), {metrics['target_steps']} passes du modèle cible"
+            )
         print(f"Correct: {'✅' if correct else '❌'}")
 
     return {
@@ -161,27 +1294,184 @@ def test_schema(model, tokenizer, philosopher: str, question: Dict, verbose: boo
         "response": response,
         "latency": latency,
         "correct": correct,
+        **(metrics or {}),
+    }
+
+
+def test_schema_batch(
+    model,
+    tokenizer,
+    items: List[Tuple[str, Dict]],
+    batch_size: int,
+    verbose: bool = True,
+    generation_cache: Optional[GenerationCache] = None,
+    seed: Optional[int] = None,
+    stop_rule: Optional[str] = None,
+    force_conclusion: bool = False,
+):
+    """
+    Teste plusieurs questions avec un seul `generate` par lot
+
+    Les prompts sont triés par longueur puis découpés en lots de `batch_size` :
+    chaque lot regroupe des longueurs voisines, ce qui limite le padding (à gauche,
+    pour que la génération reparte de la fin de chaque prompt). La latence
+    rapportée pour une question est celle du lot qui l'a traitée. Les questions
+    déjà présentes dans `generation_cache` ne sont pas envoyées au modèle.
+    `stop_rule` et `force_conclusion` : voir test_schema (arrêt décidé ligne par ligne).
+
+    Returns:
+        liste de dicts (même format que test_schema), dans l'ordre de `items`
+    """
+    results = [None] * len(items)
+    cache_keys = [None] * len(items)
+    pending = []
+    for i, (philosopher, question) in enumerate(items):
+        if generation_cache is not None:
+            prompt_text = tokenizer.apply_chat_template(build_messages(question), tokenize=False, add_generation_prompt=True)
+            cache_keys[i] = generation_cache.key(
+                prompt_text, {**GENERATION_KWARGS, **decoding_options(stop_rule, force_conclusion)}, seed, batch_size
+            )
+            cached = generation_cache.get(cache_keys[i])
+            if cached is not None:
+                results[i] = build_result(
+                    philosopher, question, cached["response"], cached["latency"], verbose, {**cached["metrics"], "cached": True}
+                )
+                continue
+        pending.append(i)
+
+    prompts = {
+        i: tokenizer.apply_chat_template(build_messages(items[i][1]), tokenize=True, add_generation_prompt=True)
+        for i in pending
     }
+    forced = {
+        i: continuation_ids(tokenizer, items[i][1], prompts[i], CONCLUSION_PREFIX) if force_conclusion else []
+        for i in pending
+    }
+    order = sorted(pending, key=lambda i: len(prompts[i]))
+
+    padding_side = tokenizer.padding_side
+    tokenizer.padding_side = "left"
+    try:
+        for start in range(0, len(order), batch_size):
+            bucket = order[start:start + batch_size]
+            batch = tokenizer.pad(
+                {"input_ids": [prompts[i] + forced[i] for i in bucket]},
+                return_tensors="pt",
+            ).to(model.device)
+            stopping_criteria, overrides = build_stopping(
+                tokenizer, batch["input_ids"].shape[1], stop_rule, CONCLUSION_PREFIX if force_conclusion else ""
+            )
+            logits_processor = forced_start_processors(tokenizer, batch["input_ids"].shape[1], [forced[i] for i in bucket])
+
+            if seed is not None:
+                torch.manual_seed(seed)
+            reset_peak_memory()
+            streamer = TimingStreamer()
+            with torch.no_grad():
+                outputs = model.generate(
+                    **batch,
+                    **{**GENERATION_KWARGS, **overrides},
+                    stopping_criteria=stopping_criteria,
+                    logits_processor=logits_processor,
+                    pad_token_id=tokenizer.eos_token_id,
+                    streamer=streamer,
+                )
+            latency = streamer.latency
+
+            prompt_length = batch["input_ids"].shape[1]
+            for row, i in enumerate(bucket):
+                philosopher, question = items[i]
+                generated = outputs[row][prompt_length:]
+                response_ids = outputs[row][prompt_length - len(forced[i]):]
+                response = tokenizer.decode(response_ids, skip_special_tokens=True).strip()
+                metrics = generation_metrics(
+                    streamer,
+                    prompt_tokens=len(prompts[i]),
+                    output_tokens=count_generated_tokens(generated, tokenizer.eos_token_id),
+                )
+                if force_conclusion:
+                    metrics["forced_tokens"] = len(forced[i])
+                if generation_cache is not None:
+                    generation_cache.put(cache_keys[i], {"response": response, "latency": latency, "metrics": metrics})
+                results[i] = build_result(philosopher, question, response, latency, verbose, metrics)
+    finally:
+        tokenizer.padding_side = padding_side
 
+    return results
 
-def run_benchmarks(model, tokenizer, save_results: bool = True):
+
+def run_benchmarks(
+    model,
+    tokenizer,
+    save_results: bool = True,
+    batch_size: int = 1,
+    prefix_cache: bool = False,
+    generation_cache: Optional[GenerationCache] = None,
+    seed: Optional[int] = None,
+    draft_model=None,
+    stop_rule: Optional[str] = None,
+    force_conclusion: bool = False,
+):
     """
     Lance tous les benchmarks et affiche les résultats
+
+    Args:
+        batch_size: > 1 pour générer les questions par lots (voir test_schema_batch)
+        prefix_cache: réutilise le KV-cache du prompt système (mode séquentiel)
+        generation_cache: ne régénère que les questions absentes du cache ; ignoré en
+            échantillonnage sans seed (réponses non reproductibles)
+        seed: seed de génération (partie de la clé de cache)
+        draft_model: décodage assisté (mode séquentiel) ; les questions réellement
+            générées avec le draft sont regénérées sans pour mesurer le speedup
+        stop_rule, force_conclusion: arrêt anticipé et début de réponse imposé (voir test_schema)
     """
     print("\n" + "="*60)
     print("🎯 BENCHMARKS - Application Schèmes Logiques")
     print("="*60)
 
+    if generation_cache is not None and not is_cacheable(GENERATION_KWARGS, seed):
+        print("⚠️ Échantillonnage sans --seed : cache de génération désactivé (réponses non reproductibles)")
+        generation_cache = None
+
     all_results = []
 
-    # Tester chaque philosophe
-    for philosopher, questions in TEST_QUESTIONS.items():
-        print(f"\n📚 Test {philosopher.upper()} ({len(questions)} questions)")
+    if batch_size > 1:
+        items = [
+            (philosopher, question)
+            for philosopher, questions in TEST_QUESTIONS.items()
+            for question in questions
+        ]
+        print(f"\n📦 Génération par lots de {batch_size} ({len(items)} questions)")
+        all_results = test_schema_batch(
+            model,
+            tokenizer,
+            items,
+            batch_size,
+            generation_cache=generation_cache,
+            seed=seed,
+            stop_rule=stop_rule,
+            force_conclusion=force_conclusion,
+        )
+    else:
+        # Tester chaque philosophe
+        for philosopher, questions in TEST_QUESTIONS.items():
+            print(f"\n📚 Test {philosopher.upper()} ({len(questions)} questions)")
 
-        for i, question in enumerate(questions, 1):
-            print(f"\n[{i}/{len(questions)}]", end=" ")
-            result = test_schema(model, tokenizer, philosopher, question)
-            all_results.append(result)
+            for i, question in enumerate(questions, 1):
+                print(f"\n[{i}/{len(questions)}]", end=" ")
+                result = test_schema(
+                    model,
+                    tokenizer,
+                    philosopher,
+                    question,
+                    prefix_cache=prefix_cache,
+                    generation_cache=generation_cache,
+                    seed=seed,
+                    draft_model=draft_model,
+                    stop_rule=stop_rule,
+                    force_conclusion=force_conclusion,
+                )
+                all_results.append(result)
 
     # Statistiques globales
     print("\n" + "="*60)
@@ -191,10 +1481,49 @@ def run_benchmarks(model, tokenizer, save_results: bool = True):
     total = len(all_results)
     correct = sum(1 for r in all_results if r['correct'])
     avg_latency = sum(r['latency'] for r in all_results) / total
+    summary = {
+        "total": total,
+        "correct": correct,
+        "accuracy": correct / total,
+        "avg_latency": avg_latency,
+        **latency_summary(all_results),
+    }
+    if stop_rule is not None:
+        summary["stop_rule"] = stop_rule
+    if force_conclusion:
+        summary["forced_prefix"] = CONCLUSION_PREFIX
+    if generation_cache is not None:
+        summary["cache_hits"] = generation_cache.hits
+        summary["cache_hit_rate"] = generation_cache.hit_rate
+    if draft_model is not None:
+        summary.update(speculative_summary(model, tokenizer, all_results, seed, stop_rule, force_conclusion))
 
     print(f"Total questions: {total}")
     print(f"Réponses correctes: {correct}/{total} ({100*correct/total:.1f}%)")
     print(f"Latence moyenne: {avg_latency:.2f}s")
+    print(
+        f"Latence p50/p95/p99: {summary['p50_latency']:.2f}s / "
+        f"{summary['p95_latency']:.2f}s / {summary['p99_latency']:.2f}s"
+    )
+    if summary["avg_ttft"] is not None:
+        print(f"TTFT moyen: {summary['avg_ttft']:.2f}s")
+    if summary["avg_decode_tokens_per_s"] is not None:
+        print(f"Décodage moyen: {summary['avg_decode_tokens_per_s']:.1f} tok/s")
+    if summary["peak_memory_mb"] is not None:
+        print(f"Pic mémoire: {summary['peak_memory_mb']:.0f} MB")
+    if generation_cache is not None:
+        print(f"Cache de génération: {generation_cache.hits}/{total} hits ({100*(generation_cache.hit_rate or 0):.0f}%)")
+    if summary.get("acceptance_rate") is not None:
+        print(
+            f"Décodage assisté: {summary['acceptance_rate']:.0%} des tokens draft acceptés, "
+            f"{summary['tokens_per_target_step']:.2f} tokens par passe du modèle cible"
+        )
+    if summary.get("speedup") is not None:
+        print(
+            f"Speedup: x{summary['speedup']:.2f} en temps de décodage par token "
+            f"({1000 * summary['baseline_s_per_token']:.1f} ms sans draft, "
+            f"{1000 * summary['assisted_s_per_token']:.1f} ms avec)"
+        )
 
     # Par philosophe
     print("\nPar philosophe:")
@@ -209,12 +1538,7 @@ def run_benchmarks(model, tokenizer, save_results: bool = True):
         output_file = "./benchmark_results.json"
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump({
-                "summary": {
-                    "total": total,
-                    "correct": correct,
-                    "accuracy": correct / total,
-                    "avg_latency": avg_latency,
-                },
+                "summary": summary,
                 "results": all_results,
             }, f, indent=2, ensure_ascii=False)
         print(f"\n✅ Résultats sauvegardés: {output_file}")
@@ -222,6 +1546,399 @@ def run_benchmarks(model, tokenizer, save_results: bool = True):
     return all_results
 
 
+def speculative_summary(
+    model,
+    tokenizer,
+    results: List[Dict],
+    seed: Optional[int] = None,
+    stop_rule: Optional[str] = None,
+    force_conclusion: bool = False,
+) -> Dict:
+    """
+    Agrège les métriques du décodage assisté et mesure le speedup
+
+    Les questions générées avec le draft sont regénérées sans (mêmes paramètres et
+    seed, sans cache). Le speedup compare le temps de décodage par token de sortie :
+    les deux passes tirent des réponses de longueurs différentes, un ratio de
+    latences ne serait pas à travail égal. Les réponses venues du cache n'ont pas de
+    compteurs draft : ignorées, et pas de référence si aucune n'a été assistée.
+    """
+    assisted = [r for r in results if r.get("draft_tokens") is not None and not r.get("cached")]
+    if not assisted:
+        print("\n⚡ Aucune réponse générée avec le draft (toutes en cache) : pas de mesure de speedup")
+        return {}
+    drafted = sum(r["draft_tokens"] for r in assisted)
+    accepted = sum(r["accepted_tokens"] for r in assisted)
+    steps = sum(r["target_steps"] for r in assisted)
+
+    print("\n⏱️ Référence sans draft (speedup)...")
+    questions = {(r["philosopher"], r["schema"]) for r in assisted}
+    baseline = [
+        test_schema(
+            model,
+            tokenizer,
+            philosopher,
+            question,
+            verbose=False,
+            seed=seed,
+            stop_rule=stop_rule,
+            force_conclusion=force_conclusion,
+        )
+        for philosopher, philosopher_questions in TEST_QUESTIONS.items()
+        for question in philosopher_questions
+        if (philosopher, question["schema"]) in questions
+    ]
+    baseline_per_token = seconds_per_decode_token(baseline)
+    assisted_per_token = seconds_per_decode_token(assisted)
+
+    return {
+        "acceptance_rate": accepted / drafted if drafted else None,
+        "tokens_per_target_step": sum(r["output_tokens"] for r in assisted) / steps if steps else None,
+        "baseline_s_per_token": baseline_per_token,
+        "assisted_s_per_token": assisted_per_token,
+        "speedup": baseline_per_token / assisted_per_token if baseline_per_token and assisted_per_token else None,
+    }
+
+
+def seconds_per_decode_token(results: List[Dict]) -> Optional[float]:
+    """Temps de décodage total / tokens décodés (après le premier), toutes réponses confondues"""
+    timed = [(r["output_tokens"] - 1, r["decode_tokens_per_s"]) for r in results if r.get("decode_tokens_per_s")]
+    tokens = sum(n for n, _ in timed)
+    return sum(n / rate for n, rate in timed) / tokens if tokens else None
+
+
+def latency_summary(results: List[Dict]) -> Dict:
+    latencies = [r['latency'] for r in results]
+    peaks = [r.get('peak_memory_mb') for r in results if r.get('peak_memory_mb') is not None]
+    return {
+        "p50_latency": percentile(latencies, 50),
+        "p95_latency": percentile(latencies, 95),
+        "p99_latency": percentile(latencies, 99),
+        "avg_ttft": mean([r.get('ttft') for r in results]),
+        "avg_decode_tokens_per_s": mean([r.get('decode_tokens_per_s') for r in results]),
+        "total_prompt_tokens": sum(r.get('prompt_tokens') or 0 for r in results),
+        "total_output_tokens": sum(r.get('output_tokens') or 0 for r in results),
+        "peak_memory_mb": max(peaks) if peaks else None,
+    }
+
+
+COMPARE_METRICS = [
+    ("accuracy", "Accuracy", "{:.1%}"),
+    ("avg_latency", "Latence moyenne", "{:.2f}s"),
+    ("p50_latency", "Latence p50", "{:.2f}s"),
+    ("p95_latency", "Latence p95", "{:.2f}s"),
+    ("p99_latency", "Latence p99", "{:.2f}s"),
+    ("avg_ttft", "TTFT moyen", "{:.2f}s"),
+    ("avg_decode_tokens_per_s", "Décodage", "{:.1f} tok/s"),
+    ("total_output_tokens", "Tokens générés", "{:.0f}"),
+    ("peak_memory_mb", "Pic mémoire", "{:.0f} MB"),
+    ("acceptance_rate", "Acceptation draft", "{:.1%}"),
+    ("speedup", "Speedup draft", "x{:.2f}"),
+]
+
+
+ADAPTER_METRICS = {
+    "generation": [
+        ("accuracy", "Accuracy", "{:.1%}"),
+        ("avg_latency", "Latence", "{:.2f}s"),
+        ("p95_latency", "p95", "{:.2f}s"),
+        ("avg_decode_tokens_per_s", "tok/s", "{:.1f}"),
+        ("total_output_tokens", "Tokens", "{:.0f}"),
+    ],
+    "scoring": [
+        ("accuracy", "Accuracy", "{:.1%}"),
+        ("mean_logprob", "Logprob/token", "{:.3f}"),
+        ("token_accuracy", "Tokens corrects", "{:.1%}"),
+    ],
+}
+
+
+def adapter_summary(results: List[Dict], scoring: bool = False) -> Dict:
+    total = len(results)
+    correct = sum(1 for r in results if r["correct"])
+    summary = {"total": total, "correct": correct, "accuracy": correct / total if total else None}
+    if scoring:
+        summary["mean_logprob"] = mean([r["mean_logprob"] for r in results])
+        summary["token_accuracy"] = mean([r["token_accuracy"] for r in results])
+    else:
+        summary["avg_latency"] = mean([r["latency"] for r in results])
+        summary.update(latency_summary(results))
+    return summary
+
+
+def evaluate_adapters(model, adapters: Dict[str, Optional[str]], evaluate, scoring: bool = False, save_results: bool = True):
+    """
+    Évalue chaque adapter sur le même modèle chargé et produit un rapport combiné
+
+    Changer d'adapter ne fait qu'activer d'autres couches LoRA : le modèle base n'est
+    ni rechargé ni re-quantifié entre deux checkpoints.
+
+    Args:
+        adapters: {nom: chemin} (voir discover_adapters), chemin None = modèle base
+        evaluate: appelée pour chaque adapter avec son identifiant de cache
+            ("base" ou adapter_hash), renvoie les résultats par question
+        scoring: résultats de run_scoring (sinon de run_benchmarks)
+
+    Returns:
+        {nom: {"path", "summary", "results"}}
+    """
+    report = {}
+    for name, path in adapters.items():
+        print("\n" + "#"*60)
+        print(f"🔀 ADAPTER {name}" + (f" ({path})" if path else " (modèle base, LoRA désactivés)"))
+        print("#"*60)
+        with active_adapter(model, name if path else None):
+            results = evaluate(adapter_hash(path) if path else "base")
+        report[name] = {"path": path, "summary": adapter_summary(results, scoring), "results": results}
+
+    print_adapter_report(report, scoring)
+
+    if save_results:
+        output_file = "./adapter_results.json"
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(
+                {"mode": "scoring" if scoring else "generation", "adapters": report},
+                f, indent=2, ensure_ascii=False,
+            )
+        print(f"\n✅ Résultats sauvegardés: {output_file}")
+
+    return report
+
+
+def print_adapter_report(report: Dict[str, Dict], scoring: bool = False):
+    """Une ligne par adapter ; ⭐ = meilleure accuracy (départagée par le logprob en scoring)"""
+    metrics = ADAPTER_METRICS["scoring" if scoring else "generation"]
+    tie_break = "mean_logprob" if scoring else "avg_latency"
+    sign = 1 if scoring else -1  # logprob : plus haut = mieux ; latence : plus bas = mieux
+    best = max(
+        report,
+        key=lambda name: (
+            report[name]["summary"]["accuracy"] or 0,
+            sign * (report[name]["summary"].get(tie_break) or 0),
+        ),
+    )
+
+    width = max(len(name) for name in report) + 2
+    print("\n" + "="*60)
+    print("📊 COMPARAISON DES ADAPTERS")
+    print("="*60)
+    print(f"{'Adapter':<{width}}" + "".join(f"{label:>16}" for _, label, _ in metrics))
+    for name, entry in report.items():
+        cells = []
+        for key, _, fmt in metrics:
+            value = entry["summary"].get(key)
+            cells.append(f"{fmt.format(value) if value is not None else '-':>16}")
+        print(f"{name:<{width}}" + "".join(cells) + (" ⭐" if name == best else ""))
+
+
+def compare_results(baseline_file: str, candidate_file: str):
+    """
+    Compare deux benchmark_results.json (ex : deux versions du LoRA)
+
+    Affiche l'écart sur chaque métrique du résumé puis, question par question
+    (appariées par philosophe + schème), les changements de correction et de latence.
+    """
+    with open(baseline_file, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(candidate_file, encoding='utf-8') as f:
+        candidate = json.load(f)
+
+    # Les anciens fichiers n'ont que la latence : on recalcule ce qui peut l'être
+    for data in (baseline, candidate):
+        data["summary"] = {**latency_summary(data["results"]), **data["summary"]}
+
+    print("\n" + "="*60)
+    print(f"🔍 COMPARAISON: {baseline_file} → {candidate_file}")
+    print("="*60)
+
+    for key, label, fmt in COMPARE_METRICS:
+        before, after = baseline["summary"].get(key), candidate["summary"].get(key)
+        if before is None or after is None:
+            continue
+        delta = f" ({(after - before) / before:+.1%})" if before else ""
+        print(f"{label:<18}: {fmt.format(before):>12} → {fmt.format(after):>12}{delta}")
+
+    before_by_key = {(r['philosopher'], r['schema']): r for r in baseline["results"]}
+    print("\nPar question:")
+    for r in candidate["results"]:
+        old = before_by_key.get((r['philosopher'], r['schema']))
+        if old is None:
+            print(f"  {r['philosopher'].upper()} / {r['schema']}: nouvelle question")
+            continue
+        status = ""
+        if old['correct'] != r['correct']:
+            status = " ✅ corrigée" if r['correct'] else " ❌ RÉGRESSION"
+        print(
+            f"  {r['philosopher'].upper()} / {r['schema']}: "
+            f"{old['latency']:.2f}s → {r['latency']:.2f}s{status}"
+        )
+
+
+def score_candidates(model, tokenizer, sequences: List[Tuple[List[int], List[int]]], batch_size: int = 32) -> List[Dict]:
+    """
+    Log-vraisemblance teacher-forced de continuations (une passe forward par lot)
+
+    Args:
+        sequences: paires (ids du prompt, ids de la continuation à scorer)
+        batch_size: séquences par forward (triées par longueur, padding à droite)
+
+    Returns:
+        pour chaque séquence : logprob (somme), mean_logprob (par token) et
+        token_accuracy (part des tokens de la continuation prédits en argmax)
+    """
+    scores = [None] * len(sequences)
+    order = sorted(range(len(sequences)), key=lambda i: len(sequences[i][0]) + len(sequences[i][1]))
+
+    padding_side = tokenizer.padding_side
+    tokenizer.padding_side = "right"
+    try:
+        for start in range(0, len(order), batch_size):
+            bucket = order[start:start + batch_size]
+            batch = tokenizer.pad(
+                {"input_ids": [sequences[i][0] + sequences[i][1] for i in bucket]},
+                return_tensors="pt",
+            ).to(model.device)
+
+            with torch.no_grad():
+                logits = model(**batch).logits
+
+            for row, i in enumerate(bucket):
+                prompt_ids, target_ids = sequences[i]
+                # Le logit en position t prédit le token t + 1
+                positions = slice(len(prompt_ids) - 1, len(prompt_ids) + len(target_ids) - 1)
+                log_probs = torch.log_softmax(logits[row, positions].float(), dim=-1)
+                targets = torch.tensor(target_ids, device=log_probs.device)
+                token_log_probs = log_probs.gather(1, targets.unsqueeze(1)).squeeze(1)
+                scores[i] = {
+                    "logprob": token_log_probs.sum().item(),
+                    "mean_logprob": token_log_probs.mean().item(),
+                    "token_accuracy": (log_probs.argmax(dim=-1) == targets).float().mean().item(),
+                }
+    finally:
+        tokenizer.padding_side = padding_side
+
+    return scores
+
+
+def continuation_ids(tokenizer, question: Dict, prompt_ids: List[int], answer: str) -> List[int]:
+    """
+    Tokens de `answer` tels que le chat template les place après le prompt
+
+    Le template peut ajouter un espace ou fusionner la frontière : on tokenise la
+    conversation complète et on garde ce qui suit le prompt (sans l'EOS final).
+    """
+    messages = build_messages(question) + [{"role": "assistant", "content": answer}]
+    full_ids = tokenizer.apply_chat_template(messages, tokenize=True)
+    if full_ids[:len(prompt_ids)] != prompt_ids:
+        return tokenizer.encode(answer, add_special_tokens=False)
+    target_ids = full_ids[len(prompt_ids):]
+    if target_ids and target_ids[-1] == tokenizer.eos_token_id:
+        target_ids = target_ids[:-1]
+    return target_ids
+
+
+def question_distractors(question: Dict, with_distractors: bool) -> List[str]:
+    """Champ `distractors` de la question + conclusions attendues des autres questions"""
+    if not with_distractors:
+        return []
+    distractors = list(question.get("distractors", []))
+    for questions in TEST_QUESTIONS.values():
+        for other in questions:
+            if other["expected"] != question["expected"] and other["expected"] not in distractors:
+                distractors.append(other["expected"])
+    return distractors
+
+
+def run_scoring(model, tokenizer, save_results: bool = True, batch_size: int = 32, with_distractors: bool = False):
+    """
+    Évalue les questions par log-vraisemblance de `expected` au lieu d'échantillonner
+
+    Une question coûte un prefill (prompt + conclusion) au lieu d'un décodage complet.
+    Avec `with_distractors`, chaque conclusion attendue est classée parmi des conclusions
+    concurrentes (score = logprob moyen par token, pour ne pas favoriser les plus courtes) :
+    la question est correcte si l'attendue arrive en tête. Sans distracteurs, elle est
+    correcte si tous ses tokens sont prédits en argmax.
+    """
+    print("\n" + "="*60)
+    print("🎯 SCORING - Log-vraisemblance des conclusions attendues")
+    print("="*60)
+
+    items = [
+        (philosopher, question)
+        for philosopher, questions in TEST_QUESTIONS.items()
+        for question in questions
+    ]
+
+    sequences = []
+    candidates = []
+    for philosopher, question in items:
+        prompt_ids = tokenizer.apply_chat_template(build_messages(question), tokenize=True, add_generation_prompt=True)
+        options = [question["expected"]] + question_distractors(question, with_distractors)
+        candidates.append(range(len(sequences), len(sequences) + len(options)))
+        for option in options:
+            sequences.append((prompt_ids, continuation_ids(tokenizer, question, prompt_ids, option)))
+
+    reset_peak_memory()
+    start = time.perf_counter()
+    scores = score_candidates(model, tokenizer, sequences, batch_size)
+    elapsed = time.perf_counter() - start
+
+    all_results = []
+    for (philosopher, question), indices in zip(items, candidates):
+        expected = scores[indices[0]]
+        result = {
+            "philosopher": philosopher,
+            "schema": question["schema"],
+            **expected,
+        }
+        if with_distractors:
+            rank = 1 + sum(scores[j]["mean_logprob"] > expected["mean_logprob"] for j in indices[1:])
+            result["rank"] = rank
+            result["candidates"] = len(indices)
+            result["correct"] = rank == 1
+        else:
+            result["correct"] = expected["token_accuracy"] == 1.0
+        all_results.append(result)
+
+        print(
+            f"  {philosopher.upper()} / {question['schema']}: logprob {expected['logprob']:.2f} "
+            f"({expected['mean_logprob']:.2f}/token), tokens corrects {expected['token_accuracy']:.0%}"
+            + (f", rang {result['rank']}/{result['candidates']}" if with_distractors else "")
+            + f" {'✅' if result['correct'] else '❌'}"
+        )
+
+    total = len(all_results)
+    correct = sum(1 for r in all_results if r["correct"])
+    summary = {
+        "total": total,
+        "correct": correct,
+        "accuracy": correct / total,
+        "mean_logprob": mean([r["mean_logprob"] for r in all_results]),
+        "token_accuracy": mean([r["token_accuracy"] for r in all_results]),
+        "sequences_scored": len(sequences),
+        "scoring_time": elapsed,
+        "peak_memory_mb": peak_memory_mb(),
+    }
+
+    print("\n" + "="*60)
+    print("📊 STATISTIQUES GLOBALES")
+    print("="*60)
+    print(f"Total questions: {total} ({len(sequences)} séquences scorées)")
+    label = "Conclusion attendue classée 1re" if with_distractors else "Conclusions prédites en entier"
+    print(f"{label}: {correct}/{total} ({100*correct/total:.1f}%)")
+    print(f"Logprob moyen par token: {summary['mean_logprob']:.3f}")
+    print(f"Tokens corrects (argmax): {100*summary['token_accuracy']:.1f}%")
+    print(f"Temps de scoring: {elapsed:.2f}s ({total / elapsed:.1f} questions/s)")
+
+    if save_results:
+        output_file = "./score_results.json"
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump({"summary": summary, "results": all_results}, f, indent=2, ensure_ascii=False)
+        print(f"\n✅ Résultats sauvegardés: {output_file}")
+
+    return all_results
+
+
 def main():
     """Point d'entrée principal"""
     import argparse
@@ -230,9 +1947,118 @@ def main():
     parser.add_argument("--lora", type=str, default=LORA_PATH, help="Chemin vers LoRA (None = base model)")
     parser.add_argument("--device", type=str, default="auto", choices=["auto", "cpu", "cuda"], help="Device")
     parser.add_argument("--no-save", action="store_true", help="Ne pas sauvegarder les résultats")
+    parser.add_argument(
+        "--cpu-dtype",
+        type=str,
+        default="int8",
+        choices=sorted(CPU_DTYPES),
+        help="Backend CPU : int8 (quantization dynamique), bf16 ou fp32",
+    )
+    parser.add_argument("--threads", type=int, default=None, help="Threads intra-op CPU (défaut: tous les cœurs disponibles)")
+    parser.add_argument("--interop-threads", type=int, default=1, help="Threads inter-op CPU")
+    parser.add_argument("--no-pin", action="store_true", help="Ne pas épingler les threads CPU aux cœurs")
+    parser.add_argument(
+        "--merged-cache",
+        nargs="?",
+        const=MERGED_CACHE_DIR,
+        default=None,
+        help=f"Met en cache le modèle mergé (défaut: {MERGED_CACHE_DIR}) et le recharge aux lancements suivants",
+    )
+    parser.add_argument("--batch-size", type=int, default=1, help="Questions générées par appel à generate (1 = séquentiel)")
+    parser.add_argument(
+        "--score",
+        action="store_true",
+        help="Mode scoring : log-vraisemblance teacher-forced des conclusions attendues, sans génération",
+    )
+    parser.add_argument(
+        "--distractors",
+        action="store_true",
+        help="En mode scoring, classe la conclusion attendue parmi celles des autres questions",
+    )
+    parser.add_argument("--score-batch-size", type=int, default=32, help="Séquences par forward en mode scoring")
+    parser.add_argument(
+        "--prefix-cache",
+        action="store_true",
+        help="Encode le prompt système une seule fois et réutilise son KV-cache (mode séquentiel)",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Seed de génération (rend les tirages reproductibles)")
+    parser.add_argument(
+        "--draft-model",
+        type=str,
+        default=None,
+        help="Petit modèle (même tokenizer) pour le décodage assisté ; rapporte acceptation et speedup",
+    )
+    parser.add_argument(
+        "--generation-cache",
+        nargs="?",
+        const=DEFAULT_CACHE_PATH,
+        default=None,
+        help=f"Cache SQLite des générations (défaut: {DEFAULT_CACHE_PATH})",
+    )
+    parser.add_argument(
+        "--generation-cache-mb",
+        type=int,
+        default=DEFAULT_MAX_BYTES // 1024**2,
+        help="Taille max du cache de génération (Mo, éviction LRU)",
+    )
+    parser.add_argument(
+        "--adapters",
+        nargs="+",
+        default=None,
+        metavar="[NOM=]CHEMIN",
+        help="Compare le modèle base et ces LoRA (ou les checkpoint-N d'un dossier de run) "
+        "sur un seul chargement du modèle base ; remplace --lora",
+    )
+    parser.add_argument(
+        "--early-stop",
+        action="store_true",
+        help="Arrêt anticipé : conclusion \"Donc ...\" terminée (schèmes), 3 phrases max (chat) ; voir STOP_RULES",
+    )
+    parser.add_argument(
+        "--force-conclusion",
+        action="store_true",
+        help=f"Impose le début de réponse \"{CONCLUSION_PREFIX}\" (forme des conclusions attendues)",
+    )
+    parser.add_argument("--chat", action="store_true", help="Chat interactif multi-tours (KV-cache gardé entre les tours)")
+    parser.add_argument(
+        "--chat-script",
+        nargs="?",
+        const=CHAT_DATASET,
+        default=None,
+        help=f"Rejoue les tours utilisateur des dialogues d'un JSONL (défaut: {CHAT_DATASET})",
+    )
+    parser.add_argument("--chat-limit", type=int, default=None, help="Nombre max de dialogues rejoués")
+    parser.add_argument(
+        "--chat-max-tokens",
+        type=int,
+        default=CHAT_MAX_CONTEXT_TOKENS,
+        help="Budget historique + réponse ; au-delà, les plus anciens échanges sont retirés",
+    )
+    parser.add_argument(
+        "--no-chat-cache",
+        action="store_true",
+        help="Réencode tout l'historique à chaque tour (référence pour mesurer le cache incrémental)",
+    )
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BASELINE", "CANDIDATE"),
+        help="Compare deux fichiers de résultats sans charger de modèle",
+    )
 
     args = parser.parse_args()
 
+    if args.draft_model and (args.batch_size > 1 or args.prefix_cache):
+        parser.error("--draft-model ne fonctionne qu'en mode séquentiel, sans --prefix-cache")
+    if (args.chat or args.chat_script) and args.adapters:
+        parser.error("--chat / --chat-script utilisent un seul modèle : incompatibles avec --adapters")
+    if args.adapters and args.merged_cache:
+        parser.error("--adapters garde les LoRA séparés du modèle base : incompatible avec --merged-cache")
+
+    if args.compare:
+        compare_results(*args.compare)
+        return
+
     # Vérifier GPU
     if torch.cuda.is_available():
         print(f"✅ GPU détecté: {torch.cuda.get_device_name(0)}")
@@ -240,11 +2066,98 @@ def main():
     else:
         print("⚠️ Pas de GPU, utilisation CPU (latence élevée attendue)")
 
+    if use_cpu_backend(args.device):
+        threads = configure_cpu_threads(args.threads, args.interop_threads, pin=not args.no_pin)
+        print(f"🖥️ Backend CPU: {args.cpu_dtype}, {threads} threads{'' if args.no_pin else ' épinglés'}")
+
     # Charger le modèle
-    model, tokenizer = load_model(args.lora, args.device)
+    if args.adapters:
+        try:
+            adapters = discover_adapters(args.adapters)
+        except ValueError as exc:
+            parser.error(str(exc))
+        model, tokenizer = load_model_with_adapters(adapters, args.device, cpu_dtype=args.cpu_dtype)
+    else:
+        model, tokenizer = load_model(args.lora, args.device, merged_cache_dir=args.merged_cache, cpu_dtype=args.cpu_dtype)
+
+    if args.chat_script:
+        run_chat_script(
+            model,
+            tokenizer,
+            args.chat_script,
+            limit=args.chat_limit,
+            max_context_tokens=args.chat_max_tokens,
+            incremental=not args.no_chat_cache,
+            seed=args.seed,
+            save_results=not args.no_save,
+            stop_rule="dialogue" if args.early_stop else None,
+        )
+    if args.chat:
+        interactive_chat(
+            model,
+            tokenizer,
+            max_context_tokens=args.chat_max_tokens,
+            incremental=not args.no_chat_cache,
+            seed=args.seed,
+            stop_rule="dialogue" if args.early_stop else None,
+        )
+    if args.chat or args.chat_script:
+        print("\n✅ Tests terminés !")
+        return
+
+    draft_model = None
+    if args.draft_model and not args.score:
+        draft_model = load_draft_model(args.draft_model, tokenizer, args.device)
+
+    def evaluate(adapter: str, save_results: bool):
+        if args.score:
+            return run_scoring(
+                model,
+                tokenizer,
+                save_results=save_results,
+                batch_size=args.score_batch_size,
+                with_distractors=args.distractors,
+            )
 
-    # Lancer les benchmarks
-    results = run_benchmarks(model, tokenizer, save_results=not args.no_save)
+        # Lancer les benchmarks
+        generation_cache = None
+        if args.generation_cache:
+            generation_cache = GenerationCache(
+                args.generation_cache,
+                model_id=MODEL_BASE,
+                adapter=adapter,
+                backend=backend_identity(args.device, args.cpu_dtype, merged=not args.adapters),
+                max_bytes=args.generation_cache_mb * 1024**2,
+            )
+
+        results = run_benchmarks(
+            model,
+            tokenizer,
+            save_results=save_results,
+            batch_size=args.batch_size,
+            prefix_cache=args.prefix_cache,
+            generation_cache=generation_cache,
+            seed=args.seed,
+            draft_model=draft_model,
+            stop_rule="schema" if args.early_stop else None,
+            force_conclusion=args.force_conclusion,
+        )
+
+        if generation_cache is not None:
+            generation_cache.close()
+        return results
+
+    if args.adapters:
+        evaluate_adapters(
+            model,
+            adapters,
+            lambda adapter: evaluate(adapter, save_results=False),
+            scoring=args.score,
+            save_results=not args.no_save,
+        )
+    else:
+        lora = args.lora if args.lora and args.lora != "None" else None
+        evaluate(adapter_hash(lora) if lora else "base", save_results=not args.no_save)
 
     print("\n✅ Tests terminés !")
 
@@ -0,0 +1,291 @@
+"""
+Entraînement LoRA piloté par configs/mistral_7b_lora.yaml
+
+Reprend le notebook (QLoRA 4-bit + LoRA + SFTTrainer) mais lit tous les réglages
+dans le YAML. Le batch par device n'est plus choisi d'après le nom du GPU : le plus
+grand batch qui tient est trouvé en lançant des forward/backward à `max_seq_length`,
+puis l'accumulation de gradient est déduite pour garder le batch effectif du YAML
+(per_device_train_batch_size x gradient_accumulation_steps).
+
+Usage :
+    python scripts/train_lora.py --config configs/mistral_7b_lora.yaml
+    python scripts/train_lora.py --config configs/mistral_7b_lora.yaml --gpu-config T4_15GB   # sans sondage
+    python scripts/train_lora.py --config configs/mistral_7b_lora.yaml --dry-run              # sondage seul
+"""
+
+import gc
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+
+import torch
+import yaml
+from peft import LoraConfig, get_peft_model, prepare_model_for_kbit_training
+from transformers import AutoModelForCausalLM, AutoTokenizer, BitsAndBytesConfig
+
+DEFAULT_CONFIG = "configs/mistral_7b_lora.yaml"
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MEMORY_FRACTION = 0.9  # marge pour l'optimizer et la fragmentation
+
+
+def load_config(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def load_model(config: Dict, model_name: str = None):
+    """
+    Modèle base + tokenizer d'après la section `model`
+
+    Sur GPU : quantization 4-bit du YAML puis prepare_model_for_kbit_training.
+    Sans GPU (bitsandbytes indisponible) : poids fp32, pour tester le pipeline sur
+    un petit modèle.
+    """
+    model_name = model_name or config["model"]["name"]
+    print(f"📥 Chargement du modèle: {model_name}")
+
+    if torch.cuda.is_available():
+        quantization = dict(config["model"]["quantization"])
+        compute_dtype = getattr(torch, quantization.pop("bnb_4bit_compute_dtype"))
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            quantization_config=BitsAndBytesConfig(**quantization, bnb_4bit_compute_dtype=compute_dtype),
+            device_map="auto",
+            trust_remote_code=True,
+            torch_dtype=compute_dtype,
+        )
+        model = prepare_model_for_kbit_training(model)
+    else:
+        print("⚠️ Pas de GPU : chargement fp32 sans quantization")
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+    tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "right"
+    return model, tokenizer
+
+
+def apply_lora(model, config: Dict):
+    lora_config = LoraConfig(**config["lora"])
+    model = get_peft_model(model, lora_config)
+
+    trainable_params = sum(p.numel() for p in model.parameters() if p.requires_grad)
+    total_params = sum(p.numel() for p in model.parameters())
+    print(f"✅ LoRA appliqué (r={lora_config.r}, alpha={lora_config.lora_alpha})")
+    print(f"   Paramètres entraînables: {trainable_params:,} ({100 * trainable_params / total_params:.2f}%)")
+    return model
+
+
+def is_out_of_memory(exc: BaseException) -> bool:
+    """OOM CUDA, échec d'allocation CPU, ou dépassement de la marge fixée par le sondage"""
+    if isinstance(exc, (torch.cuda.OutOfMemoryError, MemoryError)):
+        return True
+    message = str(exc).lower()
+    return isinstance(exc, RuntimeError) and ("out of memory" in message or "can't allocate memory" in message)
+
+
+def free_memory():
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def make_probe_step(model, seq_length: int, memory_fraction: float = DEFAULT_MEMORY_FRACTION) -> Callable[[int], None]:
+    """
+    Un pas d'entraînement (forward + backward, sans optimizer) sur un batch aléatoire
+    de `seq_length` tokens : le pire cas, toutes les séquences à la longueur max.
+
+    Sur GPU, un pic au-delà de `memory_fraction` de la VRAM compte comme un OOM.
+    """
+    device = next(model.parameters()).device
+    vocab_size = model.config.vocab_size
+
+    def step(batch_size: int):
+        input_ids = torch.randint(0, vocab_size, (batch_size, seq_length), device=device)
+        if torch.cuda.is_available():
+            torch.cuda.reset_peak_memory_stats()
+        try:
+            loss = model(input_ids=input_ids, attention_mask=torch.ones_like(input_ids), labels=input_ids).loss
+            loss.backward()
+        finally:
+            model.zero_grad(set_to_none=True)
+        if torch.cuda.is_available():
+            peak = torch.cuda.max_memory_allocated()
+            limit = memory_fraction * torch.cuda.get_device_properties(device).total_memory
+            if peak > limit:
+                raise MemoryError(f"pic {peak / 1024**3:.1f} GB > {limit / 1024**3:.1f} GB")
+
+    return step
+
+
+def probe_batch_size(try_batch: Callable[[int], None], max_batch_size: int = DEFAULT_MAX_BATCH_SIZE) -> int:
+    """
+    Plus grand batch pour lequel `try_batch` passe sans OOM
+
+    Doublement (1, 2, 4, ...) jusqu'au premier échec, puis dichotomie entre le dernier
+    batch qui passe et le premier qui échoue. Les erreurs autres qu'un OOM remontent.
+
+    Returns:
+        le batch trouvé (≤ max_batch_size), 0 si même un batch de 1 ne tient pas
+    """
+    def fits(batch_size: int) -> bool:
+        try:
+            try_batch(batch_size)
+            ok = True
+        except (RuntimeError, MemoryError) as exc:
+            if not is_out_of_memory(exc):
+                raise
+            ok = False
+        free_memory()
+        print(f"   batch {batch_size}: {'✅' if ok else '❌ OOM'}")
+        return ok
+
+    low, high = 0, None
+    batch_size = 1
+    while batch_size <= max_batch_size:
+        if not fits(batch_size):
+            high = batch_size
+            break
+        low = batch_size
+        batch_size *= 2
+
+    if high is None:
+        # Toutes les puissances de 2 passent : tester la borne si ce n'en est pas une
+        if low == max_batch_size or fits(max_batch_size):
+            return max_batch_size
+        high = max_batch_size
+
+    while high - low > 1:
+        middle = (low + high) // 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def derive_batch_settings(effective_batch_size: int, max_batch_size: int) -> Tuple[int, int]:
+    """
+    Batch par device et accumulation de gradient pour un batch effectif donné
+
+    Le batch retenu est le plus grand diviseur du batch effectif qui tient en mémoire,
+    pour que batch x accumulation retombe exactement sur le batch effectif.
+    """
+    batch_size = max(d for d in range(1, min(max_batch_size, effective_batch_size) + 1) if effective_batch_size % d == 0)
+    return batch_size, effective_batch_size // batch_size
+
+
+def load_datasets(config: Dict, tokenizer, seed: int = 42):
+    """Fichiers `data` du YAML, split train/validation, champ `text` au format chat (comme le notebook)"""
+    from datasets import load_dataset
+
+    data = config["data"]
+    dataset = load_dataset("json", data_files=[data["base_file"], data["augmented_file"]], split="train")
+    split = dataset.train_test_split(test_size=1 - data["train_split"], seed=seed)
+
+    def format_chat_template(example):
+        return {"text": tokenizer.apply_chat_template(example["messages"], tokenize=False, add_generation_prompt=False)}
+
+    train_dataset = split["train"].map(format_chat_template, remove_columns=split["train"].column_names)
+    eval_dataset = split["test"].map(format_chat_template, remove_columns=split["test"].column_names)
+    print(f"✅ Dataset: {len(train_dataset)} train / {len(eval_dataset)} validation")
+    return train_dataset, eval_dataset
+
+
+def build_training_args(config: Dict, batch_size: int, gradient_accumulation: int, output_dir: str, max_steps: int = -1):
+    from trl import SFTConfig
+
+    training = dict(config["training"])
+    training.update(
+        per_device_train_batch_size=batch_size,
+        per_device_eval_batch_size=batch_size,
+        gradient_accumulation_steps=gradient_accumulation,
+    )
+    if not torch.cuda.is_available():
+        # paged_adamw_8bit et bf16 demandent bitsandbytes / un GPU
+        training.update(optim="adamw_torch", bf16=False, fp16=False)
+
+    return SFTConfig(
+        output_dir=output_dir,
+        max_length=config["data"]["max_seq_length"],
+        max_steps=max_steps,
+        report_to="none",
+        **training,
+    )
+
+
+def main():
+    """Point d'entrée principal"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Entraînement LoRA Mistral 7B piloté par YAML")
+    parser.add_argument("--config", type=str, default=DEFAULT_CONFIG, help="Fichier YAML")
+    parser.add_argument("--model", type=str, default=None, help="Remplace model.name (ex : petit modèle de test)")
+    parser.add_argument("--gpu-config", type=str, default=None, help="Entrée de gpu_configs à utiliser au lieu du sondage")
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE, help="Borne haute du sondage")
+    parser.add_argument(
+        "--memory-fraction",
+        type=float,
+        default=DEFAULT_MEMORY_FRACTION,
+        help="Part de la VRAM qu'un pas de sondage peut atteindre",
+    )
+    parser.add_argument("--output-dir", type=str, default=None, help="Remplace output.dir")
+    parser.add_argument("--max-steps", type=int, default=-1, help="Limite de steps (test rapide)")
+    parser.add_argument("--dry-run", action="store_true", help="S'arrête après le choix du batch")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    training = config["training"]
+    max_seq_length = config["data"]["max_seq_length"]
+
+    if args.gpu_config:
+        gpu_config = config["gpu_configs"][args.gpu_config]
+        effective_batch_size = gpu_config["per_device_train_batch_size"] * gpu_config["gradient_accumulation_steps"]
+    else:
+        effective_batch_size = training["per_device_train_batch_size"] * training["gradient_accumulation_steps"]
+
+    model, tokenizer = load_model(config, args.model)
+    model = apply_lora(model, config)
+
+    if args.gpu_config:
+        batch_size = gpu_config["per_device_train_batch_size"]
+        gradient_accumulation = gpu_config["gradient_accumulation_steps"]
+        print(f"⚙️ gpu_configs.{args.gpu_config}")
+    else:
+        print(f"\n🔍 Sondage du batch max (séquences de {max_seq_length} tokens)...")
+        model.train()
+        max_fit = probe_batch_size(make_probe_step(model, max_seq_length, args.memory_fraction), args.max_batch_size)
+        if max_fit == 0:
+            raise SystemExit(f"❌ Même un batch de 1 x {max_seq_length} tokens ne tient pas en mémoire")
+        batch_size, gradient_accumulation = derive_batch_settings(effective_batch_size, max_fit)
+        print(f"✅ Batch max qui tient: {max_fit}")
+
+    print(f"   Batch par device: {batch_size}")
+    print(f"   Gradient accumulation: {gradient_accumulation}")
+    print(f"   Effective batch size: {batch_size * gradient_accumulation}")
+
+    if args.dry_run:
+        return
+
+    from trl import SFTTrainer
+
+    output_dir = args.output_dir or config["output"]["dir"]
+    train_dataset, eval_dataset = load_datasets(config, tokenizer)
+    trainer = SFTTrainer(
+        model=model,
+        args=build_training_args(config, batch_size, gradient_accumulation, output_dir, args.max_steps),
+        train_dataset=train_dataset,
+        eval_dataset=eval_dataset,
+        processing_class=tokenizer,
+    )
+
+    print("\n🚀 Démarrage du training...\n")
+    trainer.train()
+
+    final_dir = Path(f"{output_dir.rstrip('/')}-final")
+    trainer.model.save_pretrained(final_dir)
+    tokenizer.save_pretrained(final_dir)
+    print(f"\n✅ Modèle sauvegardé dans: {final_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Benchmark des étapes chaudes de prepare_schemes_dataset.py.
+
+Fonctionnalités :
+1. Datasets bruts synthétiques (même forme que "Dataset Niveau A Schemes.txt", texte
+   en mojibake "Ã©" comme l'export d'origine) à plusieurs tailles, seedés, écrits sur
+   disque au fil de l'eau (un exemple en mémoire à la fois)
+2. Chronométrage de chaque étape : normalize_text, extract_schema, extract_context,
+   classify_difficulty, transform_example, Example.to_record, dump_record, write_jsonl
+   (sur au plus --stage-sample exemples relus du fichier), puis `main` de bout en bout
+   sur tout le fichier (mode classique, --stream avec 1 worker et avec --workers)
+3. Débit (exemples/s) = meilleur de --repeat passages ; pic mémoire Python par étape
+   (tracemalloc, dans un passage séparé pour ne pas fausser les temps)
+4. Baseline JSON : --save-baseline l'écrit, --baseline compare et sort en erreur si
+   une étape perd plus de --threshold de débit (ou prend autant de mémoire en plus)
+
+Usage :
+    python scripts/bench_prepare.py --sizes 1000 10000 --save-baseline data/FT/cache/bench_prepare.json
+    python scripts/bench_prepare.py --sizes 1000 10000 --baseline data/FT/cache/bench_prepare.json
+    python scripts/bench_prepare.py --sizes 1000 10000 100000 1000000 --no-memory --workers 8
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import prepare_schemes_dataset as prep
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.2  # 20 % de débit en moins = régression
+DEFAULT_STAGE_SAMPLE = 100_000  # exemples gardés en mémoire pour les étapes unitaires
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+BASELINE_VERSION = 2
+
+SCHEMAS = [
+    "Modus Ponens", "Modus Tollens", "Syllogisme", "Identité", "Causalité",
+    "Opposition", "Analogie", "Distinction", "Condition", "Réfutation",
+]
+SUBJECTS = ["l'élève", "Jade", "l'homme", "la conscience", "le citoyen", "Léa", "la société", "l'artiste"]
+WORDS = [
+    "causes", "désirs", "liberté", "nécessaire", "connaît", "être", "affects", "raison",
+    "durée", "vécue", "intérieur", "phénomène", "apparaît", "loi", "autonome", "agir",
+    "puissance", "joie", "servitude", "passion", "idée", "adéquate", "nature", "Dieu",
+]
+SYSTEM_PROMPT = (
+    "Tu es un tuteur philosophique maîtrisant les schèmes logiques. "
+    "Tu appliques le schème demandé au contexte fourni."
+)
+
+
+def mojibake(text: str) -> str:
+    """Reproduit l'export d'origine : UTF-8 relu comme du latin-1"""
+    return text.encode("utf-8").decode("latin-1")
+
+
+def iter_synthetic_examples(size: int, seed: int = 0) -> Iterator[dict]:
+    """Exemples bruts synthétiques, contextes de 5 à 60 mots (toutes les difficultés)"""
+    rng = random.Random(seed)
+    for _ in range(size):
+        subject = rng.choice(SUBJECTS)
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 60)))
+        user = f"Schème : {rng.choice(SCHEMAS)}\nContexte : Si {subject} {words}. Or {subject} {words[:40]}.\nApplique le schème :"
+        assistant = f"Donc {subject} {rng.choice(WORDS)} {rng.choice(WORDS)}."
+        yield {
+            "messages": [
+                {"role": "system", "content": mojibake(SYSTEM_PROMPT)},
+                {"role": "user", "content": mojibake(user)},
+                {"role": "assistant", "content": mojibake(assistant)},
+            ]
+        }
+
+
+def write_raw_dataset(path: Path, size: int, seed: int = 0) -> None:
+    """Tableau JSON écrit exemple par exemple : le fichier ne passe jamais en mémoire"""
+    with path.open("w", encoding="utf-8") as f:
+        f.write("[")
+        for i, example in enumerate(iter_synthetic_examples(size, seed)):
+            f.write(",\n" if i else "\n")
+            f.write(json.dumps(example, ensure_ascii=False))
+        f.write("\n]\n")
+
+
+def measure(stage: Callable[[], object], repeat: int, memory: bool) -> Dict[str, Optional[float]]:
+    """Meilleur temps sur `repeat` passages, puis pic tracemalloc sur un passage dédié"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage()
+        best = min(best, time.perf_counter() - start)
+
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        stage()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mb = (peak - baseline) / 1024**2
+    return {"seconds": best, "peak_mb": peak_mb}
+
+
+def run_main(argv: List[str]) -> None:
+    """`prepare_schemes_dataset.main` en process, sorties console coupées"""
+    saved_argv, saved_stdout = sys.argv, sys.stdout
+    sys.argv = ["prepare_schemes_dataset.py", *argv]
+    try:
+        with open(os.devnull, "w", encoding="utf-8") as devnull:
+            sys.stdout = devnull
+            prep.main()
+    finally:
+        sys.argv, sys.stdout = saved_argv, saved_stdout
+
+
+def bench_size(
+    size: int,
+    workdir: Path,
+    repeat: int,
+    memory: bool,
+    seed: int,
+    stage_sample: int = DEFAULT_STAGE_SAMPLE,
+    workers: int = DEFAULT_WORKERS,
+) -> Dict[str, Dict]:
+    raw_path = workdir / f"raw_{size}.json"
+    write_raw_dataset(raw_path, size, seed)
+
+    # Entrées des étapes unitaires préparées hors chronomètre, sur un échantillon borné :
+    # aux grandes tailles elles domineraient sinon la mémoire du benchmark
+    raw = list(islice(prep.iter_raw_examples(raw_path), stage_sample))
+    raw_texts = [m["content"] for ex in raw for m in ex["messages"][1:]]
+    users = [prep.normalize_text(ex["messages"][1]["content"]) for ex in raw]
+    contexts = [prep.extract_context(user) for user in users]
+    examples = [prep.transform_example(ex) for ex in raw]
+    records = [ex.to_record(register) for ex in examples for register in prep.REGISTER_INSTRUCTIONS]
+    output_dir = workdir / f"out_{size}"
+    jsonl_path = workdir / f"records_{size}.jsonl"
+
+    unit_stages: Dict[str, Callable[[], object]] = {
+        "normalize_text": lambda: [prep.normalize_text(text) for text in raw_texts],
+        "extract_schema": lambda: [prep.extract_schema(user) for user in users],
+        "extract_context": lambda: [prep.extract_context(user) for user in users],
+        "classify_difficulty": lambda: [prep.classify_difficulty(context) for context in contexts],
+        "transform_example": lambda: [prep.transform_example(ex) for ex in raw],
+        "to_record": lambda: [ex.to_record(register) for ex in examples for register in prep.REGISTER_INSTRUCTIONS],
+        "dump_record": lambda: [prep.dump_record(record) for record in records],
+        "write_jsonl": lambda: prep.write_jsonl(jsonl_path, records),
+    }
+    main_argv = ["--input", str(raw_path), "--output-dir", str(output_dir), "--force"]
+    end_to_end: Dict[str, Callable[[], object]] = {
+        "main": lambda: run_main(main_argv),
+        "main_stream": lambda: run_main([*main_argv, "--stream", "--workers", "1"]),
+    }
+    if workers > 1:
+        # Le pic tracemalloc ne couvre que le process parent, pas les workers
+        end_to_end[f"main_stream_{workers}_workers"] = lambda: run_main([*main_argv, "--stream", "--workers", str(workers)])
+
+    results = {}
+    for count, stages in ((len(raw), unit_stages), (size, end_to_end)):
+        for name, stage in stages.items():
+            result = measure(stage, repeat, memory)
+            result["examples_per_s"] = count / result["seconds"] if result["seconds"] else None
+            results[name] = result
+            peak = f"{result['peak_mb']:8.1f} MB" if result["peak_mb"] is not None else "       -   "
+            print(f"   {name:<22} {result['seconds']:9.4f}s {result['examples_per_s']:>12,.0f} ex/s {peak}")
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Liste des régressions (débit ou mémoire) au-delà du seuil, par taille et étape"""
+    regressions = []
+    for size, stages in results.items():
+        for name, current in stages.items():
+            reference = baseline.get(size, {}).get(name)
+            if reference is None:
+                continue
+            if current["examples_per_s"] < reference["examples_per_s"] * (1 - threshold):
+                regressions.append(
+                    f"{name} @ {size}: {current['examples_per_s']:,.0f} ex/s "
+                    f"< {reference['examples_per_s']:,.0f} ex/s (baseline)"
+                )
+            if (
+                current.get("peak_mb") is not None
+                and reference.get("peak_mb")
+                and current["peak_mb"] > reference["peak_mb"] * (1 + threshold)
+            ):
+                regressions.append(
+                    f"{name} @ {size}: pic {current['peak_mb']:.1f} MB > {reference['peak_mb']:.1f} MB (baseline)"
+                )
+    return regressions
+
+
+def main() -> None:
+    args = parse_args()
+    results: Dict[str, Dict] = {}
+
+    with tempfile.TemporaryDirectory(prefix="bench_prepare_") as tmp:
+        for size in args.sizes:
+            print(f"\n⏱️ {size:,} exemples")
+            results[str(size)] = bench_size(
+                size, Path(tmp), args.repeat, not args.no_memory, args.seed, args.stage_sample, args.workers
+            )
+
+    if args.save_baseline:
+        args.save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        payload = {"version": BASELINE_VERSION, "python": sys.version.split()[0], "results": results}
+        args.save_baseline.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        print(f"\n💾 Baseline écrite : {args.save_baseline}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if baseline.get("version") != BASELINE_VERSION:
+            raise SystemExit(f"❌ Baseline {args.baseline} d'une autre version du benchmark")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} régression(s) au-delà de {args.threshold:.0%} :")
+            for regression in regressions:
+                print(f"   - {regression}")
+            raise SystemExit(1)
+        print(f"\n✅ Aucune régression au-delà de {args.threshold:.0%} par rapport à {args.baseline}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark des étapes de prepare_schemes_dataset.py.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Tailles des datasets synthétiques.")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Passages par étape (meilleur temps retenu).")
+    parser.add_argument("--seed", type=int, default=0, help="Seed des datasets synthétiques.")
+    parser.add_argument(
+        "--stage-sample",
+        type=int,
+        default=DEFAULT_STAGE_SAMPLE,
+        help="Exemples au plus pour les étapes unitaires (main traite toujours tout le fichier).",
+    )
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Workers du point --stream multi-process.")
+    parser.add_argument("--no-memory", action="store_true", help="Ne mesure pas le pic mémoire (plus rapide).")
+    parser.add_argument("--baseline", type=Path, default=None, help="Baseline JSON à comparer (échec si régression).")
+    parser.add_argument("--save-baseline", type=Path, default=None, help="Écrit les résultats comme nouvelle baseline.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Régression tolérée (0.2 = 20 %%).")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Manifest des datasets générés (data/FT/processed/manifest.json).
+
+Chaque script de préparation y enregistre, dans sa propre section :
+- la version du script et des prompts (hash de BASE_SYSTEM_PROMPT, REGISTER_INSTRUCTIONS, ...)
+- le hash de chaque exemple source, dans l'ordre
+- la signature (taille + mtime) des fichiers produits
+
+Au lancement suivant, le script compare ces valeurs pour ne retransformer que
+les exemples modifiés ou nouveaux, ou ne rien faire si tout est à jour.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def content_hash(obj) -> str:
+    """Hash stable d'un objet JSON (clés triées), tronqué à 16 caractères hex."""
+    payload = json.dumps(obj, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_signature(path: Path) -> Optional[Dict[str, int]]:
+    if not path.exists():
+        return None
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class Manifest:
+    def __init__(self, path: Path):
+        self.path = path
+        self.data: Dict = {"version": MANIFEST_VERSION, "sections": {}}
+        if path.exists():
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except json.JSONDecodeError:
+                data = {}
+            if data.get("version") == MANIFEST_VERSION:
+                self.data = data
+
+    def section(self, name: str) -> Dict:
+        return self.data["sections"].get(name, {})
+
+    def update(self, name: str, entry: Dict) -> None:
+        self.data["sections"][name] = entry
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.data, indent=2, ensure_ascii=False), encoding="utf-8")
+        tmp_path.replace(self.path)
+
+
+def output_signatures(paths: Iterable[Path]) -> Dict[str, Optional[Dict[str, int]]]:
+    return {str(path): file_signature(path) for path in paths}
+
+
+def outputs_unchanged(entry: Dict, paths: List[Path]) -> bool:
+    """Vrai si tous les fichiers existent et n'ont pas bougé depuis le dernier build."""
+    recorded = entry.get("outputs") or {}
+    return all(
+        file_signature(path) is not None and recorded.get(str(path)) == file_signature(path)
+        for path in paths
+    )
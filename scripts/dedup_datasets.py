@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Détecte les doublons exacts et quasi-doublons entre tous les JSONL d'entraînement.
+
+Fonctionnalités :
+1. Normalisation du texte des messages (minuscules, ponctuation et espaces uniformisés)
+2. Doublons exacts : hash du texte normalisé
+3. Quasi-doublons : MinHash sur des n-grammes de caractères + LSH par bandes,
+   sans comparaison deux à deux (chaque exemple ne consulte que ses seaux)
+4. Fuite train/eval : part du contexte de chaque TEST_QUESTIONS (scripts/test_model.py)
+   retrouvée dans les messages user de l'exemple (containment de n-grammes, exact)
+5. Un seul passage en streaming sur les fichiers ; --drop écrit des copies dédoublonnées
+
+Le prompt système fait partie de la clé des doublons (deux variantes de registre d'un
+même exemple ne sont pas des doublons) mais pas du texte comparé : sinon le prompt
+partagé écraserait les différences entre dialogues. La fuite ne regarde que les messages
+user : un Jaccard sur tout le dialogue raterait un contexte de test recopié dans un
+prompt plus long ou suivi d'une autre réponse.
+
+Usage (depuis bergsonAndFriends/) :
+    python ../scripts/dedup_datasets.py --report data/FT/dedup_report.json
+    python ../scripts/dedup_datasets.py --drop --output-dir data/FT/dedup
+"""
+from __future__ import annotations
+
+import argparse
+import ast
+import hashlib
+import json
+import re
+import unicodedata
+import zlib
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_INPUTS = [
+    Path("data/FT/correction_dataset.jsonl"),
+    Path("data/FT/processed/enriched_correction_dataset.jsonl"),
+    Path("data/FT/processed/schemes_levelA_augmented.jsonl"),
+    Path("data/FT/processed/schemes_levelA_base.jsonl"),
+]
+DEFAULT_TEST_MODEL = Path("scripts/test_model.py")
+
+DEFAULT_NUM_PERM = 128
+DEFAULT_BANDS = 32  # 32 bandes x 4 lignes : seuil LSH ~ (1/32)^(1/4) ≈ 0.42, filtré ensuite
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_LEAK_THRESHOLD = 0.8
+DEFAULT_SHINGLE_SIZE = 5
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+NON_WORD_RE = re.compile(r"[^\w]+")
+
+
+@dataclass(frozen=True)
+class RecordRef:
+    path: str
+    line: int
+
+    def __str__(self) -> str:
+        return f"{self.path}:{self.line}"
+
+
+@dataclass
+class FileStats:
+    records: int = 0
+    exact: int = 0
+    near: int = 0
+    leaks: int = 0
+    kept: int = 0
+
+
+@dataclass
+class DedupReport:
+    files: Dict[str, FileStats] = field(default_factory=dict)
+    duplicates: List[Dict] = field(default_factory=list)
+    leaks: List[Dict] = field(default_factory=list)
+
+
+class MinHasher:
+    """
+    Signatures MinHash vectorisées : h_i(x) = (a_i * x + b_i) mod p, tronqué à 32 bits.
+
+    Les n-grammes sont hashés une fois (crc32), puis les `num_perm` permutations
+    sont appliquées en une opération NumPy.
+    """
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, shingle_size: int = DEFAULT_SHINGLE_SIZE, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.randint(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text: str) -> np.ndarray:
+        k = self.shingle_size
+        grams = {text[i:i + k] for i in range(max(len(text) - k + 1, 1))}
+        return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = self.shingles(text)[:, None]
+        # Produit modulo 2^64 puis mod p : approximation usuelle (datasketch fait de même)
+        permuted = (hashes * self._a + self._b) % np.uint64(MERSENNE_PRIME)
+        return (permuted & np.uint64(MAX_HASH)).min(axis=0).astype(np.uint32)
+
+
+class LSHIndex:
+    """
+    Index LSH par bandes : chaque seau ne retient que le premier exemple vu.
+
+    Un nouvel exemple est comparé aux représentants de ses seaux (au plus `bands`
+    signatures), ce qui garde un coût constant par exemple quel que soit le volume.
+
+    Mémoire : les seaux sont indexés par un hash entier de (namespace, bande, lignes)
+    et les signatures vivent dans un seul tableau uint32. Compter ~3,5 KB par exemple
+    gardé avec les valeurs par défaut (32 entrées de dict + 512 octets de signature),
+    soit ~3,5 GB pour un million d'exemples : au-delà, partitionner les entrées.
+    """
+
+    def __init__(self, num_perm: int, bands: int):
+        if num_perm % bands:
+            raise ValueError("num_perm doit être un multiple de bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets: Dict[int, int] = {}
+        self._signatures = np.empty((1024, num_perm), dtype=np.uint32)
+        self._refs: List[RecordRef] = []
+
+    def _keys(self, namespace: str, signature: np.ndarray) -> Iterator[int]:
+        for band in range(self.bands):
+            yield hash((namespace, band, signature[band * self.rows:(band + 1) * self.rows].tobytes()))
+
+    def query(self, namespace: str, signature: np.ndarray, threshold: float) -> Optional[Tuple[RecordRef, float]]:
+        best: Optional[Tuple[RecordRef, float]] = None
+        seen = set()
+        for key in self._keys(namespace, signature):
+            idx = self._buckets.get(key)
+            if idx is None or idx in seen:
+                continue
+            seen.add(idx)
+            # Une collision de hash entre seaux ne coûte qu'une comparaison de trop
+            similarity = float(np.mean(self._signatures[idx] == signature))
+            if similarity >= threshold and (best is None or similarity > best[1]):
+                best = (self._refs[idx], similarity)
+        return best
+
+    def insert(self, namespace: str, signature: np.ndarray, ref: RecordRef) -> None:
+        idx = len(self._refs)
+        if idx == len(self._signatures):
+            self._signatures = np.concatenate([self._signatures, np.empty_like(self._signatures)])
+        self._signatures[idx] = signature
+        self._refs.append(ref)
+        for key in self._keys(namespace, signature):
+            self._buckets.setdefault(key, idx)
+
+
+class LeakIndex:
+    """
+    Contextes des TEST_QUESTIONS, comparés par containment aux messages user.
+
+    containment = part des n-grammes du contexte de test présents dans le texte user
+    de l'exemple. Calcul exact : il n'y a qu'une poignée de questions de test.
+    """
+
+    def __init__(self, hasher: MinHasher):
+        self.hasher = hasher
+        self._contexts: List[Tuple[RecordRef, np.ndarray]] = []
+
+    def insert(self, context: str, ref: RecordRef) -> None:
+        self._contexts.append((ref, self.hasher.shingles(normalize_for_dedup(context))))
+
+    def query(self, user_text: str, threshold: float) -> Optional[Tuple[RecordRef, float]]:
+        if not user_text:
+            return None
+        shingles = self.hasher.shingles(user_text)
+        best: Optional[Tuple[RecordRef, float]] = None
+        for ref, context in self._contexts:
+            containment = float(np.isin(context, shingles).mean())
+            if containment >= threshold and (best is None or containment > best[1]):
+                best = (ref, containment)
+        return best
+
+
+def main() -> None:
+    args = parse_args()
+
+    hasher = MinHasher(args.num_perm, args.shingle_size)
+    test_index = build_test_index(args.test_questions, hasher)
+
+    if args.drop:
+        args.output_dir.mkdir(parents=True, exist_ok=True)
+
+    report = deduplicate(
+        args.inputs, hasher, args.bands, args.threshold, test_index, args.leak_threshold, args.drop, args.output_dir
+    )
+    print_report(report)
+
+    if args.report:
+        args.report.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "files": {path: stats.__dict__ for path, stats in report.files.items()},
+            "duplicates": report.duplicates,
+            "leaks": report.leaks,
+        }
+        args.report.write_text(json.dumps(payload, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\n📄 Rapport : {args.report}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Doublons et fuites train/eval dans les JSONL d'entraînement.")
+    parser.add_argument("--inputs", type=Path, nargs="+", default=DEFAULT_INPUTS, help="Fichiers JSONL, par priorité.")
+    parser.add_argument(
+        "--test-questions",
+        type=Path,
+        default=DEFAULT_TEST_MODEL,
+        help="Script contenant TEST_QUESTIONS (lu sans être importé).",
+    )
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Similarité Jaccard estimée minimale.")
+    parser.add_argument(
+        "--leak-threshold",
+        type=float,
+        default=DEFAULT_LEAK_THRESHOLD,
+        help="Part minimale du contexte d'une question de test retrouvée dans les messages user.",
+    )
+    parser.add_argument("--num-perm", type=int, default=DEFAULT_NUM_PERM, help="Permutations MinHash.")
+    parser.add_argument("--bands", type=int, default=DEFAULT_BANDS, help="Bandes LSH (divise --num-perm).")
+    parser.add_argument("--shingle-size", type=int, default=DEFAULT_SHINGLE_SIZE, help="Taille des n-grammes de caractères.")
+    parser.add_argument("--drop", action="store_true", help="Écrit des copies sans doublons ni fuites.")
+    parser.add_argument("--output-dir", type=Path, default=Path("data/FT/dedup"), help="Sortie de --drop.")
+    parser.add_argument("--report", type=Path, default=None, help="Rapport JSON détaillé (paires de doublons).")
+    return parser.parse_args()
+
+
+def normalize_for_dedup(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).lower()
+    return NON_WORD_RE.sub(" ", text).strip()
+
+
+def dialogue_text(messages: List[Dict]) -> str:
+    return "\n".join(
+        normalize_for_dedup(m.get("content") or "") for m in messages if m.get("role") != "system"
+    )
+
+
+def user_text(messages: List[Dict]) -> str:
+    return "\n".join(normalize_for_dedup(m.get("content") or "") for m in messages if m.get("role") == "user")
+
+
+def system_key(messages: List[Dict]) -> str:
+    system = "\n".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+    return hashlib.sha1(system.encode("utf-8")).hexdigest()[:16]
+
+
+def load_test_questions(path: Path) -> Dict[str, List[Dict]]:
+    """Lit TEST_QUESTIONS dans le script de test sans l'importer (pas besoin de torch)"""
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "TEST_QUESTIONS" for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise ValueError(f"TEST_QUESTIONS introuvable dans {path}")
+
+
+def build_test_index(path: Path, hasher: MinHasher) -> Optional[LeakIndex]:
+    if not path.exists():
+        print(f"⚠️ {path} introuvable : pas de détection de fuite")
+        return None
+    index = LeakIndex(hasher)
+    for philosopher, questions in load_test_questions(path).items():
+        for i, question in enumerate(questions):
+            # Le contexte est ce que le modèle voit au test : le schème et la conclusion
+            # attendue sont partagés avec trop d'exemples légitimes
+            index.insert(question["context"], RecordRef(f"TEST_QUESTIONS[{philosopher}]", i))
+    return index
+
+
+def iter_jsonl(path: Path) -> Iterator[Tuple[int, str, Dict]]:
+    with path.open("r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if line.strip():
+                yield line_no, line, json.loads(line)
+
+
+def deduplicate(
+    paths: List[Path],
+    hasher: MinHasher,
+    bands: int,
+    threshold: float,
+    test_index: Optional[LeakIndex],
+    leak_threshold: float,
+    drop: bool,
+    output_dir: Path,
+) -> DedupReport:
+    report = DedupReport()
+    index = LSHIndex(hasher.num_perm, bands)
+    exact: Dict[str, RecordRef] = {}
+
+    for path in paths:
+        stats = report.files.setdefault(str(path), FileStats())
+        out = (output_dir / path.name).open("w", encoding="utf-8") if drop else None
+        try:
+            for line_no, line, record in iter_jsonl(path):
+                stats.records += 1
+                ref = RecordRef(str(path), line_no)
+                messages = record.get("messages") or []
+                text = dialogue_text(messages)
+                text_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+                namespace = system_key(messages)
+                signature = hasher.signature(text)
+                keep = True
+
+                if test_index is not None:
+                    match = test_index.query(user_text(messages), leak_threshold)
+                    if match:
+                        stats.leaks += 1
+                        keep = False
+                        report.leaks.append({"record": str(ref), "test": str(match[0]), "containment": match[1]})
+
+                original = exact.get(f"{namespace}:{text_hash}")
+                if original is not None:
+                    stats.exact += 1
+                    keep = False
+                    report.duplicates.append({"record": str(ref), "kept": str(original), "similarity": 1.0, "kind": "exact"})
+                else:
+                    match = index.query(namespace, signature, threshold)
+                    if match:
+                        stats.near += 1
+                        keep = False
+                        report.duplicates.append(
+                            {"record": str(ref), "kept": str(match[0]), "similarity": match[1], "kind": "near"}
+                        )
+                    else:
+                        exact[f"{namespace}:{text_hash}"] = ref
+                        index.insert(namespace, signature, ref)
+
+                if keep:
+                    stats.kept += 1
+                    if out is not None:
+                        out.write(line if line.endswith("\n") else line + "\n")
+        finally:
+            if out is not None:
+                out.close()
+    return report
+
+
+def print_report(report: DedupReport) -> None:
+    print(f"{'Fichier':<60} {'total':>7} {'exacts':>7} {'proches':>8} {'fuites':>7} {'gardés':>7}")
+    for path, stats in report.files.items():
+        print(f"{path:<60} {stats.records:>7} {stats.exact:>7} {stats.near:>8} {stats.leaks:>7} {stats.kept:>7}")
+    by_pair = Counter(
+        (d["record"].rsplit(":", 1)[0], d["kept"].rsplit(":", 1)[0]) for d in report.duplicates
+    )
+    if by_pair:
+        print("\n🔁 Doublons par couple de fichiers (doublon -> original gardé) :")
+        for (dup, kept), count in by_pair.most_common():
+            print(f"   - {dup} -> {kept} : {count}")
+    if report.leaks:
+        print(f"\n⚠️ {len(report.leaks)} exemples reprenant le contexte d'une TEST_QUESTIONS (fuite train/eval) :")
+        leaks_by_test = defaultdict(list)
+        for leak in report.leaks:
+            leaks_by_test[leak["test"]].append(leak["record"])
+        for test, records in leaks_by_test.items():
+            print(f"   - {test} : {', '.join(records[:5])}{' ...' if len(records) > 5 else ''}")
+
+
+if __name__ == "__main__":
+    main()
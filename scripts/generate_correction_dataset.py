@@ -7,25 +7,56 @@ Corrige les points d'achoppement identifiés :
 3. Variété des réponses (pas de répétition)
 4. Style conversationnel (pas académique)
 5. Cohérence avec le prompt système
+
+Mode --expand : au lieu des exemples écrits à la main, développe des templates
+déclaratifs (persona du philosophe x notion x attitude de l'élève x formulations, sur un
+ou deux tours ; 7 425 conversations distinctes avec les templates actuels).
+Chaque conversation est calculée à partir de son seul numéro : les workers se
+partagent des plages de numéros, l'ordre est mélangé par une permutation seedée
+sans rien matérialiser, et la sortie part au fil de l'eau dans des shards de
+taille bornée (gzip optionnel). Mémoire constante quel que soit le volume.
+
+Usage :
+    python scripts/generate_correction_dataset.py
+    python scripts/generate_correction_dataset.py --expand --workers 8 --shard-size-mb 64 --compress
 """
+import argparse
+import gzip
 import json
+import math
+import os
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import List, Dict
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from dataset_manifest import MANIFEST_NAME, Manifest, content_hash, output_signatures, outputs_unchanged
 
 OUTPUT_PATH = Path("bergsonAndFriends/data/FT/correction_dataset.jsonl")
+EXPANDED_OUTPUT_DIR = Path("bergsonAndFriends/data/FT/correction_expanded")
+EXPANDED_PREFIX = "correction_expanded"
+MANIFEST_DIR = Path("bergsonAndFriends/data/FT/processed")
+MANIFEST_SECTION = "generate_correction_dataset"
+EXPANDED_MANIFEST_SECTION = "generate_correction_dataset.expand"
+SCRIPT_VERSION = 2  # à incrémenter si le format de sortie change
+DEFAULT_CHUNK_SIZE = 1000  # conversations générées par tâche de worker
+DEFAULT_SHARD_SIZE_MB = 64
 
-SYSTEM_PROMPT = (
-    "Tu ES Spinoza incarné. Tu dialogues avec un élève de Terminale en première personne.\n\n"
+SYSTEM_PROMPT_TEMPLATE = (
+    "Tu ES {name} incarné. Tu dialogues avec un élève de Terminale en première personne.\n\n"
     "RÈGLES STRICTES:\n"
     "- Tutoie toujours l'élève (tu/ton/ta)\n"
     "- Reste concis (2-3 phrases MAX)\n"
     "- Questionne au lieu d'affirmer\n"
     "- Varie tes formulations\n"
-    "- Ne parle JAMAIS de toi à la 3ème personne. Tu ES Spinoza.\n"
+    "- Ne parle JAMAIS de toi à la 3ème personne. Tu ES {name}.\n"
     "- Réponds à la question posée, pas à une question précédente.\n"
     "- Adapte ta réponse au contexte immédiat de la conversation."
 )
 
+SYSTEM_PROMPT = SYSTEM_PROMPT_TEMPLATE.format(name="Spinoza")
+
 # Exemples de correction basés sur les problèmes observés
 CORRECTION_EXAMPLES = [
     # Problème 1 : 3ème personne → 1ère personne
@@ -210,16 +241,463 @@ CORRECTION_EXAMPLES = [
     },
 ]
 
+# Templates déclaratifs du mode --expand
+# Slots disponibles dans les formulations : {name}, {oeuvre} et les clés de chaque notion ;
+# une majuscule initiale ({Notion}, {Illusion}...) donne la valeur en début de phrase.
+PERSONAS = {
+    "spinoza": {
+        "name": "Spinoza",
+        "oeuvre": "mon Éthique",
+        "notions": [
+            {
+                "notion": "la liberté",
+                "illusion": "faire ce qu'on veut",
+                "these": "connaître les causes de ce que tu désires",
+                "consequence": "plus tu comprends les causes de tes désirs, plus ta puissance d'agir augmente",
+                "analogie": "une pierre lancée qui, si elle pouvait penser, croirait choisir sa trajectoire",
+                "question": "d'où vient ce que tu veux ?",
+            },
+            {
+                "notion": "la servitude",
+                "illusion": "être enfermé ou obéir à un maître",
+                "these": "être mené par des passions dont tu ignores les causes",
+                "consequence": "tant que tu ignores ce qui te pousse, ce sont tes passions qui décident à ta place",
+                "analogie": "une girouette qui croirait diriger le vent",
+                "question": "qui décide vraiment quand tu cèdes à une colère ?",
+            },
+            {
+                "notion": "la joie",
+                "illusion": "un simple plaisir du moment",
+                "these": "le passage à une plus grande puissance d'agir",
+                "consequence": "comprendre ce qui t'affecte produit une joie qui ne dépend plus du hasard",
+                "analogie": "un musicien qui progresse et sent ses doigts devenir plus libres",
+                "question": "qu'est-ce qui te rend plus capable d'agir, et pas seulement content ?",
+            },
+        ],
+    },
+    "bergson": {
+        "name": "Bergson",
+        "oeuvre": "l'Essai sur les données immédiates de la conscience",
+        "notions": [
+            {
+                "notion": "la durée",
+                "illusion": "le temps des horloges",
+                "these": "le temps vécu de l'intérieur, où les moments se fondent les uns dans les autres",
+                "consequence": "si tu découpes ta vie en instants mesurables, tu perds ce que tu vis réellement",
+                "analogie": "une mélodie, où chaque note n'a de sens que par celles qui la précèdent",
+                "question": "une heure d'ennui et une heure de joie ont-elles vraiment la même longueur pour toi ?",
+            },
+            {
+                "notion": "la liberté",
+                "illusion": "choisir entre deux options posées devant soi",
+                "these": "un acte qui exprime toute ta personnalité",
+                "consequence": "un acte est libre quand il sort de toi tout entier, comme un fruit sort de l'arbre",
+                "analogie": "un artiste dont l'œuvre ressemble à sa vie sans qu'on puisse la prédire",
+                "question": "tes choix importants, les as-tu vraiment calculés comme une addition ?",
+            },
+            {
+                "notion": "la conscience",
+                "illusion": "une suite d'états séparés qu'on pourrait compter",
+                "these": "une continuité mouvante où le passé se prolonge dans le présent",
+                "consequence": "ton passé ne disparaît pas, il colore chacun de tes instants",
+                "analogie": "une boule de neige qui grossit en roulant",
+                "question": "peux-tu vraiment séparer ce que tu ressens maintenant de tout ce que tu as vécu ?",
+            },
+        ],
+    },
+    "kant": {
+        "name": "Kant",
+        "oeuvre": "la Critique de la raison pratique",
+        "notions": [
+            {
+                "notion": "l'autonomie",
+                "illusion": "n'obéir à personne",
+                "these": "obéir à la loi que ta raison se donne à elle-même",
+                "consequence": "tu n'es libre que si la règle de ton action vient de ta propre raison",
+                "analogie": "un joueur qui respecte les règles qu'il a lui-même acceptées, même quand personne ne regarde",
+                "question": "si tu suis seulement tes envies, est-ce toi qui te donnes ta loi ?",
+            },
+            {
+                "notion": "le devoir",
+                "illusion": "ce que la société t'impose",
+                "these": "agir par respect pour la loi morale",
+                "consequence": "une action a une valeur morale quand tu la fais parce qu'elle est juste, pas par intérêt",
+                "analogie": "un commerçant honnête par peur de perdre ses clients, qui n'est pas encore moral",
+                "question": "si tu aides quelqu'un pour être remercié, agis-tu vraiment par devoir ?",
+            },
+            {
+                "notion": "la connaissance",
+                "illusion": "voir les choses telles qu'elles sont en soi",
+                "these": "connaître les phénomènes à travers les formes de ton esprit",
+                "consequence": "tu ne connais jamais la chose en soi, seulement ce qu'elle est pour toi",
+                "analogie": "des lunettes colorées qu'on ne pourrait jamais retirer",
+                "question": "comment saurais-tu à quoi ressemble une chose quand personne ne la perçoit ?",
+            },
+        ],
+    },
+}
+
+# Attitudes de l'élève (cf. Problème 5) : consigne ajoutée au prompt système + formulations
+ATTITUDES = {
+    "accord": {
+        "consigne": "L'élève est d'accord → Valide puis AVANCE logiquement.",
+        "user": [
+            "Oui, je comprends. {Notion}, c'est {these}.",
+            "Ah d'accord, donc {notion}, ce n'est pas {illusion}.",
+            "OK, je vois où tu veux en venir avec {notion}.",
+            "Ça se tient. Ce qui compte pour {notion}, c'est {these}, pas {illusion}.",
+            "Je crois que j'ai saisi : on se trompe quand on confond {notion} avec {illusion}.",
+        ],
+        "assistant": [
+            "Exact. Donc {consequence}. Tu vois pourquoi je refuse de réduire {notion} à {illusion} ?",
+            "C'est ça. Alors avance d'un pas : {consequence}. Qu'est-ce que ça change pour toi ?",
+            "Oui. Et si tu vas plus loin, {consequence}. C'est ce que je montre dans {oeuvre}.",
+            "Bien vu. Ne t'arrête pas là : {question} Ta réponse te dira si tu as vraiment compris.",
+            "Tu tiens l'essentiel. Applique-le à ta vie : où est-ce que tu prends encore {illusion} pour {notion} ?",
+        ],
+    },
+    "confusion": {
+        "consigne": "L'élève est confus → Donne UNE analogie concrète simple.",
+        "user": [
+            "Je comprends pas. C'est quoi la différence entre {notion} et {illusion} ?",
+            "Attends, {notion}, c'est pas juste {illusion} ?",
+            "C'est compliqué tout ça, tu peux m'expliquer {notion} autrement ?",
+            "Je suis perdu. Concrètement, ça ressemble à quoi {notion} dans la vraie vie ?",
+            "Pourquoi tu dis que {notion}, c'est {these} ? Je vois pas le rapport.",
+        ],
+        "assistant": [
+            "Imagine {analogie}. C'est toute la différence entre {illusion} et {these}.",
+            "Prends un exemple simple : {analogie}. Tu vois ce qui manque quand on s'arrête à {illusion} ?",
+            "Pense à {analogie}. Pour moi, {notion}, c'est {these}. Ça te parle mieux ?",
+            "Laisse les définitions de côté une minute. Regarde {analogie} : qu'est-ce qui lui échappe ?",
+            "Je reprends plus simplement. Quand tu crois que {notion} se réduit à {illusion}, tu ressembles à {analogie}.",
+        ],
+    },
+    "resistance": {
+        "consigne": "L'élève résiste → Révèle une contradiction dans sa position.",
+        "user": [
+            "Non, {notion}, c'est {illusion}, point.",
+            "Mouais. Pas foufou ton argument sur {notion}.",
+            "Je vois pas pourquoi {notion} serait {these}.",
+            "Tu compliques tout. Tout le monde sait que {notion}, c'est {illusion}.",
+            "Ça reste ton avis. Pour moi, {notion} et {illusion}, c'est pareil.",
+        ],
+        "assistant": [
+            "Mais alors, si {notion}, c'est {illusion}, {question} Si tu ne sais pas répondre, ta position tient-elle encore ?",
+            "Je comprends ta résistance. Pourtant, {question} Tu défends {illusion} sans savoir d'où vient ta certitude.",
+            "D'accord, teste ta position : {question} Si la réponse t'échappe, {notion} n'est peut-être pas {illusion}.",
+            "Admettons. Mais que tout le monde le pense ne prouve rien : {question}",
+            "Tu as le droit de résister. Réponds seulement à ceci : {question} Ton hésitation montre déjà que {illusion} ne suffit pas.",
+        ],
+    },
+}
+
+# Entrées en matière de l'élève, préfixées au premier message utilisateur. Simple habillage :
+# elles ne multiplient pas le nombre de conversations (un mot de différence = quasi-doublon)
+USER_OPENINGS = ["", "Franchement, ", "Bon, ", "Attends, ", "Du coup, "]
+
+
+def fill(template: str, slots: Dict[str, str]) -> str:
+    capitalized = {key[0].upper() + key[1:]: value[0].upper() + value[1:] for key, value in slots.items() if value}
+    return template.format(**slots, **capitalized)
+
+
+def expansion_axes() -> Tuple[List[Tuple[str, Dict]], List[Tuple[str, str, str]], List[Tuple[int, ...]], List[str]]:
+    """
+    Axes de l'expansion : (persona, notion), échanges (attitude, formulation user,
+    formulation assistant), enchaînements d'échanges et entrées en matière.
+
+    Un enchaînement est un échange seul ou deux échanges d'attitudes différentes
+    (l'élève change de posture au second tour, la consigne système suit la dernière).
+    Au second tour, la formulation assistant est fixée par les trois autres
+    ((u1 + a1 + u2) mod n, un code de parité) : deux conversations diffèrent toujours
+    d'au moins deux messages. Le produit complet donnerait surtout des quasi-doublons
+    ne différant que d'une réplique. Ces listes restent petites : c'est le produit
+    notions x enchaînements qui est grand.
+    """
+    topics = [(key, notion) for key, persona in PERSONAS.items() for notion in persona["notions"]]
+    turns = []
+    turn_index: Dict[Tuple[str, int, int], int] = {}
+    for attitude, spec in ATTITUDES.items():
+        for u, user in enumerate(spec["user"]):
+            for a, assistant in enumerate(spec["assistant"]):
+                turn_index[attitude, u, a] = len(turns)
+                turns.append((attitude, user, assistant))
+
+    chains: List[Tuple[int, ...]] = [(i,) for i in range(len(turns))]
+    for first, first_spec in ATTITUDES.items():
+        for second, second_spec in ATTITUDES.items():
+            if first == second:
+                continue
+            for u1 in range(len(first_spec["user"])):
+                for a1 in range(len(first_spec["assistant"])):
+                    for u2 in range(len(second_spec["user"])):
+                        a2 = (u1 + a1 + u2) % len(second_spec["assistant"])
+                        chains.append((turn_index[first, u1, a1], turn_index[second, u2, a2]))
+    return topics, turns, chains, USER_OPENINGS
+
+
+def expansion_size() -> int:
+    """Nombre de conversations distinctes (notions x enchaînements)"""
+    topics, _, chains, _ = expansion_axes()
+    return len(topics) * len(chains)
+
+
+def expand_example(index: int, axes=None) -> Dict:
+    """Conversation numéro `index` (numérotation mixte notion x enchaînement)"""
+    topics, turns, chains, openings = axes or expansion_axes()
+    topic_index, chain_index = divmod(index, len(chains))
+    persona_key, notion = topics[topic_index]
+    exchanges = [turns[i] for i in chains[chain_index]]
+    persona = PERSONAS[persona_key]
+    slots = {"name": persona["name"], "oeuvre": persona["oeuvre"], **notion}
+
+    last_attitude = exchanges[-1][0]
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT_TEMPLATE.format(name=persona["name"]) + "\n" + ATTITUDES[last_attitude]["consigne"]}
+    ]
+    for attitude, user_template, assistant_template in exchanges:
+        messages.append({"role": "user", "content": fill(user_template, slots)})
+        messages.append({"role": "assistant", "content": fill(assistant_template, slots)})
+    opening = openings[index % len(openings)]
+    if opening:
+        first = messages[1]["content"]
+        # "OK, ..." garde ses majuscules, "Oui, ..." devient "Bon, oui, ..."
+        messages[1]["content"] = opening + (first if first[1:2].isupper() else first[0].lower() + first[1:])
+
+    return {
+        "messages": messages,
+        "metadata": {
+            "philosopher": persona_key,
+            "notion": notion["notion"],
+            "attitude": last_attitude,
+            "attitudes": [attitude for attitude, _, _ in exchanges],
+        },
+    }
+
+
+def shuffle_params(size: int, seed: Optional[int]) -> Tuple[int, int]:
+    """
+    Permutation affine i -> (a * i + b) mod size, avec a premier avec size
+
+    Mélange déterministe en O(1) mémoire : la position i de la sortie reçoit la
+    conversation (a * i + b) mod size, sans jamais matérialiser la permutation.
+    """
+    if seed is None or size < 2:
+        return 1, 0
+    rng = random.Random(seed)
+    while True:
+        a = rng.randrange(1, size)
+        if math.gcd(a, size) == 1:
+            return a, rng.randrange(size)
+
+
+def _expand_range(job: Tuple[int, int, int, int, int]) -> bytes:
+    start, end, size, a, b = job
+    axes = expansion_axes()
+    lines = [
+        json.dumps(expand_example((a * position + b) % size, axes), ensure_ascii=False)
+        for position in range(start, end)
+    ]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def expand_stream(
+    limit: Optional[int] = None,
+    seed: Optional[int] = 42,
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """
+    Blocs de lignes JSONL, dans l'ordre de sortie, produits par un pool de processus
+
+    Au plus `2 * workers` blocs sont en vol (mémoire bornée). Le contenu ne dépend que
+    de `seed` et `limit`, pas du nombre de workers.
+    """
+    size = expansion_size()
+    total = size if limit is None else min(limit, size)
+    a, b = shuffle_params(size, seed)
+    jobs = ((start, min(start + chunk_size, total), size, a, b) for start in range(0, total, chunk_size))
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for job in jobs:
+            yield _expand_range(job)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for job in jobs:
+            pending.append(executor.submit(_expand_range, job))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class ShardWriter:
+    """
+    Écrit des lignes JSONL dans `<prefix>-00000.jsonl[.gz]`, `<prefix>-00001...`
+
+    Un shard est fermé dès que sa taille sur disque (compressée le cas échéant)
+    atteint `max_bytes` ; une ligne n'est jamais coupée entre deux shards. Chaque
+    shard est écrit sous un nom temporaire puis renommé à sa fermeture.
+    """
+
+    def __init__(self, output_dir: Path, prefix: str, max_bytes: int, compress: bool = False):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.paths: List[Path] = []
+        self.lines = 0
+        self._raw: Optional[BinaryIO] = None
+        self._stream: Optional[BinaryIO] = None
+        self._path: Optional[Path] = None
+
+    @property
+    def suffix(self) -> str:
+        return ".jsonl.gz" if self.compress else ".jsonl"
+
+    def _open(self) -> None:
+        self._path = self.output_dir / f"{self.prefix}-{len(self.paths):05d}{self.suffix}"
+        self._raw = self._path.with_name(self._path.name + ".tmp").open("wb")
+        self._stream = gzip.GzipFile(fileobj=self._raw, mode="wb", mtime=0) if self.compress else self._raw
+
+    def _close_shard(self) -> None:
+        if self._stream is None:
+            return
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.close()
+        self._path.with_name(self._path.name + ".tmp").replace(self._path)
+        self.paths.append(self._path)
+        self._raw = self._stream = self._path = None
+
+    def write_block(self, block: bytes) -> None:
+        for line in block.splitlines(keepends=True):
+            if self._stream is None:
+                self._open()
+            self._stream.write(line)
+            self.lines += 1
+            if self._raw.tell() >= self.max_bytes:
+                self._close_shard()
+
+    def close(self) -> List[Path]:
+        self._close_shard()
+        return self.paths
+
+    def __enter__(self) -> "ShardWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def run_expand(args, root: Path) -> None:
+    """
+    Mode --expand : templates -> shards, avec saut si rien n'a changé
+
+    Le manifest est rangé avec les shards (`<output-dir>/manifest.json`), pas dans
+    le manifest du dépôt : une sortie ailleurs ne le touche pas.
+    """
+    output_dir = args.output_dir if args.output_dir.is_absolute() else root / args.output_dir
+    size = expansion_size()
+    if args.limit is not None and args.limit > size:
+        raise SystemExit(
+            f"❌ --limit {args.limit} dépasse les {size} conversations distinctes des templates "
+            "(ajouter des formulations ou des notions, ou omettre --limit)"
+        )
+    total = size if args.limit is None else args.limit
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(output_dir / MANIFEST_NAME)
+
+    previous = {} if args.force else manifest.section(EXPANDED_MANIFEST_SECTION)
+    version = content_hash(
+        {
+            "script": SCRIPT_VERSION,
+            "system_prompt": SYSTEM_PROMPT_TEMPLATE,
+            "templates": [PERSONAS, ATTITUDES, USER_OPENINGS],
+            "output_dir": str(output_dir),
+            "seed": args.seed,
+            "limit": total,
+            "shard_size_mb": args.shard_size_mb,
+            "compress": args.compress,
+        }
+    )
+    previous_paths = [Path(path) for path in (previous.get("outputs") or {})]
+    if previous.get("version") == version and previous_paths and outputs_unchanged(previous, previous_paths):
+        print(f"⚡ Dataset étendu à jour (manifest) : {len(previous_paths)} shards dans {output_dir}")
+        return
+
+    for stale in output_dir.glob(f"{EXPANDED_PREFIX}-*.jsonl*"):
+        stale.unlink()
+
+    print(f"🧩 Expansion de {total} conversations sur {size} combinaisons (seed={args.seed})...")
+    with ShardWriter(output_dir, EXPANDED_PREFIX, args.shard_size_mb * 1024**2, args.compress) as writer:
+        for block in expand_stream(total, args.seed, args.workers, args.chunk_size):
+            writer.write_block(block)
+    paths = writer.paths
+
+    manifest.update(EXPANDED_MANIFEST_SECTION, {"version": version, "outputs": output_signatures(paths)})
+    manifest.save()
+
+    print(f"✅ {writer.lines} conversations écrites dans {len(paths)} shards : {output_dir}")
+    print(f"   {len(PERSONAS)} philosophes x {len(ATTITUDES)} attitudes, {size} combinaisons possibles")
+
+
 def main():
     """Génère le dataset de correction en JSONL"""
-    output_path = Path(__file__).parent.parent / OUTPUT_PATH
+    parser = argparse.ArgumentParser(description="Génère le dataset de correction.")
+    parser.add_argument("--force", action="store_true", help="Ignore le manifest et réécrit la sortie.")
+    parser.add_argument("--expand", action="store_true", help="Développe les templates (PERSONAS x ATTITUDES) en shards.")
+    parser.add_argument("--output-dir", type=Path, default=EXPANDED_OUTPUT_DIR, help="Dossier des shards (--expand).")
+    parser.add_argument("--limit", type=int, default=None, help="Nombre de conversations (--expand, défaut : toutes ; erreur au-delà du nombre distinct).")
+    parser.add_argument("--seed", type=int, default=42, help="Seed du mélange (--expand).")
+    parser.add_argument("--shard-size-mb", type=int, default=DEFAULT_SHARD_SIZE_MB, help="Taille max d'un shard.")
+    parser.add_argument("--compress", action="store_true", help="Shards compressés en gzip.")
+    parser.add_argument("--workers", type=int, default=None, help="Processus d'expansion (défaut: nb de CPU).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Conversations par tâche de worker.")
+    args = parser.parse_args()
+
+    root = Path(__file__).parent.parent
+    if args.expand:
+        run_expand(args, root)
+        return
+    manifest = Manifest(root / MANIFEST_DIR / MANIFEST_NAME)
+
+    output_path = root / OUTPUT_PATH
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    
+
+    previous = {} if args.force else manifest.section(MANIFEST_SECTION)
+    version = content_hash({"script": SCRIPT_VERSION, "system_prompt": SYSTEM_PROMPT})
+    example_hashes = [content_hash(example) for example in CORRECTION_EXAMPLES]
+
+    if (
+        previous.get("version") == version
+        and previous.get("examples") == example_hashes
+        and outputs_unchanged(previous, [output_path])
+    ):
+        print(f"⚡ Dataset de correction à jour (manifest) : {output_path}")
+        return
+
+    changed = len(set(example_hashes) - set(previous.get("examples") or []))
     with output_path.open('w', encoding='utf-8') as f:
         for example in CORRECTION_EXAMPLES:
             f.write(json.dumps(example, ensure_ascii=False) + '\n')
-    
+
+    manifest.update(
+        MANIFEST_SECTION,
+        {
+            "version": version,
+            "examples": example_hashes,
+            "outputs": output_signatures([output_path]),
+        },
+    )
+    manifest.save()
+
     print(f"✅ Dataset de correction généré : {output_path}")
+    print(f"   {changed} exemples nouveaux ou modifiés depuis le dernier build")
     print(f"   {len(CORRECTION_EXAMPLES)} exemples de correction")
     print(f"\nPoints corrigés :")
     print(f"  - Première personne (pas 3ème)")
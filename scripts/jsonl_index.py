@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Accès aléatoire aux fichiers JSONL via un index d'offsets.
+
+Fonctionnalités :
+1. Index construit une fois à côté du fichier (`<fichier>.idx.npy` : début/fin de
+   chaque ligne non vide, `<fichier>.idx.json` : signature taille + mtime du JSONL)
+2. `JsonlDataset` : séquence adossée à un mmap, `ds[i]` en O(1) (seule la ligne i est parsée)
+3. Tranches et sous-ensembles sans copie (`ds[100:200]`, `ds.take([...])`)
+4. Itération mélangée reproductible et split train/eval par seed
+
+L'index est reconstruit automatiquement si le JSONL a changé (taille ou mtime).
+
+Usage en bibliothèque :
+    from jsonl_index import JsonlDataset
+
+    with JsonlDataset("data/FT/correction_dataset.jsonl") as ds:
+        example = ds[42]
+        train, eval_ = ds.split(eval_fraction=0.1, seed=42)
+
+Usage en ligne de commande (index + échantillon pour relecture) :
+    python scripts/jsonl_index.py data/FT/processed/*.jsonl --sample 5
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from dataset_manifest import file_signature
+
+INDEX_VERSION = 2
+READ_BLOCK_SIZE = 1 << 24
+NEWLINE = ord("\n")
+# Octets retirés par bytes.strip()
+WHITESPACE = np.zeros(256, dtype=bool)
+WHITESPACE[list(b" \t\n\r\x0b\x0c")] = True
+
+
+def index_paths(path: Path) -> Tuple[Path, Path]:
+    return path.with_name(path.name + ".idx.npy"), path.with_name(path.name + ".idx.json")
+
+
+def build_index(path: Path) -> np.ndarray:
+    """
+    Offsets [début, fin) de chaque ligne non vide (fin sans le saut de ligne).
+
+    Lecture par blocs : les sauts de ligne et le nombre d'octets non blancs de chaque
+    ligne sont calculés par numpy, sans décoder le texte.
+    """
+    newlines = []
+    content = []  # octets non blancs par ligne
+    carry = 0  # octets non blancs de la ligne en cours, à cheval sur plusieurs blocs
+    position = 0
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(READ_BLOCK_SIZE), b""):
+            data = np.frombuffer(block, dtype=np.uint8)
+            breaks = np.flatnonzero(data == NEWLINE)
+            is_content = ~WHITESPACE[data]
+            if len(breaks):
+                lines = is_content[:breaks[-1] + 1]
+                counts = np.add.reduceat(lines, np.concatenate([[0], breaks[:-1] + 1]), dtype=np.int64)
+                counts[0] += carry
+                content.append(counts)
+                carry = int(is_content[breaks[-1] + 1:].sum())
+            else:
+                carry += int(is_content.sum())
+            newlines.append(breaks + position)
+            position += len(block)
+
+    ends = np.concatenate(newlines + [np.array([position])]).astype(np.uint64)
+    starts = np.concatenate([np.array([0], dtype=np.uint64), ends[:-1] + 1])
+    offsets = np.stack([starts, ends], axis=1)
+
+    # Lignes vides ou blanches ignorées, comme `if not line.strip()` dans les autres lecteurs
+    keep = np.concatenate(content + [np.array([carry])]) > 0
+    return offsets[keep]
+
+
+def load_or_build_index(path: Path, rebuild: bool = False) -> np.ndarray:
+    """Index en mmap s'il correspond encore au fichier, sinon reconstruit et sauvegardé."""
+    offsets_path, meta_path = index_paths(path)
+    signature = file_signature(path)
+
+    if not rebuild and offsets_path.exists() and meta_path.exists():
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except json.JSONDecodeError:
+            meta = {}
+        if meta.get("version") == INDEX_VERSION and meta.get("source") == signature:
+            return np.load(offsets_path, mmap_mode="r")
+
+    offsets = build_index(path)
+    tmp_path = offsets_path.with_name(offsets_path.name + ".tmp")
+    with tmp_path.open("wb") as f:
+        np.save(f, offsets)
+    tmp_path.replace(offsets_path)
+    meta_path.write_text(
+        json.dumps({"version": INDEX_VERSION, "source": signature, "lines": int(len(offsets))}, indent=2),
+        encoding="utf-8",
+    )
+    return np.load(offsets_path, mmap_mode="r")
+
+
+class JsonlDataset(Sequence):
+    """
+    Séquence d'enregistrements JSONL en accès aléatoire.
+
+    Les tranches et `take` renvoient des vues partageant le même mmap et le même index
+    (seul le tableau des numéros de ligne est propre à la vue).
+    """
+
+    def __init__(self, path: Union[str, Path], rebuild_index: bool = False):
+        self.path = Path(path)
+        self._offsets = load_or_build_index(self.path, rebuild=rebuild_index)
+        self._rows: Optional[np.ndarray] = None
+        self._file = self.path.open("rb")
+        # mmap refuse les fichiers vides
+        self._mapped = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.path.stat().st_size else None
+
+    @classmethod
+    def _view(cls, parent: "JsonlDataset", rows: np.ndarray) -> "JsonlDataset":
+        view = cls.__new__(cls)
+        view.path = parent.path
+        view._offsets = parent._offsets
+        view._file = parent._file
+        view._mapped = parent._mapped
+        view._rows = rows
+        return view
+
+    def __len__(self) -> int:
+        return len(self._rows) if self._rows is not None else len(self._offsets)
+
+    def _line_number(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"index {index} hors de [0, {len(self)}) pour {self.path}")
+        return int(self._rows[index]) if self._rows is not None else index
+
+    def raw(self, index: int) -> bytes:
+        """Ligne brute (sans saut de ligne), sans parser le JSON."""
+        start, end = self._offsets[self._line_number(index)]
+        return self._mapped[int(start):int(end)]
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Dict, "JsonlDataset"]:
+        if isinstance(index, slice):
+            return self.take(range(len(self))[index])
+        return json.loads(self.raw(index))
+
+    def __iter__(self) -> Iterator[Dict]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def take(self, indices: Sequence[int]) -> "JsonlDataset":
+        """Vue sur les positions `indices` (relatives à cette séquence)."""
+        positions = np.asarray(indices, dtype=np.int64)
+        positions = np.where(positions < 0, positions + len(self), positions)
+        if positions.size and (positions.min() < 0 or positions.max() >= len(self)):
+            raise IndexError(f"indices hors de [0, {len(self)}) pour {self.path}")
+        return self._view(self, self._rows[positions] if self._rows is not None else positions)
+
+    def shuffled(self, seed: Optional[int] = None) -> Iterator[Dict]:
+        """Parcourt tous les enregistrements dans un ordre aléatoire (reproductible avec `seed`)."""
+        for index in np.random.default_rng(seed).permutation(len(self)):
+            yield self[int(index)]
+
+    def sample(self, count: int, seed: Optional[int] = None) -> List[Dict]:
+        """`count` enregistrements tirés sans remise."""
+        rng = np.random.default_rng(seed)
+        return [self[int(i)] for i in rng.choice(len(self), size=min(count, len(self)), replace=False)]
+
+    def split(self, eval_fraction: float = 0.1, seed: Optional[int] = None) -> Tuple["JsonlDataset", "JsonlDataset"]:
+        """Split train/eval aléatoire ; chaque partie garde l'ordre du fichier."""
+        permutation = np.random.default_rng(seed).permutation(len(self))
+        eval_size = int(round(len(self) * eval_fraction))
+        return self.take(np.sort(permutation[eval_size:])), self.take(np.sort(permutation[:eval_size]))
+
+    def close(self) -> None:
+        if self._mapped is not None:
+            self._mapped.close()
+        self._file.close()
+
+    def __enter__(self) -> "JsonlDataset":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def main() -> None:
+    args = parse_args()
+    for path in args.inputs:
+        with JsonlDataset(path, rebuild_index=args.rebuild) as ds:
+            print(f"📇 {path}: {len(ds)} enregistrements indexés ({index_paths(path)[0].name})")
+            for i, record in enumerate(ds.sample(args.sample, seed=args.seed), 1):
+                print(f"\n--- échantillon {i}/{args.sample} ---")
+                print(json.dumps(record, ensure_ascii=False, indent=2))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Indexe des JSONL pour l'accès aléatoire et affiche un échantillon.")
+    parser.add_argument("inputs", type=Path, nargs="+", help="Fichiers JSONL.")
+    parser.add_argument("--sample", type=int, default=0, help="Nombre d'enregistrements à afficher par fichier.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed de l'échantillon.")
+    parser.add_argument("--rebuild", action="store_true", help="Reconstruit l'index même s'il est à jour.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
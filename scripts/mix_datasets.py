@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Mélange pondéré et en streaming de plusieurs JSONL d'entraînement.
+
+Fonctionnalités :
+1. Chaque source a un poids (proportion visée) et une limite d'époques optionnelle
+   (`0.5` = la moitié de la source, `2` = deux passes, rien = illimité)
+2. Les sources sont entrelacées à la volée avec un RNG seedé : rien n'est chargé en
+   entier, les enregistrements sont lus à la demande via l'index de jsonl_index.py
+3. Ordre mélangé à chaque passe (reproductible), ou ordre du fichier avec --no-shuffle
+4. Stratification optionnelle (ex : `register`, `difficulty`) : dans une source sans
+   limite d'époques, la strate est tirée uniformément avant l'enregistrement, pour
+   équilibrer les registres `lyceen` / `intermediaire` / `avance` et les niveaux de
+   difficulté. Avec une limite, elle est tirée au prorata de ce qu'il reste à lire
+   dans la passe en cours : `1` époque = chaque enregistrement exactement une fois
+   (les strates restent entrelacées, mais dans leurs proportions d'origine)
+5. Quand une source atteint sa limite, les poids des sources restantes sont renormalisés
+
+Les clés de stratification sont lues à la racine de l'enregistrement ou dans
+`metadata` ; les sources sans ces champs forment une seule strate.
+
+Usage (depuis bergsonAndFriends/) :
+    python ../scripts/mix_datasets.py \
+        --source data/FT/processed/schemes_levelA_augmented.jsonl:0.5:1 \
+        --source data/FT/correction_dataset.jsonl:0.3 \
+        --source data/FT/processed/enriched_correction_dataset.jsonl:0.2:2 \
+        --stratify register difficulty --num-samples 2000 --seed 42 \
+        --output data/FT/processed/mixture.jsonl
+
+En bibliothèque (ex : dans le notebook, à la place de concatenate_datasets) :
+    sampler = MixtureSampler([Source(path_a, 0.7, epochs=1), Source(path_b, 0.3)], seed=42, num_samples=5000)
+    dataset = IterableDataset.from_generator(lambda: iter(sampler))
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from jsonl_index import JsonlDataset
+
+Stratum = Tuple[Optional[str], ...]
+
+
+@dataclass
+class Source:
+    path: Path
+    weight: float
+    epochs: Optional[float] = None  # None = illimité
+
+    @classmethod
+    def parse(cls, spec: str) -> "Source":
+        """`chemin:poids[:époques]`"""
+        parts = spec.split(":")
+        if len(parts) not in (2, 3):
+            raise ValueError(f"Source invalide '{spec}' (attendu chemin:poids[:époques])")
+        epochs = float(parts[2]) if len(parts) == 3 else None
+        return cls(Path(parts[0]), float(parts[1]), epochs)
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+
+def stratum_of(record: Dict, keys: Sequence[str]) -> Stratum:
+    metadata = record.get("metadata") or {}
+    return tuple(record.get(key, metadata.get(key)) for key in keys)
+
+
+class SourceStream:
+    """
+    Lecture à la demande d'une source : une file de numéros de ligne par strate,
+    remélangée à chaque fois qu'elle est épuisée. Le budget (époques x taille) compte
+    les enregistrements émis, toutes strates confondues ; avec un budget, la strate
+    est tirée au prorata des lignes restantes de sa file (voir next_raw).
+    """
+
+    def __init__(self, source: Source, rng: np.random.Generator, stratify: Sequence[str] = (), shuffle: bool = True):
+        self.source = source
+        self.rng = rng
+        self.shuffle = shuffle
+        self.dataset = JsonlDataset(source.path)
+        self.budget = None if source.epochs is None else int(round(source.epochs * len(self.dataset)))
+        self.emitted = 0
+
+        if stratify:
+            # Un passage pour connaître la strate de chaque ligne : seuls les numéros sont gardés
+            rows_by_stratum: Dict[Stratum, List[int]] = defaultdict(list)
+            for row, record in enumerate(self.dataset):
+                rows_by_stratum[stratum_of(record, stratify)].append(row)
+            self.strata = {stratum: np.asarray(rows) for stratum, rows in rows_by_stratum.items()}
+        else:
+            self.strata = {(): np.arange(len(self.dataset))} if len(self.dataset) else {}
+        self._keys = list(self.strata)
+        self._queues: Dict[Stratum, Iterator[int]] = {}
+        self._remaining: Dict[Stratum, int] = dict.fromkeys(self._keys, 0)
+
+    @property
+    def exhausted(self) -> bool:
+        return not self.strata or (self.budget is not None and self.emitted >= self.budget)
+
+    def _refill(self, stratum: Stratum) -> None:
+        rows = self.strata[stratum]
+        self._queues[stratum] = iter((self.rng.permutation(rows) if self.shuffle else rows).tolist())
+        self._remaining[stratum] = len(rows)
+
+    def _next_row(self, stratum: Stratum) -> int:
+        if not self._remaining[stratum]:
+            self._refill(stratum)
+        self._remaining[stratum] -= 1
+        return next(self._queues[stratum])
+
+    def _next_stratum(self) -> Stratum:
+        if len(self._keys) == 1:
+            return self._keys[0]
+        if self.budget is None:
+            return self._keys[self.rng.integers(len(self._keys))]
+        # Un tirage uniforme relirait les petites strates et sauterait une partie des grandes
+        if not any(self._remaining.values()):
+            # Début de passe : toutes les files repartent pleines
+            for key in self._keys:
+                self._refill(key)
+        remaining = np.array([self._remaining[key] for key in self._keys], dtype=np.float64)
+        return self._keys[self.rng.choice(len(self._keys), p=remaining / remaining.sum())]
+
+    def next_raw(self) -> Tuple[Stratum, bytes]:
+        stratum = self._next_stratum()
+        self.emitted += 1
+        return stratum, self.dataset.raw(self._next_row(stratum))
+
+    def close(self) -> None:
+        self.dataset.close()
+
+
+class MixtureSampler:
+    """
+    Entrelace les sources selon leurs poids jusqu'à `num_samples` enregistrements ou
+    jusqu'à épuisement de toutes les sources limitées en époques.
+    """
+
+    def __init__(
+        self,
+        sources: Sequence[Source],
+        seed: Optional[int] = None,
+        num_samples: Optional[int] = None,
+        stratify: Sequence[str] = (),
+        shuffle: bool = True,
+    ):
+        if num_samples is None and any(source.epochs is None for source in sources):
+            raise ValueError("Sans num_samples, chaque source doit avoir une limite d'époques")
+        self.sources = list(sources)
+        self.seed = seed
+        self.num_samples = num_samples
+        self.stratify = list(stratify)
+        self.shuffle = shuffle
+        self.counts: Counter = Counter()
+
+    def iter_raw(self) -> Iterator[Tuple[str, Stratum, bytes]]:
+        """(nom de la source, strate, ligne JSON brute) : évite de reparser pour réécrire."""
+        rng = np.random.default_rng(self.seed)
+        streams = [SourceStream(source, rng, self.stratify, self.shuffle) for source in self.sources]
+        self.counts = Counter()
+        produced = 0
+        try:
+            while self.num_samples is None or produced < self.num_samples:
+                active = [stream for stream in streams if not stream.exhausted]
+                if not active:
+                    break
+                weights = np.array([stream.source.weight for stream in active], dtype=np.float64)
+                stream = active[rng.choice(len(active), p=weights / weights.sum())]
+                stratum, raw = stream.next_raw()
+                self.counts[(stream.source.name, stratum)] += 1
+                produced += 1
+                yield stream.source.name, stratum, raw
+        finally:
+            for stream in streams:
+                stream.close()
+
+    def __iter__(self) -> Iterator[Dict]:
+        for _, _, raw in self.iter_raw():
+            yield json.loads(raw)
+
+
+def print_report(counts: Counter, stratify: Sequence[str]) -> None:
+    total = sum(counts.values())
+    by_source: Counter = Counter()
+    for (source, _), count in counts.items():
+        by_source[source] += count
+
+    print("\n📊 Mélange :")
+    for source, count in by_source.most_common():
+        print(f"  - {source}: {count} ({100 * count / total:.1f}%)")
+        if stratify:
+            for (name, stratum), stratum_count in sorted(counts.items(), key=lambda item: str(item[0])):
+                if name == source:
+                    label = ", ".join(f"{key}={value}" for key, value in zip(stratify, stratum))
+                    print(f"      {label}: {stratum_count}")
+    print(f"  Total : {total}")
+
+
+def main() -> None:
+    args = parse_args()
+    sources = [Source.parse(spec) for spec in args.source]
+    try:
+        sampler = MixtureSampler(sources, args.seed, args.num_samples, args.stratify, shuffle=not args.no_shuffle)
+    except ValueError as exc:
+        raise SystemExit(f"❌ {exc}")
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = args.output.with_name(args.output.name + ".tmp")
+    with tmp_path.open("wb") as f:
+        for _, _, raw in sampler.iter_raw():
+            f.write(raw.rstrip(b"\r"))
+            f.write(b"\n")
+    tmp_path.replace(args.output)
+
+    print_report(sampler.counts, args.stratify)
+    print(f"\n✅ Écrit : {args.output}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Mélange pondéré et en streaming de JSONL d'entraînement.")
+    parser.add_argument(
+        "--source",
+        action="append",
+        required=True,
+        help="chemin:poids[:époques] (répétable). Sans époques, la source est rebouclée sans limite.",
+    )
+    parser.add_argument("--num-samples", type=int, default=None, help="Nombre d'enregistrements à produire.")
+    parser.add_argument("--stratify", nargs="*", default=[], help="Clés de stratification (ex : register difficulty).")
+    parser.add_argument("--seed", type=int, default=42, help="Seed du tirage.")
+    parser.add_argument("--no-shuffle", action="store_true", help="Parcourt chaque source dans l'ordre du fichier.")
+    parser.add_argument("--output", type=Path, required=True, help="JSONL de sortie.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Regroupe les conversations pré-tokenisées dans des lignes de `max_seq_length` tokens.
+
+Fonctionnalités :
+1. Bin-packing "best-fit decreasing" des conversations (cache de tokenize_dataset.py)
+2. `position_ids` remis à zéro au début de chaque conversation + bornes (`cu_seqlens`)
+   pour que les exemples d'une même ligne ne s'attendent pas entre eux
+   (flash-attention 2 / `DataCollatorWithFlattening` déduisent les frontières des position_ids)
+3. Labels "assistant uniquement", -100 sur le premier token de chaque segment et le padding
+4. Rapport du taux de padding avant / après packing : sans packing, comparé à un padding
+   fixe à `max_seq_length` et au padding par lot (au plus long du lot, comme le collator
+   du Trainer, lots de --batch-size tirés dans un ordre mélangé)
+
+Isolation des exemples d'une ligne : seule l'attention flash-attention 2
+(`attn_implementation="flash_attention_2"`) lit les frontières dans les `position_ids`.
+Avec "eager" ou "sdpa", le masque causal couvre toute la ligne et chaque conversation
+voit les précédentes (contamination entre exemples) ; il faudrait alors un masque
+par bloc construit depuis `cu_seqlens`. train_lora.py ne consomme pas cette sortie :
+elle est destinée à une boucle d'entraînement qui charge le modèle en FA2.
+
+Usage :
+    python scripts/pack_sequences.py \
+        --tokenizer mistralai/Mistral-7B-Instruct-v0.3 \
+        --inputs data/FT/processed/schemes_levelA_augmented.jsonl \
+        --max-seq-length 512 --batch-size 8
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from tokenize_dataset import DEFAULT_CACHE_DIR, DEFAULT_TOKENIZER, TokenizedDataset, build_or_load
+
+DEFAULT_MAX_SEQ_LENGTH = 512  # configs/mistral_7b_lora.yaml -> data.max_seq_length
+DEFAULT_BATCH_SIZE = 8  # configs/mistral_7b_lora.yaml -> training.per_device_train_batch_size
+PACK_VERSION = 1
+IGNORE_INDEX = -100
+
+
+@dataclass
+class PackingReport:
+    examples: int
+    tokens: int
+    rows_before: int
+    rows_after: int
+    truncated: int
+    max_seq_length: int
+
+    @property
+    def padding_before(self) -> float:
+        """Par rapport à des lignes toutes paddées à max_seq_length (borne haute)"""
+        return 1 - self.tokens / (self.rows_before * self.max_seq_length) if self.rows_before else 0.0
+
+    @property
+    def padding_after(self) -> float:
+        return 1 - self.tokens / (self.rows_after * self.max_seq_length) if self.rows_after else 0.0
+
+
+class PackedDataset:
+    """
+    Dataset packé ouvert en memory-map.
+
+    Chaque item contient `input_ids`, `labels`, `attention_mask`, `position_ids`
+    (longueur fixe `max_seq_length`) et `cu_seqlens`, les bornes cumulées des
+    segments de la ligne (padding exclu). `attention_mask` ne sépare pas les
+    segments : sans flash-attention 2, utiliser `cu_seqlens` (voir l'en-tête).
+    """
+
+    def __init__(self, pack_dir: Path):
+        self.pack_dir = pack_dir
+        self.meta = json.loads((pack_dir / "meta.json").read_text(encoding="utf-8"))
+        self._arrays = {
+            name: np.load(pack_dir / f"{name}.npy", mmap_mode="r")
+            for name in ("input_ids", "labels", "position_ids", "seq_lens", "row_offsets", "example_ids")
+        }
+
+    def __len__(self) -> int:
+        return len(self._arrays["row_offsets"]) - 1
+
+    def __getitem__(self, index: int) -> Dict[str, np.ndarray]:
+        start, end = self._arrays["row_offsets"][index], self._arrays["row_offsets"][index + 1]
+        seq_lens = self._arrays["seq_lens"][start:end]
+        used = int(seq_lens.sum())
+        attention_mask = np.zeros(self.meta["max_seq_length"], dtype=np.int64)
+        attention_mask[:used] = 1
+        return {
+            "input_ids": self._arrays["input_ids"][index],
+            "labels": self._arrays["labels"][index],
+            "attention_mask": attention_mask,
+            "position_ids": self._arrays["position_ids"][index],
+            "cu_seqlens": np.concatenate([[0], np.cumsum(seq_lens)]),
+            "example_ids": self._arrays["example_ids"][start:end],
+        }
+
+
+def main() -> None:
+    args = parse_args()
+
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer, trust_remote_code=True)
+    datasets = build_or_load(args.inputs, tokenizer, args.cache_dir, verbose=True)
+
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    pack_dir = args.cache_dir / "packed" / pack_key(datasets, args.max_seq_length)
+    if (pack_dir / "meta.json").exists():
+        print(f"⚡ Cache : {pack_dir}")
+        report = PackingReport(**json.loads((pack_dir / "meta.json").read_text(encoding="utf-8"))["report"])
+    else:
+        report = pack_datasets(datasets, pack_dir, args.max_seq_length, pad_id)
+
+    lengths = np.concatenate([ds.lengths() for ds in datasets]) if datasets else np.zeros(0, dtype=np.int64)
+    print_report(report, batch_padding(lengths, args.max_seq_length, args.batch_size), args.batch_size)
+    print(f"\n📄 Sortie : {pack_dir}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Packe les conversations tokenisées en lignes de taille fixe.")
+    parser.add_argument("--inputs", type=Path, nargs="+", required=True, help="Fichiers JSONL (champ messages).")
+    parser.add_argument("--tokenizer", default=DEFAULT_TOKENIZER, help="Nom HF ou chemin local du tokenizer.")
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR, help="Racine du cache.")
+    parser.add_argument("--max-seq-length", type=int, default=DEFAULT_MAX_SEQ_LENGTH, help="Taille des lignes packées.")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Lots du padding sans packing (rapport seulement).",
+    )
+    return parser.parse_args()
+
+
+def pack_key(datasets: Sequence[TokenizedDataset], max_seq_length: int) -> str:
+    payload = json.dumps(
+        {
+            "version": PACK_VERSION,
+            "entries": [ds.meta["key"] for ds in datasets],
+            "max_seq_length": max_seq_length,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+
+def batch_padding(lengths: np.ndarray, max_seq_length: int, batch_size: int, seed: int = 0) -> float:
+    """
+    Taux de padding sans packing quand chaque lot est paddé à sa plus longue séquence
+
+    Ordre mélangé (seedé) comme le sampler aléatoire du Trainer : le résultat est une
+    estimation, le padding réel dépend des lots tirés.
+    """
+    lengths = np.minimum(np.asarray(lengths, dtype=np.int64), max_seq_length)
+    if not len(lengths):
+        return 0.0
+    shuffled = np.random.default_rng(seed).permutation(lengths)
+    starts = np.arange(0, len(shuffled), batch_size)
+    longest = np.maximum.reduceat(shuffled, starts)
+    sizes = np.diff(np.append(starts, len(shuffled)))
+    return 1 - shuffled.sum() / (longest * sizes).sum()
+
+
+def best_fit_decreasing(lengths: Sequence[int], capacity: int) -> List[List[int]]:
+    """
+    Range les indices de `lengths` dans des lignes de taille `capacity`.
+
+    Les séquences sont placées de la plus longue à la plus courte, chacune dans la
+    ligne où il reste le moins de place suffisante. Les lignes sont indexées par
+    place restante (0..capacity), donc chaque placement coûte au plus `capacity`
+    tests, sans comparaison entre toutes les lignes. Résultat déterministe.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: (-lengths[i], i))
+    bins: List[List[int]] = []
+    bins_by_space: List[List[int]] = [[] for _ in range(capacity + 1)]
+
+    for idx in order:
+        length = min(lengths[idx], capacity)
+        for space in range(length, capacity + 1):
+            if bins_by_space[space]:
+                bin_idx = bins_by_space[space].pop()
+                break
+        else:
+            bin_idx = len(bins)
+            bins.append([])
+            space = capacity
+        bins[bin_idx].append(idx)
+        bins_by_space[space - length].append(bin_idx)
+    return bins
+
+
+def pack_datasets(
+    datasets: Sequence[TokenizedDataset], pack_dir: Path, max_seq_length: int, pad_id: int
+) -> PackingReport:
+    items = [(ds_idx, i) for ds_idx, ds in enumerate(datasets) for i in range(len(ds))]
+    lengths = np.concatenate([ds.lengths() for ds in datasets]).tolist() if datasets else []
+    rows = best_fit_decreasing(lengths, max_seq_length)
+
+    tmp_dir = pack_dir.with_name(pack_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    # Écrit directement dans des memory-maps : la taille du dataset packé ne borne pas la RAM.
+    shape = (len(rows), max_seq_length)
+    input_ids = open_memmap(tmp_dir / "input_ids.npy", mode="w+", dtype=np.int32, shape=shape)
+    labels = open_memmap(tmp_dir / "labels.npy", mode="w+", dtype=np.int32, shape=shape)
+    position_ids = open_memmap(tmp_dir / "position_ids.npy", mode="w+", dtype=np.int32, shape=shape)
+    input_ids[:] = pad_id
+    labels[:] = IGNORE_INDEX
+    position_ids[:] = 0
+    seq_lens: List[int] = []
+    example_ids: List[int] = []
+    row_offsets = [0]
+    truncated = 0
+
+    for row_idx, row in enumerate(rows):
+        cursor = 0
+        for item_idx in row:
+            ds_idx, local_idx = items[item_idx]
+            example = datasets[ds_idx][local_idx]
+            length = min(len(example["input_ids"]), max_seq_length)
+            truncated += len(example["input_ids"]) > max_seq_length
+            end = cursor + length
+            input_ids[row_idx, cursor:end] = example["input_ids"][:length]
+            labels[row_idx, cursor:end] = example["labels"][:length]
+            labels[row_idx, cursor] = IGNORE_INDEX  # pas de prédiction à travers une frontière
+            position_ids[row_idx, cursor:end] = np.arange(length)
+            cursor = end
+            seq_lens.append(length)
+            example_ids.append(item_idx)
+        row_offsets.append(len(seq_lens))
+
+    report = PackingReport(
+        examples=len(lengths),
+        tokens=int(sum(seq_lens)),
+        rows_before=len(lengths),
+        rows_after=len(rows),
+        truncated=int(truncated),
+        max_seq_length=max_seq_length,
+    )
+
+    for array in (input_ids, labels, position_ids):
+        array.flush()
+    del input_ids, labels, position_ids
+    np.save(tmp_dir / "seq_lens.npy", np.asarray(seq_lens, dtype=np.int32))
+    np.save(tmp_dir / "row_offsets.npy", np.asarray(row_offsets, dtype=np.int64))
+    np.save(tmp_dir / "example_ids.npy", np.asarray(example_ids, dtype=np.int64))
+    meta = {
+        "max_seq_length": max_seq_length,
+        "sources": [ds.meta["source"] for ds in datasets],
+        "entries": [ds.meta["key"] for ds in datasets],
+        "report": report.__dict__,
+        "version": PACK_VERSION,
+    }
+    (tmp_dir / "meta.json").write_text(json.dumps(meta, indent=2, ensure_ascii=False), encoding="utf-8")
+    if pack_dir.exists():
+        shutil.rmtree(pack_dir)
+    tmp_dir.rename(pack_dir)
+    return report
+
+
+def print_report(report: PackingReport, per_batch_padding: Optional[float] = None, batch_size: Optional[int] = None) -> None:
+    print(f"\n✅ {report.examples} conversations, {report.tokens} tokens (lignes de {report.max_seq_length}).")
+    print(f"   - Sans packing : {report.rows_before:>6} lignes, padding {report.padding_before:6.1%} (padding fixe à {report.max_seq_length})")
+    if per_batch_padding is not None:
+        print(f"{'':>43}{per_batch_padding:6.1%} (padding par lot de {batch_size}, estimé)")
+    print(f"   - Avec packing : {report.rows_after:>6} lignes, padding {report.padding_after:6.1%}")
+    if report.rows_before:
+        print(f"   - Réduction    : {1 - report.rows_after / report.rows_before:6.1%} de lignes en moins")
+    if report.truncated:
+        print(f"   ⚠️ {report.truncated} conversations tronquées à {report.max_seq_length} tokens")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,25 +7,58 @@ Fonctionnalités :
 2. Extraction des métadonnées (schème, contexte, difficulté heuristique)
 3. Génération d'un JSONL "base" + d'un JSONL "augmenté" avec variations de registre
 4. Résumé des statistiques par schème
+5. Mode streaming (--stream) : lecture du tableau JSON élément par élément,
+   transformation dans un pool de processus, écriture au fil de l'eau
+   (mémoire bornée hors hashes du manifest, ordre de sortie identique au mode classique)
+6. Sortie Parquet compacte optionnelle (--formats jsonl parquet) : une seule
+   copie de chaque champ, colonnes catégorielles et prompts système encodés
+   par dictionnaire, chargeable via `load_dataset("parquet", ...)`
+7. Reconstruction incrémentale via `manifest.json` (voir dataset_manifest.py) :
+   rien n'est refait si l'entrée, les prompts et les sorties n'ont pas bougé ;
+   sinon seuls les exemples modifiés ou nouveaux sont retransformés (--force pour tout refaire)
 
 Usage :
     python scripts/prepare_schemes_dataset.py \
         --input data/FT/Dataset\ Niveau\ A\ Schemes.txt \
         --output-dir data/FT/processed
+
+    python scripts/prepare_schemes_dataset.py --stream --workers 8
+    python scripts/prepare_schemes_dataset.py --formats jsonl parquet
 """
 from __future__ import annotations
 
 import argparse
 import json
+import os
 import re
 import unicodedata
-from collections import Counter
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from dataclasses import dataclass
+from itertools import islice
 from pathlib import Path
-from typing import Dict, Iterable, List
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dataset_manifest import (
+    MANIFEST_NAME,
+    Manifest,
+    content_hash,
+    file_hash,
+    output_signatures,
+    outputs_unchanged,
+)
 
 DEFAULT_INPUT = Path("data/FT/Dataset Niveau A Schemes.txt")
 DEFAULT_OUTPUT_DIR = Path("data/FT/processed")
+STREAM_READ_SIZE = 1 << 16  # 64 Ko lus à chaque fois en mode streaming
+DEFAULT_CHUNK_SIZE = 256  # exemples bruts envoyés à chaque worker
+PARQUET_ROW_GROUP_SIZE = 10_000
+
+OUTPUT_FORMATS = {"jsonl": ".jsonl", "parquet": ".parquet"}
+
+SCRIPT_VERSION = 1  # à incrémenter si la transformation change (invalide le manifest)
+MANIFEST_SECTION = "prepare_schemes_dataset"
 
 BASE_SYSTEM_PROMPT = (
     "Tu es un tuteur philosophique maîtrisant les schèmes logiques. "
@@ -87,29 +120,198 @@ class Example:
             },
         }
 
+    @classmethod
+    def from_record(cls, record: Dict) -> "Example":
+        return cls(
+            schema=record["schema"],
+            context=record["context"],
+            user_prompt=record["user"],
+            assistant=record["assistant"],
+            level=record["level"],
+        )
+
+    def to_compact_record(self, register: str = "lyceen") -> Dict:
+        """
+        Variante sans doublons pour le format colonne : `messages` porte seul le
+        prompt système et les tours user/assistant, les métadonnées n'apparaissent
+        qu'une fois.
+        """
+        system_prompt = SYSTEM_SUFFIX_BY_REGISTER.get(register, BASE_SYSTEM_PROMPT)
+        return {
+            "schema": self.schema,
+            "context": self.context,
+            "level": self.level,
+            "register": register,
+            "difficulty": classify_difficulty(self.context),
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": self.user_prompt},
+                {"role": "assistant", "content": self.assistant},
+            ],
+        }
+
+    def to_output_record(self, register: str, fmt: str) -> Dict:
+        if fmt == "parquet":
+            return self.to_compact_record(register)
+        return self.to_record(register)
+
 
 def main() -> None:
     args = parse_args()
-    raw_examples = load_raw_examples(args.input)
-    processed = [transform_example(item) for item in raw_examples]
 
     output_dir = args.output_dir
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    base_path = output_dir / "schemes_levelA_base.jsonl"
-    augmented_path = output_dir / "schemes_levelA_augmented.jsonl"
-
-    write_jsonl(base_path, (ex.to_record("lyceen") for ex in processed))
-    write_jsonl(
-        augmented_path,
-        (
-            ex.to_record(register)
-            for ex in processed
-            for register in REGISTER_INSTRUCTIONS.keys()
-        ),
+    targets = [(fmt, *output_paths(output_dir, fmt)) for fmt in args.formats]
+    output_files = [path for _, base_path, augmented_path in targets for path in (base_path, augmented_path)]
+
+    manifest = Manifest(output_dir / MANIFEST_NAME)
+    previous = {} if args.force else manifest.section(MANIFEST_SECTION)
+    version = prompt_version()
+    input_hash = file_hash(args.input)
+
+    if (
+        previous.get("version") == version
+        and previous.get("input_hash") == input_hash
+        and outputs_unchanged(previous, output_files)
+    ):
+        print("⚡ Sorties à jour (manifest) : rien à reconstruire.\n")
+        summarize(Counter(previous["schema_counts"]), output_files)
+        return
+
+    if args.stream:
+        # Les hashes sont relevés au passage : un build classique suivant reprend les lignes
+        example_hashes: List[List[str]] = []
+        pending_hashes: deque = deque()
+
+        def hashed(raw_examples: Iterable[dict]) -> Iterator[dict]:
+            for item in raw_examples:
+                pending_hashes.append(content_hash(item))
+                yield item
+
+        def recorded(examples: Iterable[Example]) -> Iterator[Example]:
+            # transform_stream rend les exemples dans l'ordre d'entrée
+            for ex in examples:
+                example_hashes.append([pending_hashes.popleft(), ex.schema])
+                yield ex
+
+        examples = transform_stream(
+            hashed(iter_raw_examples(args.input)),
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+        )
+        counter = write_outputs_streaming(recorded(examples), targets)
+    else:
+        counter, example_hashes = build_incremental(
+            load_raw_examples(args.input), previous, version, output_dir, targets
+        )
+
+    manifest.update(
+        MANIFEST_SECTION,
+        {
+            "version": version,
+            "input": str(args.input),
+            "input_hash": input_hash,
+            "examples": example_hashes,
+            "schema_counts": dict(counter),
+            "outputs": output_signatures(output_files),
+        },
     )
+    manifest.save()
+    summarize(counter, output_files)
 
-    summarize(processed, base_path, augmented_path)
+
+def prompt_version() -> str:
+    return content_hash(
+        {
+            "script": SCRIPT_VERSION,
+            "base_system_prompt": BASE_SYSTEM_PROMPT,
+            "register_instructions": REGISTER_INSTRUCTIONS,
+        }
+    )
+
+
+def build_incremental(
+    raw_examples: List[dict],
+    previous: Dict,
+    version: str,
+    output_dir: Path,
+    targets: List[Tuple[str, Path, Path]],
+) -> Tuple[Counter, List[List[str]]]:
+    """
+    Ne retransforme que les exemples dont le hash n'est pas dans le build précédent.
+
+    Les lignes JSONL des exemples inchangés sont recopiées telles quelles depuis les
+    sorties précédentes (ni `transform_example` ni `json.dumps`). Les sorties Parquet
+    sont réécrites à partir des mêmes lignes.
+    """
+    previous_lines = load_previous_lines(previous, version, *output_paths(output_dir, "jsonl"))
+
+    counter: Counter = Counter()
+    example_hashes: List[List[str]] = []
+    base_lines: List[str] = []
+    augmented_lines: List[List[str]] = []
+    transformed = 0
+
+    for item in raw_examples:
+        item_hash = content_hash(item)
+        cached = previous_lines.get(item_hash)
+        if cached is not None:
+            schema, base_line, register_lines = cached
+        else:
+            ex = transform_example(item)
+            transformed += 1
+            schema = ex.schema
+            base_line = dump_record(ex.to_record("lyceen"))
+            register_lines = [dump_record(ex.to_record(register)) for register in REGISTER_INSTRUCTIONS.keys()]
+        counter[schema] += 1
+        example_hashes.append([item_hash, schema])
+        base_lines.append(base_line)
+        augmented_lines.append(register_lines)
+
+    print(f"🔄 {transformed} exemples (re)transformés, {len(raw_examples) - transformed} repris du build précédent.\n")
+
+    for fmt, base_path, augmented_path in targets:
+        if fmt == "jsonl":
+            write_jsonl_lines(base_path, base_lines)
+            write_jsonl_lines(augmented_path, (line for lines in augmented_lines for line in lines))
+            continue
+        examples = [Example.from_record(json.loads(line)) for line in base_lines]
+        write_parquet(base_path, (ex.to_output_record("lyceen", fmt) for ex in examples))
+        write_parquet(
+            augmented_path,
+            (
+                ex.to_output_record(register, fmt)
+                for ex in examples
+                for register in REGISTER_INSTRUCTIONS.keys()
+            ),
+        )
+
+    return counter, example_hashes
+
+
+def load_previous_lines(
+    previous: Dict, version: str, base_path: Path, augmented_path: Path
+) -> Dict[str, Tuple[str, str, List[str]]]:
+    """
+    hash d'exemple -> (schème, ligne base, lignes augmentées) du build précédent,
+    ou {} si les prompts ont changé ou si les JSONL ont été modifiés à la main.
+    """
+    hashes = previous.get("examples") or []
+    if previous.get("version") != version or not hashes:
+        return {}
+    if not outputs_unchanged(previous, [base_path, augmented_path]):
+        return {}
+
+    n_registers = len(REGISTER_INSTRUCTIONS)
+    base_lines = base_path.read_text(encoding="utf-8").splitlines()
+    augmented = augmented_path.read_text(encoding="utf-8").splitlines()
+    if len(base_lines) != len(hashes) or len(augmented) != n_registers * len(hashes):
+        return {}
+    return {
+        item_hash: (schema, base_lines[i], augmented[i * n_registers:(i + 1) * n_registers])
+        for i, (item_hash, schema) in enumerate(hashes)
+    }
 
 
 def parse_args() -> argparse.Namespace:
@@ -121,9 +323,46 @@ def parse_args() -> argparse.Namespace:
         default=DEFAULT_OUTPUT_DIR,
         help="Répertoire de sortie (créé si besoin).",
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Lecture incrémentale + pool de processus (mémoire bornée).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Nombre de processus en mode --stream (défaut : nombre de cœurs, 1 = sans pool).",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help="Exemples bruts par tâche envoyée à un worker en mode --stream.",
+    )
+    parser.add_argument(
+        "--formats",
+        nargs="+",
+        choices=sorted(OUTPUT_FORMATS),
+        default=["jsonl"],
+        help="Formats de sortie (parquet nécessite pyarrow).",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Ignore le manifest et reconstruit toutes les sorties.",
+    )
     return parser.parse_args()
 
 
+def output_paths(output_dir: Path, fmt: str) -> Tuple[Path, Path]:
+    suffix = OUTPUT_FORMATS[fmt]
+    return (
+        output_dir / f"schemes_levelA_base{suffix}",
+        output_dir / f"schemes_levelA_augmented{suffix}",
+    )
+
+
 def load_raw_examples(path: Path) -> List[dict]:
     if not path.exists():
         raise FileNotFoundError(f"Fichier introuvable : {path}")
@@ -137,6 +376,125 @@ def load_raw_examples(path: Path) -> List[dict]:
     return data
 
 
+def iter_raw_examples(path: Path, read_size: int = STREAM_READ_SIZE) -> Iterator[dict]:
+    """
+    Parcourt le tableau JSON de premier niveau élément par élément.
+
+    Seul l'élément en cours de décodage est gardé en mémoire : le fichier est lu
+    par blocs de `read_size` caractères et chaque élément est décodé avec
+    `JSONDecoder.raw_decode` dès qu'il est complet. Comme `json.load`, refuse une
+    virgule finale (`[1,]`) et tout contenu après le `]` final.
+    """
+    if not path.exists():
+        raise FileNotFoundError(f"Fichier introuvable : {path}")
+
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r"\s*")
+    delimiter = re.compile(r"[\s,\]]")
+
+    with path.open("r", encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def fill() -> bool:
+            nonlocal buffer, pos, eof
+            chunk = f.read(read_size)
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return True
+
+        def skip_whitespace() -> None:
+            nonlocal pos
+            while True:
+                pos = whitespace.match(buffer, pos).end()
+                if pos < len(buffer) or not fill():
+                    return
+
+        skip_whitespace()
+        if pos >= len(buffer) or buffer[pos] != "[":
+            raise ValueError("Le dataset doit être une liste JSON.")
+        pos += 1
+
+        expect_item = True
+        after_comma = False
+        while True:
+            skip_whitespace()
+            if pos >= len(buffer):
+                raise ValueError(f"Impossible de parser {path}: tableau JSON non terminé")
+            char = buffer[pos]
+            if char == "]":
+                if after_comma:
+                    raise ValueError(f"Impossible de parser {path}: virgule avant ']'")
+                pos += 1
+                skip_whitespace()
+                if pos < len(buffer):
+                    raise ValueError(f"Impossible de parser {path}: contenu après la fin du tableau ({buffer[pos]!r})")
+                return
+            if not expect_item:
+                if char != ",":
+                    raise ValueError(f"Impossible de parser {path}: ',' attendue (caractère {char!r})")
+                pos += 1
+                expect_item = True
+                after_comma = True
+                continue
+
+            while True:
+                # Un scalaire coupé en fin de bloc (`1.` | `5`) se décode sans erreur
+                # en un préfixe : on attend qu'un délimiteur le suive (ou la fin du fichier).
+                # Objets, tableaux et chaînes se ferment eux-mêmes.
+                if buffer[pos] not in '{["' and not delimiter.search(buffer, pos) and not eof and fill():
+                    continue
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError as exc:
+                    if eof or not fill():
+                        raise ValueError(f"Impossible de parser {path}: {exc}") from exc
+                    continue
+                break
+            pos = end
+            expect_item = False
+            after_comma = False
+            yield item
+
+
+def _transform_batch(batch: List[dict]) -> List[Example]:
+    return [transform_example(item) for item in batch]
+
+
+def transform_stream(
+    raw_examples: Iterable[dict],
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[Example]:
+    """
+    Applique `transform_example` dans un pool de processus, par lots de `chunk_size`.
+
+    Au plus `2 * workers` lots sont en vol : la mémoire reste bornée quelle que
+    soit la taille de l'entrée, et les résultats sont rendus dans l'ordre d'entrée.
+    """
+    workers = workers or os.cpu_count() or 1
+    iterator = iter(raw_examples)
+    batches = iter(lambda: list(islice(iterator, chunk_size)), [])
+
+    if workers == 1:
+        for batch in batches:
+            yield from _transform_batch(batch)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(_transform_batch, batch))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
 def transform_example(raw: dict) -> Example:
     messages = raw.get("messages") or []
     if len(messages) < 3:
@@ -192,20 +550,147 @@ def classify_difficulty(context: str) -> str:
     return "avance"
 
 
+class JsonlWriter:
+    def __init__(self, path: Path):
+        self._file = path.open("w", encoding="utf-8")
+
+    def write(self, record: Dict) -> None:
+        self.write_line(dump_record(record))
+
+    def write_line(self, line: str) -> None:
+        self._file.write(line + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "JsonlWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class ParquetWriter:
+    """
+    Écrit des records compacts (`Example.to_compact_record`) en Parquet, par row groups.
+
+    Toutes les colonnes texte sont encodées par dictionnaire : les prompts système,
+    `schema`, `register`, `difficulty` et `level` ne sont stockés qu'une fois par
+    row group. Le schéma reste en types Arrow simples (string, list<struct>) pour
+    que `datasets.load_dataset("parquet", ...)` le lise sans conversion.
+    """
+
+    def __init__(self, path: Path, row_group_size: int = PARQUET_ROW_GROUP_SIZE):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise RuntimeError("Le format parquet nécessite pyarrow (pip install pyarrow).") from exc
+
+        self._pa = pa
+        self._schema = pa.schema(
+            [
+                ("schema", pa.string()),
+                ("context", pa.string()),
+                ("level", pa.string()),
+                ("register", pa.string()),
+                ("difficulty", pa.string()),
+                (
+                    "messages",
+                    pa.list_(pa.struct([("role", pa.string()), ("content", pa.string())])),
+                ),
+            ]
+        )
+        self._writer = pq.ParquetWriter(
+            str(path), self._schema, compression="zstd", use_dictionary=True
+        )
+        self._row_group_size = row_group_size
+        self._rows: List[Dict] = []
+
+    def write(self, record: Dict) -> None:
+        self._rows.append(record)
+        if len(self._rows) >= self._row_group_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._rows:
+            table = self._pa.Table.from_pylist(self._rows, schema=self._schema)
+            self._writer.write_table(table)
+            self._rows = []
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+    def __enter__(self) -> "ParquetWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+RECORD_WRITERS = {"jsonl": JsonlWriter, "parquet": ParquetWriter}
+
+
+def dump_record(record: Dict) -> str:
+    return json.dumps(record, ensure_ascii=False)
+
+
 def write_jsonl(path: Path, records: Iterable[Dict]) -> None:
-    with path.open("w", encoding="utf-8") as f:
+    with JsonlWriter(path) as writer:
+        for record in records:
+            writer.write(record)
+
+
+def write_jsonl_lines(path: Path, lines: Iterable[str]) -> None:
+    with JsonlWriter(path) as writer:
+        for line in lines:
+            writer.write_line(line)
+
+
+def write_parquet(path: Path, records: Iterable[Dict]) -> None:
+    with ParquetWriter(path) as writer:
         for record in records:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            writer.write(record)
+
+
+def write_outputs_streaming(
+    examples: Iterable[Example], targets: List[Tuple[str, Path, Path]]
+) -> Counter:
+    """
+    Écrit base + augmenté, pour chaque format de `targets`, en un seul passage
+    sur `examples` (sans les matérialiser).
+
+    Retourne le compteur des schèmes pour le résumé.
+    """
+    counter: Counter = Counter()
+    with ExitStack() as stack:
+        writers = [
+            (
+                fmt,
+                stack.enter_context(RECORD_WRITERS[fmt](base_path)),
+                stack.enter_context(RECORD_WRITERS[fmt](augmented_path)),
+            )
+            for fmt, base_path, augmented_path in targets
+        ]
+        for ex in examples:
+            counter[ex.schema] += 1
+            for fmt, base, augmented in writers:
+                base.write(ex.to_output_record("lyceen", fmt))
+                for register in REGISTER_INSTRUCTIONS.keys():
+                    augmented.write(ex.to_output_record(register, fmt))
+    return counter
 
 
-def summarize(examples: List[Example], base_path: Path, augmented_path: Path) -> None:
-    counter = Counter(ex.schema for ex in examples)
-    total = len(examples)
+def summarize(counter: Counter, output_files: List[Path]) -> None:
+    total = sum(counter.values())
     print(f"✅ {total} exemples transformés.")
     for schema, count in counter.most_common():
         pct = count / total * 100 if total else 0
         print(f"   - {schema:<20} : {count:>4} ({pct:4.1f}%)")
-    print(f"\n📄 Sorties :\n   • {base_path}\n   • {augmented_path}")
+    print("\n📄 Sorties :")
+    for path in output_files:
+        print(f"   • {path}")
 
 
 if __name__ == "__main__":
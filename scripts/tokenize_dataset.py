@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Pré-tokenise les datasets JSONL (champ `messages`) une seule fois et les met en cache.
+
+Fonctionnalités :
+1. Application du chat template + tokenisation de chaque conversation
+2. Masque "assistant uniquement" pour les labels (les tours system/user ne comptent pas dans la loss)
+3. Stockage en shards NumPy (.npy) ouverts en memory-map au chargement
+4. Clé de cache = empreinte du tokenizer + chat template + hash du contenu du fichier :
+   une entrée par fichier source, invalidée seulement si l'un des trois change.
+   Le SHA-256 du fichier n'est recalculé que si sa signature (taille + mtime) a changé
+   depuis le dernier appel (index `sources.json`), et l'empreinte du tokenizer est
+   mémorisée par objet tokenizer : un hit se limite à un `stat` et aux memory-maps.
+   Les entrées périmées d'un même fichier (autre contenu ou ancienne version) sont
+   supprimées dès qu'une nouvelle entrée est écrite
+5. Invalidation fine : quand un fichier change, les conversations dont les `messages`
+   sont identiques sont recopiées depuis l'entrée précédente du même fichier au lieu
+   d'être retokenisées
+
+Usage :
+    python scripts/tokenize_dataset.py \
+        --tokenizer mistralai/Mistral-7B-Instruct-v0.3 \
+        --inputs data/FT/processed/schemes_levelA_augmented.jsonl \
+        --cache-dir data/FT/cache/tokenized
+
+Dans le notebook :
+    from tokenize_dataset import build_or_load
+    datasets = build_or_load(paths, tokenizer, cache_dir)
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import shutil
+import weakref
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from dataset_manifest import content_hash, file_hash, file_signature
+
+DEFAULT_CACHE_DIR = Path("data/FT/cache/tokenized")
+DEFAULT_TOKENIZER = "mistralai/Mistral-7B-Instruct-v0.3"
+DEFAULT_SHARD_SIZE = 100_000  # conversations par shard
+CACHE_VERSION = 3  # à incrémenter si le format des shards, du meta ou le masquage change
+SOURCE_INDEX_NAME = "sources.json"
+
+ARRAY_NAMES = ("input_ids", "attention_mask", "assistant_mask")
+# Champs qui doivent coïncider pour qu'une entrée soit une version antérieure du même fichier
+SAME_SOURCE_FIELDS = ("source", "tokenizer", "chat_template", "max_seq_length")
+
+_FINGERPRINTS: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+@dataclass
+class TokenizedConversation:
+    input_ids: List[int]
+    assistant_mask: List[int]
+    record_hash: str = ""
+
+
+class TokenizedDataset:
+    """
+    Vue en lecture seule sur une entrée du cache.
+
+    Les tableaux sont concaténés à plat dans chaque shard ; `offsets` (n + 1 entiers)
+    délimite chaque conversation. Rien n'est copié en mémoire : `__getitem__` renvoie
+    des vues sur les memory-maps.
+    """
+
+    def __init__(self, entry_dir: Path):
+        self.entry_dir = entry_dir
+        self.meta = json.loads((entry_dir / "meta.json").read_text(encoding="utf-8"))
+        self._shards: List[Dict[str, np.ndarray]] = []
+        self._starts: List[int] = []
+        total = 0
+        for shard_name in self.meta["shards"]:
+            shard_dir = entry_dir / shard_name
+            shard = {
+                name: np.load(shard_dir / f"{name}.npy", mmap_mode="r")
+                for name in (*ARRAY_NAMES, "offsets")
+            }
+            self._shards.append(shard)
+            self._starts.append(total)
+            total += len(shard["offsets"]) - 1
+        self._length = total
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int) -> Dict[str, np.ndarray]:
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        shard_idx = int(np.searchsorted(self._starts, index, side="right")) - 1
+        shard = self._shards[shard_idx]
+        local = index - self._starts[shard_idx]
+        start, end = int(shard["offsets"][local]), int(shard["offsets"][local + 1])
+        input_ids = shard["input_ids"][start:end]
+        assistant_mask = shard["assistant_mask"][start:end]
+        return {
+            "input_ids": input_ids,
+            "attention_mask": shard["attention_mask"][start:end],
+            "assistant_mask": assistant_mask,
+            "labels": np.where(assistant_mask.astype(bool), input_ids, -100),
+        }
+
+    def record_hashes(self) -> List[str]:
+        path = self.entry_dir / "record_hashes.txt"
+        if not path.exists():
+            return []
+        return path.read_text(encoding="utf-8").split()
+
+    def lengths(self) -> np.ndarray:
+        if not self._shards:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([np.diff(shard["offsets"]) for shard in self._shards])
+
+
+def main() -> None:
+    args = parse_args()
+
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer, trust_remote_code=True)
+    datasets = build_or_load(
+        args.inputs,
+        tokenizer,
+        args.cache_dir,
+        max_seq_length=args.max_seq_length,
+        shard_size=args.shard_size,
+        verbose=True,
+    )
+
+    total = sum(len(ds) for ds in datasets)
+    tokens = sum(int(ds.lengths().sum()) for ds in datasets)
+    print(f"\n✅ {total} conversations tokenisées ({tokens} tokens).")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Pré-tokenise les datasets JSONL avec cache persistant.")
+    parser.add_argument("--inputs", type=Path, nargs="+", required=True, help="Fichiers JSONL (champ messages).")
+    parser.add_argument("--tokenizer", default=DEFAULT_TOKENIZER, help="Nom HF ou chemin local du tokenizer.")
+    parser.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR, help="Racine du cache.")
+    parser.add_argument(
+        "--max-seq-length",
+        type=int,
+        default=None,
+        help="Tronque les conversations à cette longueur (défaut : pas de troncature).",
+    )
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE, help="Conversations par shard.")
+    return parser.parse_args()
+
+
+def build_or_load(
+    paths: Sequence[Path],
+    tokenizer,
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+    max_seq_length: Optional[int] = None,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    verbose: bool = False,
+) -> List[TokenizedDataset]:
+    """
+    Retourne un `TokenizedDataset` par fichier, en ne tokenisant que les entrées absentes du cache.
+    """
+    fingerprint = tokenizer_fingerprint(tokenizer)
+    template_hash = content_hash(tokenizer.chat_template or "")
+    source_index = SourceIndex(cache_dir / SOURCE_INDEX_NAME)
+    datasets = []
+    for path in paths:
+        source_hash = source_index.content_hash(path)
+        key = cache_key(fingerprint, tokenizer.chat_template, source_hash, max_seq_length)
+        entry_dir = cache_dir / key
+        if (entry_dir / "meta.json").exists():
+            if verbose:
+                print(f"⚡ Cache : {path} -> {entry_dir}")
+        else:
+            meta = {
+                "source": str(path),
+                "content": source_hash,
+                "key": key,
+                "tokenizer": fingerprint,
+                "chat_template": template_hash,
+                "max_seq_length": max_seq_length,
+                "version": CACHE_VERSION,
+            }
+            previous = find_previous_entry(cache_dir, meta)
+            stats = {"reused": 0, "tokenized": 0}
+            write_entry(
+                entry_dir,
+                iter_conversations(tokenizer, path, max_seq_length, previous, stats),
+                meta=meta,
+                shard_size=shard_size,
+            )
+            previous = None  # relâche les memory-maps de l'entrée avant de la supprimer
+            pruned = prune_stale_entries(cache_dir, meta)
+            if verbose:
+                print(
+                    f"🔄 Tokenisation : {path} "
+                    f"({stats['tokenized']} tokenisées, {stats['reused']} reprises de l'entrée précédente)"
+                )
+                if pruned:
+                    print(f"🧹 {pruned} entrée(s) périmée(s) supprimée(s) pour {path}")
+        datasets.append(TokenizedDataset(entry_dir))
+    source_index.save()
+    return datasets
+
+
+class SourceIndex:
+    """
+    Index `chemin -> (taille + mtime, SHA-256)` des fichiers sources déjà hashés.
+
+    Tant que la signature d'un fichier est inchangée, son hash est repris de l'index
+    au lieu de relire tout le fichier.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        self.dirty = False
+        if path.exists():
+            try:
+                self.entries = json.loads(path.read_text(encoding="utf-8"))
+            except json.JSONDecodeError:
+                self.entries = {}
+
+    def content_hash(self, source: Path) -> str:
+        signature = file_signature(source)
+        known = self.entries.get(str(source))
+        if known is not None and known.get("signature") == signature:
+            return known["content"]
+        digest = file_hash(source)
+        self.entries[str(source)] = {"signature": signature, "content": digest}
+        self.dirty = True
+        return digest
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(json.dumps(self.entries, indent=2, ensure_ascii=False), encoding="utf-8")
+        tmp_path.replace(self.path)
+        self.dirty = False
+
+
+def iter_entry_metas(cache_dir: Path) -> Iterator[Tuple[Path, Dict]]:
+    if not cache_dir.exists():
+        return
+    for meta_path in cache_dir.glob("*/meta.json"):
+        try:
+            yield meta_path, json.loads(meta_path.read_text(encoding="utf-8"))
+        except json.JSONDecodeError:
+            continue
+
+
+def find_previous_entry(cache_dir: Path, meta: Dict) -> Optional[TokenizedDataset]:
+    """
+    Dernière entrée du même fichier source construite avec le même tokenizer,
+    template et troncature : ses conversations inchangées sont réutilisables.
+    """
+    same = (*SAME_SOURCE_FIELDS, "version")
+    candidates = [
+        (meta_path.stat().st_mtime_ns, meta_path.parent)
+        for meta_path, other in iter_entry_metas(cache_dir)
+        if all(other.get(field) == meta[field] for field in same)
+    ]
+    if not candidates:
+        return None
+    return TokenizedDataset(max(candidates)[1])
+
+
+def prune_stale_entries(cache_dir: Path, meta: Dict) -> int:
+    """
+    Supprime les entrées du même fichier source (même tokenizer, template et
+    troncature) dont le contenu ou la version de cache ne sont plus courants.
+    Les entrées construites avec une autre configuration sont conservées.
+    """
+    pruned = 0
+    for meta_path, other in list(iter_entry_metas(cache_dir)):
+        if meta_path.parent.name == meta["key"]:
+            continue
+        if not all(other.get(field) == meta[field] for field in SAME_SOURCE_FIELDS):
+            continue
+        if other.get("version") == CACHE_VERSION and other.get("content") == meta["content"]:
+            continue
+        shutil.rmtree(meta_path.parent, ignore_errors=True)
+        pruned += 1
+    return pruned
+
+
+def iter_conversations(
+    tokenizer,
+    path: Path,
+    max_seq_length: Optional[int],
+    previous: Optional[TokenizedDataset],
+    stats: Dict[str, int],
+) -> Iterator[TokenizedConversation]:
+    reusable = {h: i for i, h in enumerate(previous.record_hashes())} if previous is not None else {}
+    for record in iter_records(path):
+        record_hash = content_hash(record["messages"])
+        index = reusable.get(record_hash)
+        if index is not None:
+            item = previous[index]
+            stats["reused"] += 1
+            yield TokenizedConversation(
+                input_ids=item["input_ids"].tolist(),
+                assistant_mask=item["assistant_mask"].tolist(),
+                record_hash=record_hash,
+            )
+            continue
+        conversation = tokenize_conversation(tokenizer, record["messages"], max_seq_length)
+        conversation.record_hash = record_hash
+        stats["tokenized"] += 1
+        yield conversation
+
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    """
+    Identité du tokenizer : vocabulaire + règles de découpage, pas seulement son nom.
+
+    Pour un tokenizer "fast", la sérialisation complète du backend est hashée ; à
+    défaut on se rabat sur le nom et la taille du vocabulaire. Le résultat est mémorisé
+    par objet tokenizer, et recalculé si son vocabulaire ou ses tokens spéciaux changent.
+    """
+    state = (len(tokenizer), tuple(tokenizer.all_special_tokens))
+    try:
+        cached = _FINGERPRINTS.get(tokenizer)
+    except TypeError:
+        cached = None
+    if cached is not None and cached[0] == state:
+        return cached[1]
+    fingerprint = compute_tokenizer_fingerprint(tokenizer)
+    try:
+        _FINGERPRINTS[tokenizer] = (state, fingerprint)
+    except TypeError:
+        pass
+    return fingerprint
+
+
+def compute_tokenizer_fingerprint(tokenizer) -> str:
+    digest = hashlib.sha256()
+    digest.update(type(tokenizer).__name__.encode("utf-8"))
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        digest.update(backend.to_str().encode("utf-8"))
+    else:
+        digest.update(f"{tokenizer.name_or_path}:{len(tokenizer)}".encode("utf-8"))
+    digest.update(json.dumps(tokenizer.all_special_tokens).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def cache_key(fingerprint: str, chat_template: Optional[str], content_hash: str, max_seq_length: Optional[int]) -> str:
+    payload = json.dumps(
+        {
+            "version": CACHE_VERSION,
+            "tokenizer": fingerprint,
+            "chat_template": chat_template or "",
+            "content": content_hash,
+            "max_seq_length": max_seq_length,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+
+def iter_records(path: Path) -> Iterator[Dict]:
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def tokenize_conversation(tokenizer, messages: List[Dict], max_seq_length: Optional[int] = None) -> TokenizedConversation:
+    """
+    Tokenise une conversation et marque les tokens produits par l'assistant.
+
+    Le masque est calculé sur le texte rendu par le chat template : on y repère le
+    contenu de chaque message assistant, puis on garde les tokens dont l'offset tombe
+    dans ces zones (+ l'EOS qui clôt le tour, pour apprendre à s'arrêter). Cela reste
+    valable pour les templates qui déplacent le prompt système (Mistral v0.3 le colle
+    au dernier message user), contrairement à une tokenisation préfixe par préfixe.
+    """
+    text = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=False)
+    spans = assistant_char_spans(text, messages)
+
+    encoding = tokenizer(
+        text,
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+        truncation=max_seq_length is not None,
+        max_length=max_seq_length,
+    )
+    input_ids = list(encoding["input_ids"])
+    mask = [0] * len(input_ids)
+    span_idx = 0
+    for i, (start, end) in enumerate(encoding["offset_mapping"]):
+        while span_idx < len(spans) and spans[span_idx][1] <= start:
+            span_idx += 1
+        if span_idx < len(spans) and start < spans[span_idx][1] and end > spans[span_idx][0]:
+            mask[i] = 1
+        elif i > 0 and mask[i - 1] and input_ids[i] == tokenizer.eos_token_id:
+            mask[i] = 1
+    return TokenizedConversation(input_ids=input_ids, assistant_mask=mask)
+
+
+def assistant_char_spans(text: str, messages: List[Dict]) -> List[Tuple[int, int]]:
+    """
+    Zones (début, fin) du contenu de chaque message assistant dans le texte rendu.
+
+    Chaque réponse est cherchée après la réponse précédente et après les messages
+    user qui la précèdent. Les messages system sont ignorés : le template peut les
+    déplacer (Mistral v0.3 les colle au dernier [INST]), et un curseur commun
+    sauterait alors toutes les réponses d'avant.
+    """
+    spans = []
+    cursor = 0
+    for message in messages:
+        content = (message.get("content") or "").strip()
+        if not content or message.get("role") == "system":
+            continue
+        start = text.find(content, cursor)
+        if start < 0:
+            continue
+        if message.get("role") == "assistant":
+            spans.append((start, start + len(content)))
+        cursor = start + len(content)
+    return spans
+
+
+def write_entry(entry_dir: Path, conversations, meta: Dict, shard_size: int = DEFAULT_SHARD_SIZE) -> None:
+    """
+    Écrit une entrée de cache dans un répertoire temporaire puis la renomme :
+    une entrée visible est toujours complète, même si le process est interrompu.
+    """
+    tmp_dir = entry_dir.with_name(entry_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    shards: List[str] = []
+    record_hashes: List[str] = []
+    count = 0
+    input_ids, assistant_mask, offsets = array("i"), array("B"), array("q", [0])
+
+    def flush() -> None:
+        nonlocal input_ids, assistant_mask, offsets
+        if len(offsets) == 1:
+            return
+        shard_name = f"shard_{len(shards):05d}"
+        shard_dir = tmp_dir / shard_name
+        shard_dir.mkdir()
+        ids = np.frombuffer(input_ids, dtype=np.int32)
+        np.save(shard_dir / "input_ids.npy", ids)
+        np.save(shard_dir / "attention_mask.npy", np.ones(len(ids), dtype=np.uint8))
+        np.save(shard_dir / "assistant_mask.npy", np.frombuffer(assistant_mask, dtype=np.uint8))
+        np.save(shard_dir / "offsets.npy", np.frombuffer(offsets, dtype=np.int64))
+        shards.append(shard_name)
+        input_ids, assistant_mask, offsets = array("i"), array("B"), array("q", [0])
+
+    for conversation in conversations:
+        input_ids.extend(conversation.input_ids)
+        assistant_mask.extend(conversation.assistant_mask)
+        offsets.append(len(input_ids))
+        record_hashes.append(conversation.record_hash)
+        count += 1
+        if len(offsets) - 1 >= shard_size:
+            flush()
+    flush()
+
+    (tmp_dir / "record_hashes.txt").write_text("\n".join(record_hashes), encoding="utf-8")
+    meta = {**meta, "num_examples": count, "shards": shards, "version": CACHE_VERSION}
+    (tmp_dir / "meta.json").write_text(json.dumps(meta, indent=2, ensure_ascii=False), encoding="utf-8")
+    if entry_dir.exists():
+        shutil.rmtree(entry_dir)
+    tmp_dir.rename(entry_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Valide les JSONL d'entraînement avant le fine-tuning (porte à passer après chaque rebuild).
+
+Fonctionnalités :
+1. Ordre des rôles : `system` optionnel puis alternance `user` / `assistant`, fin sur `assistant`
+2. Contenus vides (ou non textuels) dans `messages`
+3. Mojibake restant ("Ã©", "Â ", "â€™", "�") dans les messages et les champs texte
+4. Budget de tokens : conversation rendue par le chat template > `max_seq_length`
+   (elle serait tronquée à l'entraînement)
+5. Streaming dans un pool de processus (un tokenizer par worker, au plus `2 * workers`
+   lots en vol) : mémoire bornée quel que soit le nombre de fichiers
+6. Rapport par fichier (JSON) + fichier des enregistrements rejetés (fichier, ligne,
+   erreurs, enregistrement brut) ; code de sortie 1 si au moins un rejet
+
+Usage (depuis bergsonAndFriends/) :
+    python ../scripts/validate_datasets.py
+    python ../scripts/validate_datasets.py --inputs data/FT/correction_dataset.jsonl --workers 4
+    python ../scripts/validate_datasets.py --no-tokens --no-fail
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from tokenize_dataset import DEFAULT_TOKENIZER
+
+DEFAULT_INPUT_DIR = Path("data/FT/processed")
+DEFAULT_REPORT = Path("data/FT/validation/report.json")
+DEFAULT_REJECTED = Path("data/FT/validation/rejected.jsonl")
+DEFAULT_MAX_SEQ_LENGTH = 512  # configs/mistral_7b_lora.yaml -> data.max_seq_length
+DEFAULT_CHUNK_SIZE = 256  # lignes envoyées à chaque worker
+
+# Séquences typiques d'UTF-8 relu en latin-1 / cp1252 (ce que normalize_text corrige)
+MOJIBAKE_RE = re.compile("[ÃÂ][\u0080-¿€‚ƒ„…†‡ˆ‰Š‹ŒŽ‘’“”•–—˜™š›œžŸ]|â€|�")
+
+# "exception" : erreur inattendue sur l'enregistrement (message dans le rejet), le lot continue
+ERRORS = ("json", "no_messages", "role_order", "empty_content", "mojibake", "template", "over_length", "exception")
+
+_TOKENIZER = None
+
+
+def _init_worker(tokenizer_name: Optional[str]) -> None:
+    global _TOKENIZER
+    if tokenizer_name is not None:
+        from transformers import AutoTokenizer
+
+        _TOKENIZER = AutoTokenizer.from_pretrained(tokenizer_name, trust_remote_code=True)
+
+
+def text_fields(record: Dict) -> Iterator[str]:
+    for value in record.values():
+        if isinstance(value, str):
+            yield value
+    for message in record.get("messages") or []:
+        if isinstance(message, dict) and isinstance(message.get("content"), str):
+            yield message["content"]
+
+
+def roles_in_order(messages: List) -> bool:
+    """`system` optionnel puis paires user/assistant ; tout rôle absent ou non textuel est invalide"""
+    roles = [m.get("role") if isinstance(m, dict) else None for m in messages]
+    if roles and roles[0] == "system":
+        roles = roles[1:]
+    return bool(roles) and len(roles) % 2 == 0 and all(
+        role == ("user" if i % 2 == 0 else "assistant") for i, role in enumerate(roles)
+    )
+
+
+def check_record(record) -> List[str]:
+    """Erreurs structurelles d'un enregistrement (sans tokenisation)"""
+    if not isinstance(record, dict):
+        return ["no_messages"]
+    messages = record.get("messages")
+    if not isinstance(messages, list) or not messages:
+        return ["no_messages"]
+
+    errors = []
+    if not roles_in_order(messages):
+        errors.append("role_order")
+    if any(not isinstance(m, dict) or not isinstance(m.get("content"), str) or not m["content"].strip() for m in messages):
+        errors.append("empty_content")
+    if any(MOJIBAKE_RE.search(text) for text in text_fields(record)):
+        errors.append("mojibake")
+    return errors
+
+
+def _validate_line(line: str) -> Tuple[List[str], Optional[str]]:
+    """(erreurs, conversation rendue par le chat template si elle est à tokeniser)"""
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError:
+        return ["json"], None
+    errors = check_record(record)
+    if _TOKENIZER is None or {"no_messages", "role_order", "empty_content"} & set(errors):
+        return errors, None
+    try:
+        return errors, _TOKENIZER.apply_chat_template(record["messages"], tokenize=False, add_generation_prompt=False)
+    except Exception:  # templates Jinja : erreurs levées via raise_exception
+        return errors + ["template"], None
+
+
+def _validate_chunk(lines: List[str], max_seq_length: int) -> List[Tuple[List[str], Optional[int]]]:
+    """
+    (erreurs, longueur en tokens ou None) pour chaque ligne du lot, dans l'ordre
+
+    Une exception sur une ligne la rejette (erreur "exception") sans perdre le reste du lot.
+    """
+    results: List[Tuple[List[str], Optional[int]]] = []
+    rendered: Dict[int, str] = {}
+    for i, line in enumerate(lines):
+        try:
+            errors, text = _validate_line(line)
+        except Exception as exc:
+            errors, text = [f"exception: {type(exc).__name__}: {exc}"], None
+        results.append((errors, None))
+        if text is not None:
+            rendered[i] = text
+
+    if rendered:
+        # Une seule tokenisation batchée par lot, comme tokenize_dataset.py (spéciaux déjà dans le rendu) ;
+        # si elle échoue, on retokenise ligne par ligne pour isoler la fautive
+        try:
+            encoded = _TOKENIZER(list(rendered.values()), add_special_tokens=False)["input_ids"]
+        except Exception:
+            encoded = []
+            for text in rendered.values():
+                try:
+                    encoded.append(_TOKENIZER(text, add_special_tokens=False)["input_ids"])
+                except Exception as exc:
+                    encoded.append(exc)
+        for i, ids in zip(rendered, encoded):
+            errors = results[i][0]
+            if isinstance(ids, Exception):
+                errors.append(f"exception: {type(ids).__name__}: {ids}")
+                continue
+            if len(ids) > max_seq_length:
+                errors.append("over_length")
+            results[i] = (errors, len(ids))
+    return results
+
+
+def iter_chunks(paths: List[Path], chunk_size: int) -> Iterator[Tuple[int, List[int], List[str]]]:
+    """(index du fichier, numéros de ligne, lignes) ; les lignes vides sont ignorées"""
+    for file_index, path in enumerate(paths):
+        with path.open("r", encoding="utf-8") as f:
+            numbered = ((n, line.rstrip("\n")) for n, line in enumerate(f, 1) if line.strip())
+            while True:
+                chunk = list(islice(numbered, chunk_size))
+                if not chunk:
+                    break
+                yield file_index, [n for n, _ in chunk], [line for _, line in chunk]
+
+
+def validate_stream(
+    paths: List[Path],
+    tokenizer_name: Optional[str],
+    max_seq_length: int = DEFAULT_MAX_SEQ_LENGTH,
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[Tuple[int, int, str, List[str], Optional[int]]]:
+    """
+    (index du fichier, ligne, texte brut, erreurs, longueur en tokens) de chaque
+    enregistrement, dans l'ordre des fichiers. Au plus `2 * workers` lots en vol.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = iter_chunks(paths, chunk_size)
+
+    def unpack(chunk, results):
+        file_index, numbers, lines = chunk
+        for number, line, (errors, length) in zip(numbers, lines, results):
+            yield file_index, number, line, errors, length
+
+    if workers == 1:
+        _init_worker(tokenizer_name)
+        for chunk in chunks:
+            yield from unpack(chunk, _validate_chunk(chunk[2], max_seq_length))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(tokenizer_name,)) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append((chunk, executor.submit(_validate_chunk, chunk[2], max_seq_length)))
+            if len(pending) >= 2 * workers:
+                chunk, future = pending.popleft()
+                yield from unpack(chunk, future.result())
+        while pending:
+            chunk, future = pending.popleft()
+            yield from unpack(chunk, future.result())
+
+
+def new_report(path: Path, max_seq_length: int) -> Dict:
+    return {
+        "file": str(path),
+        "records": 0,
+        "valid": 0,
+        "rejected": 0,
+        "errors": Counter(),
+        "max_seq_length": max_seq_length,
+        "max_tokens": None,
+        "total_tokens": 0,
+    }
+
+
+def print_report(report: Dict) -> None:
+    status = "✅" if not report["rejected"] else "❌"
+    print(f"\n{status} {report['file']} : {report['valid']}/{report['records']} valides, {report['rejected']} rejetés")
+    for error in ERRORS:
+        if report["errors"].get(error):
+            print(f"   - {error}: {report['errors'][error]}")
+    if report["max_tokens"] is not None:
+        print(f"   tokens : max {report['max_tokens']} (budget {report['max_seq_length']})")
+
+
+def main() -> None:
+    args = parse_args()
+    paths = args.inputs or sorted(DEFAULT_INPUT_DIR.glob("*.jsonl"))
+    missing = [path for path in paths if not path.exists()]
+    if missing:
+        raise SystemExit(f"❌ Fichiers introuvables : {', '.join(map(str, missing))}")
+    if not paths:
+        raise SystemExit(f"❌ Aucun JSONL dans {DEFAULT_INPUT_DIR}")
+
+    tokenizer_name = None if args.no_tokens else args.tokenizer
+    reports = [new_report(path, args.max_seq_length) for path in paths]
+
+    args.rejected.parent.mkdir(parents=True, exist_ok=True)
+    tmp_rejected = args.rejected.with_name(args.rejected.name + ".tmp")
+    start = time.perf_counter()
+    with tmp_rejected.open("w", encoding="utf-8") as rejected_file:
+        for file_index, line_number, line, errors, length in validate_stream(
+            paths, tokenizer_name, args.max_seq_length, args.workers, args.chunk_size
+        ):
+            report = reports[file_index]
+            report["records"] += 1
+            if length is not None:
+                report["total_tokens"] += length
+                report["max_tokens"] = max(report["max_tokens"] or 0, length)
+            if not errors:
+                report["valid"] += 1
+                continue
+            report["rejected"] += 1
+            report["errors"].update(error.split(":")[0] for error in errors)
+            rejected_file.write(
+                json.dumps({"file": report["file"], "line": line_number, "errors": errors, "raw": line}, ensure_ascii=False)
+                + "\n"
+            )
+    tmp_rejected.replace(args.rejected)
+    elapsed = time.perf_counter() - start
+
+    for report in reports:
+        report["errors"] = dict(report["errors"])
+        print_report(report)
+
+    total = sum(report["records"] for report in reports)
+    rejected = sum(report["rejected"] for report in reports)
+    print(f"\n⏱️ {total} enregistrements en {elapsed:.2f}s ({total / elapsed if elapsed else 0:,.0f}/s)")
+
+    args.report.parent.mkdir(parents=True, exist_ok=True)
+    args.report.write_text(
+        json.dumps({"files": reports, "records": total, "rejected": rejected}, ensure_ascii=False, indent=2),
+        encoding="utf-8",
+    )
+    print(f"📄 Rapport : {args.report}")
+    if rejected:
+        print(f"🗑️ Rejetés : {args.rejected}")
+        if not args.no_fail:
+            raise SystemExit(1)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Valide les JSONL d'entraînement (structure, mojibake, longueur).")
+    parser.add_argument(
+        "--inputs", type=Path, nargs="+", default=None, help=f"Fichiers JSONL (défaut : {DEFAULT_INPUT_DIR}/*.jsonl)."
+    )
+    parser.add_argument("--tokenizer", default=DEFAULT_TOKENIZER, help="Nom HF ou chemin local du tokenizer.")
+    parser.add_argument("--no-tokens", action="store_true", help="Ne vérifie pas la longueur en tokens.")
+    parser.add_argument(
+        "--max-seq-length", type=int, default=DEFAULT_MAX_SEQ_LENGTH, help="Budget de tokens par conversation."
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Processus (défaut : nombre de cœurs, 1 = sans pool).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Lignes par tâche envoyée à un worker.")
+    parser.add_argument("--report", type=Path, default=DEFAULT_REPORT, help="Rapport JSON par fichier.")
+    parser.add_argument("--rejected", type=Path, default=DEFAULT_REJECTED, help="JSONL des enregistrements rejetés.")
+    parser.add_argument("--no-fail", action="store_true", help="Code de sortie 0 même en cas de rejet.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Les scripts s'importent entre eux par leur nom (`from jsonl_index import ...`)
+sys.path.insert(0, str(ROOT / "bergsonAndFriends" / "scripts"))
+sys.path.insert(0, str(ROOT / "scripts"))
@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+import tokenize_dataset
+from tokenize_dataset import assistant_char_spans, build_or_load, tokenize_conversation
+
+# Comme Mistral v0.3 : le prompt système est collé au dernier [INST], pas au premier
+MOVING_SYSTEM_TEMPLATE = (
+    "{%- if messages[0].role == 'system' %}{%- set system = messages[0].content %}{%- set loop_messages = messages[1:] %}"
+    "{%- else %}{%- set system = none %}{%- set loop_messages = messages %}{%- endif %}"
+    "{%- set ns = namespace(last_user=-1) %}"
+    "{%- for message in loop_messages %}{%- if message.role == 'user' %}{%- set ns.last_user = loop.index0 %}{%- endif %}{%- endfor %}"
+    "{{ bos_token }}"
+    "{%- for message in loop_messages %}"
+    "{%- if message.role == 'user' %}"
+    "[INST] {% if system and loop.index0 == ns.last_user %}{{ system }}\n\n{% endif %}{{ message.content }}[/INST]"
+    "{%- else %} {{ message.content }}{{ eos_token }}{%- endif %}"
+    "{%- endfor %}"
+)
+
+MESSAGES = [
+    {"role": "system", "content": "SYS"},
+    {"role": "user", "content": "U1"},
+    {"role": "assistant", "content": "A1"},
+    {"role": "user", "content": "U2"},
+    {"role": "assistant", "content": "A2"},
+]
+
+
+def word_tokenizer():
+    """Tokenizer "fast" mot à mot construit en mémoire (offsets compris, sans téléchargement)"""
+    tokenizers = pytest.importorskip("tokenizers")
+    transformers = pytest.importorskip("transformers")
+
+    words = ["[UNK]", "<s>", "</s>", "[", "]", "INST", "/", "SYS", "U1", "U2", "A1", "A2"]
+    backend = tokenizers.Tokenizer(tokenizers.models.WordLevel({w: i for i, w in enumerate(words)}, unk_token="[UNK]"))
+    backend.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    tokenizer = transformers.PreTrainedTokenizerFast(
+        tokenizer_object=backend, bos_token="<s>", eos_token="</s>", unk_token="[UNK]"
+    )
+    tokenizer.chat_template = MOVING_SYSTEM_TEMPLATE
+    return tokenizer
+
+
+def test_spans_with_system_prompt_moved_to_last_turn():
+    text = "<s>[INST] U1[/INST] A1</s>[INST] SYS\n\nU2[/INST] A2</s>"
+    assert [text[start:end] for start, end in assistant_char_spans(text, MESSAGES)] == ["A1", "A2"]
+
+
+def test_spans_skip_assistant_text_quoted_by_user():
+    messages = [
+        {"role": "user", "content": "Tu as dit : A1 ?"},
+        {"role": "assistant", "content": "A1"},
+    ]
+    text = "[INST] Tu as dit : A1 ?[/INST] A1</s>"
+    assert assistant_char_spans(text, messages) == [(text.rindex("A1"), len(text) - len("</s>"))]
+
+
+def test_every_assistant_turn_is_labelled():
+    tokenizer = word_tokenizer()
+    conversation = tokenize_conversation(tokenizer, MESSAGES)
+    tokens = tokenizer.convert_ids_to_tokens(conversation.input_ids)
+    labelled = [token for token, keep in zip(tokens, conversation.assistant_mask) if keep]
+    assert labelled == ["A1", "</s>", "A2", "</s>"]
+
+
+def write_jsonl(path, conversations):
+    path.write_text("\n".join(json.dumps({"messages": messages}) for messages in conversations), encoding="utf-8")
+
+
+def test_cache_hit_skips_hash_and_stale_entries_are_pruned(tmp_path, monkeypatch):
+    tokenizer = word_tokenizer()
+    source, cache_dir = tmp_path / "data.jsonl", tmp_path / "cache"
+    other = [{"role": "user", "content": "U2"}, {"role": "assistant", "content": "A2"}]
+    write_jsonl(source, [MESSAGES, other])
+    (first,) = build_or_load([source], tokenizer, cache_dir)
+
+    def no_full_hash(path):
+        raise AssertionError("hash complet recalculé sur un hit")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(tokenize_dataset, "file_hash", no_full_hash)
+        (hit,) = build_or_load([source], tokenizer, cache_dir)
+    assert hit.entry_dir == first.entry_dir
+
+    write_jsonl(source, [MESSAGES, other, other[:1] + [{"role": "assistant", "content": "A1"}]])
+    (rebuilt,) = build_or_load([source], tokenizer, cache_dir)
+    assert len(rebuilt) == 3
+    assert [p.parent for p in cache_dir.glob("*/meta.json")] == [rebuilt.entry_dir]
@@ -0,0 +1,91 @@
+import pytest
+
+train_lora = pytest.importorskip("train_lora")
+
+
+def fake_probe(limit, error=MemoryError):
+    """Sondage factice : tout batch > `limit` échoue comme un OOM ; garde les batchs essayés"""
+    tried = []
+
+    def try_batch(batch_size):
+        tried.append(batch_size)
+        if batch_size > limit:
+            raise error("CUDA out of memory")
+
+    return try_batch, tried
+
+
+@pytest.mark.parametrize("limit", [1, 2, 5, 12, 31, 32, 33, 63])
+def test_probe_batch_size_finds_largest_fitting_batch(limit):
+    try_batch, tried = fake_probe(limit)
+    assert train_lora.probe_batch_size(try_batch, max_batch_size=64) == limit
+    # Doublement puis dichotomie : un nombre d'essais logarithmique, jamais deux fois le même
+    assert len(tried) == len(set(tried)) <= 2 * (64).bit_length()
+
+
+def test_probe_batch_size_runtime_oom():
+    try_batch, _ = fake_probe(6, error=RuntimeError)
+    assert train_lora.probe_batch_size(try_batch, max_batch_size=64) == 6
+
+
+def test_probe_batch_size_nothing_fits():
+    try_batch, tried = fake_probe(0)
+    assert train_lora.probe_batch_size(try_batch, max_batch_size=64) == 0
+    assert tried == [1]
+
+
+@pytest.mark.parametrize("max_batch_size, limit", [(64, 100), (48, 100), (48, 40)])
+def test_probe_batch_size_respects_upper_bound(max_batch_size, limit):
+    try_batch, tried = fake_probe(limit)
+    assert train_lora.probe_batch_size(try_batch, max_batch_size=max_batch_size) == min(limit, max_batch_size)
+    assert max(tried) <= max_batch_size
+
+
+def test_probe_batch_size_propagates_other_errors():
+    def try_batch(batch_size):
+        raise RuntimeError("shape mismatch")
+
+    with pytest.raises(RuntimeError, match="shape mismatch"):
+        train_lora.probe_batch_size(try_batch)
+
+
+@pytest.mark.parametrize(
+    "effective, max_fit, expected",
+    [(16, 64, (16, 1)), (16, 5, (4, 4)), (12, 5, (4, 3)), (7, 4, (1, 7))],
+)
+def test_derive_batch_settings(effective, max_fit, expected):
+    assert train_lora.derive_batch_settings(effective, max_fit) == expected
+
+
+def tiny_causal_lm():
+    """Petit LM causal initialisé aléatoirement (CPU, sans téléchargement)"""
+    transformers = pytest.importorskip("transformers")
+    config = transformers.LlamaConfig(
+        vocab_size=64,
+        hidden_size=16,
+        intermediate_size=32,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        num_key_value_heads=2,
+        max_position_embeddings=64,
+    )
+    return transformers.LlamaForCausalLM(config).train()
+
+
+def test_make_probe_step_runs_and_frees_gradients():
+    model = tiny_causal_lm()
+    step = train_lora.make_probe_step(model, seq_length=16)
+    step(3)
+    assert all(p.grad is None for p in model.parameters())
+
+
+def test_make_probe_step_oom_is_reported_not_raised():
+    model = tiny_causal_lm()
+
+    def fail_large_batches(module, args, kwargs):
+        if kwargs["input_ids"].shape[0] > 5:
+            raise RuntimeError("DefaultCPUAllocator: can't allocate memory")
+
+    model.register_forward_pre_hook(fail_large_batches, with_kwargs=True)
+    assert train_lora.probe_batch_size(train_lora.make_probe_step(model, seq_length=16), max_batch_size=16) == 5
+    assert all(p.grad is None for p in model.parameters())